@@ -0,0 +1,9 @@
+"""
+Benchmarks for tasl
+
+Run a benchmark as a module from the repository root, e.g.
+
+    python -m benchmarks.sections    section lookup in process_html_content
+    python -m benchmarks.suite       scanl, search, tags and slides-from at 10/1k/10k scale, as JSON
+    python -m benchmarks.corpus      write a synthetic course to experiment with
+"""
@@ -0,0 +1,179 @@
+"""
+Synthetic course generator
+
+Builds a course tree shaped like the ones tasl works on:
+
+    <root>/.git/                    so tasl can find the repository root
+    <root>/lectures/lect-NN.qmd     lectures of '# Topic' blocks, for scanl
+    <root>/lectures/assets/         images the lectures refer to
+    <root>/topics/                  tagged topic wrappers and _topic files, for list/search/tags
+    <root>/guide/chNN.qmd           guide chapters, for slides-from
+    <root>/docs/guide/chNN.html     the guide as Quarto would render it
+    <root>/docs/guide/assets/
+    <root>/slides/                  where slides-from is run
+
+Guide chapters cycle through every h2 class in SLIDE_TEMPLATES plus plain
+(unlabeled) sections, so each handler in process_html_content gets used.
+
+    python -m benchmarks.corpus <root> [--topics 1000] [--sections 1000]
+"""
+import os
+import random
+import argparse
+
+from tasl.slides_from_guide import SLIDE_TEMPLATES
+
+WORDS = ( "loop variable function array pointer recursion stack queue list tuple dictionary class object "
+          "method string integer float boolean module import exception file thread process socket" ).split()
+
+TAGS = ( "lecture", "lab", "exam", "review", "python", "c", "data", "web" )
+
+# a 1x1 PNG, so assets are real (small) files
+PNG = bytes.fromhex( "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                     "1f15c4890000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082" )
+
+
+def sentence( rng, words=12 ):
+    """ return a sentence of random words """
+    return " ".join( rng.choice( WORDS ) for _ in range( words ) ).capitalize() + "."
+
+
+def write( path, contents ):
+    os.makedirs( os.path.dirname( path ), exist_ok=True )
+    mode = "wb" if isinstance( contents, bytes ) else "w"
+    with open( path, mode, **( {} if mode == "wb" else dict( encoding="utf-8" ) ) ) as file:
+        file.write( contents )
+
+
+def make_lecture( rng, number, first_topic, topics, assets_per_topic ):
+    """ return the text of a lecture with topics '# Topic n' blocks, and the assets it uses """
+    parts = [ f"---\ntitle: Lecture {number}\n---\n\n## Housekeeping\n\n- {sentence(rng)}\n" ]
+    assets = []
+    for t in range( first_topic, first_topic + topics ):
+        parts.append( f"\n# Topic {t} {rng.choice(WORDS)}\n\n## Overview\n\n{sentence(rng)}\n\n" )
+        for a in range( assets_per_topic ):
+            asset = f"assets/topic-{t}-{a}.png"
+            assets.append( asset )
+            parts.append( f"![]({asset})\n\n" )
+        parts.append( f"- {sentence(rng, 6)}\n- {sentence(rng, 6)}\n\n```python\n# not a topic\nx = {t}\n```\n" )
+    return "".join( parts ), assets
+
+
+def write_lectures( root, topics, topics_per_lecture=20, assets_per_topic=1, seed=0 ):
+    """ write lectures holding `topics` topics in all.  Returns the lecture paths. """
+    rng = random.Random( seed )
+    folder = os.path.join( root, "lectures" )
+    lectures = []
+    number = 1
+    for first in range( 0, topics, topics_per_lecture ):
+        text, assets = make_lecture( rng, number, first, min( topics_per_lecture, topics - first ), assets_per_topic )
+        path = os.path.join( folder, f"lect-{number:02}.qmd" )
+        write( path, text )
+        for asset in assets:
+            write( os.path.join( folder, asset ), PNG )
+        lectures.append( path )
+        number += 1
+    return lectures
+
+
+def write_topics( root, topics, seed=0 ):
+    """ write `topics` tagged topics (wrapper and _topic file) into <root>/topics.  Returns the wrapper paths. """
+    rng = random.Random( seed )
+    folder = os.path.join( root, "topics" )
+    wrappers = []
+    for t in range( topics ):
+        basename = f"topic-{t}-{rng.choice(WORDS)}"
+        tags = sorted( set( rng.sample( TAGS, 2 ) ) | { f"lecture-{t % 30 + 1:02}" } )
+        tag_lines = "".join( f"    - {tag}\n" for tag in tags )
+        wrapper = os.path.join( folder, basename + ".qmd" )
+        write( wrapper, f"---\ntitle: \"Topic {t}\"\ntasl:\n  topic: Topic {t}\n  tags:\n{tag_lines}---\n\n"
+                        f"{{{{< include '_{basename}.qmd' >}}}}\n" )
+        body = "\n\n".join( sentence( rng, 20 ) for _ in range( 5 ) )
+        write( os.path.join( folder, "_" + basename + ".qmd" ), f"\n# Topic {t}\n\n## Overview\n\n{body}\n" )
+        wrappers.append( wrapper )
+    return wrappers
+
+
+def make_guide_section( rng, kind, n ):
+    """ return (markdown, html) for one h2 section of a guide chapter """
+    title = f"Section {n} {rng.choice(WORDS)}"
+    if kind == "slide-template-bullet-walk":
+        items = [ ( rng.choice( WORDS ), sentence( rng, 8 ) ) for _ in range( 3 ) ]
+        md = f"## {title} {{.{kind}}}\n\n" + "".join( f"- **{k}:** {v}\n" for k, v in items ) + "\n![](assets/guide.png)\n"
+        html = ( f'<h2 class="{kind}">{title}</h2>\n<ul>\n'
+                 + "".join( f"<li><strong>{k}:</strong> {v}</li>\n" for k, v in items )
+                 + '</ul>\n<p><img src="assets/guide.png"></p>\n' )
+    elif kind == "slide-template-versus":
+        md = f"## {title} {{.{kind}}}\n\n{sentence(rng)}\n"
+        html = f'<h2 class="{kind}">{title}</h2>\n' + "".join(
+            f'<div class="versus-block"><p>{sentence(rng, 8)}</p><img src="assets/guide.png"></div>\n' for _ in range( 2 ) )
+    elif kind == "slide-template-description-p5-widget":
+        md = f"## {title} {{.{kind}}}\n\n{sentence(rng)}\n"
+        html = ( f'<h2 class="{kind}">{title}</h2>\n<p>{sentence(rng)}</p>\n'
+                 f'<ul><li>{sentence(rng, 6)}</li><li>{sentence(rng, 6)}</li></ul>\n'
+                 f'<img src="assets/guide.png">\n<script type="text/p5" data-height="300">function setup() {{}}</script>\n' )
+    elif kind == "slide-template-2-column-with-image":
+        md = f"## {title} {{.{kind}}}\n\n{sentence(rng)}\n"
+        html = ( f'<h2 class="{kind}">{title}</h2>\n<p>{sentence(rng)}</p>\n'
+                 f'<ul><li>{sentence(rng, 6)}</li><li>{sentence(rng, 6)}</li></ul>\n<img src="assets/guide.png">\n'
+                 f'<section><h3>Try it</h3><div data-snack-id="abc{n}" style="height:505px;width:100%"></div></section>\n' )
+    else:
+        body = sentence( rng )
+        md = ( f"## {title}\n\n{body}\n\n### Detail {n}\n\n- {sentence(rng, 6)}\n\n"
+               f"::: {{.guide-block-left}}\n{sentence(rng, 6)}\n:::\n\n<!-- -->\n" )
+        html = f'<h2 class="anchored">{title}</h2>\n<p>{body}</p>\n'
+    return md, html
+
+
+def write_guide( root, sections, sections_per_chapter=20, seed=0 ):
+    """ write guide chapters holding `sections` h2 sections in all.  Returns the chapter names (chNN.qmd). """
+    rng = random.Random( seed )
+    kinds = SLIDE_TEMPLATES + ( None, )
+    write( os.path.join( root, "docs", "guide", "assets", "guide.png" ), PNG )
+    os.makedirs( os.path.join( root, "slides" ), exist_ok=True )
+    chapters = []
+    n = 0
+    for c, first in enumerate( range( 0, sections, sections_per_chapter ), start=1 ):
+        name = f"ch{c:02}"
+        mds = [ f"---\ntitle: Chapter {c}\n---\n\n" ]
+        htmls = [ f"<html><body>\n<h1>Chapter {c}</h1>\n" ]
+        for _ in range( min( sections_per_chapter, sections - first ) ):
+            md, html = make_guide_section( rng, kinds[n % len( kinds )], n )
+            mds.append( md + "\n" )
+            htmls.append( html )
+            n += 1
+        htmls.append( "</body></html>\n" )
+        write( os.path.join( root, "guide", name + ".qmd" ), "".join( mds ) )
+        write( os.path.join( root, "docs", "guide", name + ".html" ), "".join( htmls ) )
+        chapters.append( name + ".qmd" )
+    return chapters
+
+
+def write_course( root, topics=100, sections=100, topics_per_lecture=20, assets_per_topic=1, sections_per_chapter=20, seed=0 ):
+    """ write a whole synthetic course under root """
+    os.makedirs( os.path.join( root, ".git" ), exist_ok=True )
+    return dict(
+        lectures=write_lectures( root, topics, topics_per_lecture, assets_per_topic, seed ),
+        topics=write_topics( root, topics, seed ),
+        chapters=write_guide( root, sections, sections_per_chapter, seed ),
+    )
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description=__doc__.strip().splitlines()[0] )
+    parser.add_argument( "root", help="folder to create the course in" )
+    parser.add_argument( "--topics", type=int, default=1000, help="topics, in lectures and in the topics folder" )
+    parser.add_argument( "--sections", type=int, default=1000, help="h2 sections across the guide" )
+    parser.add_argument( "--topics-per-lecture", type=int, default=20 )
+    parser.add_argument( "--assets-per-topic", type=int, default=1 )
+    parser.add_argument( "--sections-per-chapter", type=int, default=20 )
+    parser.add_argument( "--seed", type=int, default=0 )
+    args = parser.parse_args( argv )
+
+    course = write_course( args.root, args.topics, args.sections, args.topics_per_lecture,
+                           args.assets_per_topic, args.sections_per_chapter, args.seed )
+    print(f"{len(course['lectures'])} lectures, {len(course['topics'])} topics, {len(course['chapters'])} guide chapters in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Section lookup in process_html_content: per-section parse vs single-pass index
+
+The old code parsed the whole guide page and scanned it with tokens.index()
+once per unlabeled h2, so a page with n sections cost O(n^2) parses and an
+O(n^2) scan inside each.  The section index parses once and slices in one
+linear pass.
+
+    python -m benchmarks.sections [--sections 10,20,40,80] [--json]
+"""
+import sys
+import json
+import time
+import argparse
+
+from markdown_it import MarkdownIt
+from mdformat.renderer import MDRenderer
+
+from tasl.slides_from_guide import index_md_h2_sections
+
+
+def make_guide_markdown( sections, paragraphs=3 ):
+    """ return a guide page with `sections` h2 sections of plain text and lists """
+    parts = []
+    for i in range( sections ):
+        parts.append(f"## Section {i}\n")
+        for j in range( paragraphs ):
+            parts.append(f"Paragraph {j} of section {i} with *emphasis* and `code`.\n")
+        parts.append("- item one\n- item two\n- item three\n")
+    return "\n".join( parts )
+
+
+def extract_per_section( md, content, titles ):
+    """ the old approach: reparse the page and scan it with tokens.index() for every section """
+    renderer = None
+    out = []
+    for title in titles:
+        tokens = md.parse( content )
+        h2_content = []
+        capture = False
+        for token in tokens:
+            if token.type == "heading_open" and token.tag == "h2":
+                capture = False
+                next_token = tokens[tokens.index(token) + 1]
+                if next_token.type == "inline" and next_token.content == title:
+                    capture = True
+            if capture:
+                h2_content.append(token)
+        renderer = MDRenderer()
+        out.append( renderer.render( h2_content, {}, {} ) )
+    return out
+
+
+def extract_indexed( md, content, titles ):
+    """ the new approach: parse once, index sections in one pass, reuse one renderer """
+    renderer = MDRenderer()
+    sections = index_md_h2_sections( md.parse( content ) )
+    return [ renderer.render( sections.get( title, [] ), {}, {} ) for title in titles ]
+
+
+def time_call( func, *args, repeat=3 ):
+    """ return (best wall time of repeat calls in seconds, result of the last call) """
+    best = None
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        result = func( *args )
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min( best, elapsed )
+    return best, result
+
+
+def run( section_counts ):
+    md = MarkdownIt("gfm-like",{"html": True})
+    results = []
+    for sections in section_counts:
+        content = make_guide_markdown( sections )
+        titles = [ f"Section {i}" for i in range( sections ) ]
+        # the quadratic path is slow enough that one run is plenty
+        per_section, old = time_call( extract_per_section, md, content, titles, repeat=1 )
+        indexed, new = time_call( extract_indexed, md, content, titles )
+        assert old == new
+        results.append( dict( sections=sections, per_section=per_section, indexed=indexed ) )
+    return results
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description=__doc__.strip().splitlines()[0] )
+    parser.add_argument( "--sections", default="10,20,40,80", help="comma separated section counts" )
+    parser.add_argument( "--json", action="store_true", help="print results as JSON" )
+    args = parser.parse_args( argv )
+
+    results = run( [ int(n) for n in args.sections.split(",") ] )
+    if args.json:
+        json.dump( results, sys.stdout, indent=2 )
+        print()
+        return
+
+    print(f"{'sections':>8}  {'per-section (s)':>16}  {'indexed (s)':>12}  {'speedup':>8}")
+    for row in results:
+        print(f"{row['sections']:>8}  {row['per_section']:>16.4f}  {row['indexed']:>12.4f}  {row['per_section']/row['indexed']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark suite: scanl, search/list, tag mutation and slides-from on a synthetic course
+
+Each benchmark builds a course with benchmarks.corpus in a temporary folder,
+at each requested scale, and times the tasl functions the cli commands call.
+Scale is the number of topics (scan, search, tags) or guide h2 sections
+(slides).  Results are written as JSON so runs can be compared across releases.
+
+    python -m benchmarks.suite [--scales 10,1000,10000] [--only scan,tags] [--repeat 3] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+from loguru import logger
+
+from benchmarks.corpus import write_lectures, write_topics, write_guide
+
+BENCHMARKS = ( "scan", "search", "tags", "slides" )
+
+
+def course_files( root, folder, wrappers=False ):
+    """ return the .qmd files in a folder of the course, sorted.  With wrappers=True, skip _topic files. """
+    folder = os.path.join( root, folder )
+    return sorted( os.path.join( folder, name ) for name in os.listdir( folder )
+                   if name.endswith(".qmd") and not ( wrappers and name.startswith("_") ) )
+
+
+def timed( func, *args, **kwargs ):
+    """ return dict(wall=, cpu=) seconds for one call of func """
+    wall, cpu = time.perf_counter(), time.process_time()
+    func( *args, **kwargs )
+    return dict( wall=time.perf_counter() - wall, cpu=time.process_time() - cpu )
+
+
+def bench_scan( root, scale, run ):
+    """ scanl --confirm of every lecture into an empty folder: one lecture at a time, and as one batch parsed in parallel """
+    from tasl.utils import scan_for_topics, scan_lectures
+
+    if run == 0:
+        write_lectures( root, scale )
+    lectures = course_files( root, "lectures" )
+    destination = os.path.join( root, f"scanned-{run}" )
+    batch_destination = os.path.join( root, f"scanned-batch-{run}" )
+    os.makedirs( destination )
+    os.makedirs( batch_destination )
+    # assets are found relative to the lecture folder, as when running tasl there
+    os.chdir( os.path.join( root, "lectures" ) )
+
+    def scan_all():
+        for lecture in lectures:
+            scan_for_topics( lecture, confirm=True, destination=destination )
+
+    return dict( scan=timed( scan_all ),
+                 scan_batch=timed( scan_lectures, lectures, confirm=True, destination=batch_destination, jobs=os.cpu_count() or 1 ) )
+
+
+def bench_search( root, scale, run ):
+    """ search_files with and without a topic index, and list_topic_files """
+    from tasl.utils import search_files, list_topic_files, load_yaml_header
+    from tasl.index import INDEX_FOLDER
+
+    folder = os.path.join( root, "topics" )
+    if run == 0:
+        write_topics( root, scale )
+    shutil.rmtree( os.path.join( folder, INDEX_FOLDER ), ignore_errors=True )
+    load_yaml_header.cache_clear()
+    return dict(
+        search_cold=timed( search_files, folder, ["loop"], ["stack"], with_tags=["python"] ),
+        search_warm=timed( search_files, folder, ["loop"], ["stack"], with_tags=["python"] ),
+        search_phrase=timed( search_files, folder, ["loop variable"], [] ),
+        list=timed( list_topic_files, ["+loop", "-stack"], source_directory_path=folder ),
+    )
+
+
+def bench_tags( root, scale, run ):
+    """ add a tag to every topic, then remove it """
+    from tasl.utils import mutate_tags
+
+    if run == 0:
+        write_topics( root, scale )
+    wrappers = course_files( root, "topics", wrappers=True )
+    return dict(
+        add_tag=timed( mutate_tags, wrappers, add_tags=["benchmark"] ),
+        remove_tag=timed( mutate_tags, wrappers, remove_tags=["benchmark"] ),
+    )
+
+
+def bench_slides( root, scale, run ):
+    """ slides-from over the whole guide, rebuilt and then from the build cache """
+    from tasl.slides_from_guide import convert_guide_files
+
+    if run == 0:
+        write_guide( root, scale )
+    chapters = [ os.path.basename( chapter ) for chapter in course_files( root, "guide" ) ]
+    os.chdir( os.path.join( root, "slides" ) )
+    return dict(
+        slides_build=timed( convert_guide_files, chapters, force=True ),
+        slides_cached=timed( convert_guide_files, chapters ),
+    )
+
+
+def run_benchmark( name, scale, repeat=1 ):
+    """ run one benchmark repeat times in a fresh course, returning the best time of each measurement """
+    bench = globals()[ "bench_" + name ]
+    cwd = os.getcwd()
+    best = {}
+    with tempfile.TemporaryDirectory( prefix=f"tasl-bench-{name}-" ) as root:
+        os.makedirs( os.path.join( root, ".git" ) )
+        try:
+            for run in range( repeat ):
+                os.chdir( root )
+                for measure, times in bench( root, scale, run ).items():
+                    if measure not in best or times["wall"] < best[measure]["wall"]:
+                        best[measure] = times
+        finally:
+            os.chdir( cwd )
+    return [ dict( benchmark=name, measure=measure, scale=scale, **times ) for measure, times in best.items() ]
+
+
+def get_metadata():
+    from tasl.cache import get_tasl_version
+    return dict( tasl=get_tasl_version(), python=platform.python_version(), platform=platform.platform(),
+                 time=time.strftime( "%Y-%m-%dT%H:%M:%S%z" ) )
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description=__doc__.strip().splitlines()[0] )
+    parser.add_argument( "--scales", default="10,1000,10000", help="comma separated topic/section counts" )
+    parser.add_argument( "--only", default=",".join( BENCHMARKS ), help=f"comma separated subset of {','.join(BENCHMARKS)}" )
+    parser.add_argument( "--repeat", type=int, default=1, help="runs per benchmark, the best is kept" )
+    parser.add_argument( "--output", default=None, help="write JSON here instead of stdout" )
+    args = parser.parse_args( argv )
+
+    names = [ name for name in args.only.split(",") if name ]
+    unknown = set( names ) - set( BENCHMARKS )
+    if unknown:
+        parser.error( f"unknown benchmarks: {','.join(sorted(unknown))}" )
+
+    # tasl logs every file it touches; that isn't what we're measuring
+    logger.remove()
+
+    results = []
+    for scale in [ int(n) for n in args.scales.split(",") ]:
+        for name in names:
+            rows = run_benchmark( name, scale, repeat=args.repeat )
+            for row in rows:
+                print( f"{row['benchmark']:>7} {row['measure']:<14} {row['scale']:>6}  {row['wall']:9.3f}s wall  {row['cpu']:9.3f}s cpu", file=sys.stderr )
+            results.extend( rows )
+
+    report = dict( metadata=get_metadata(), results=results )
+    if args.output:
+        with open( args.output, "w", encoding="utf-8" ) as file:
+            json.dump( report, file, indent=2 )
+            file.write( "\n" )
+    else:
+        json.dump( report, sys.stdout, indent=2 )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 
 import sys
 from loguru import logger
-import argparse
 
 
 # Define custom message templates
@@ -18,47 +17,52 @@ default_format = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level:
 # Values: "TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"
 DEFAULT_LOG_LEVEL = 'SUCCESS'
 
+# default size of the thread pools used for file I/O (tag edits, asset copies)
+DEFAULT_IO_WORKERS = 8
 
-def sniff_log_level():
-    """ take early look at command line, setting log_level as early as possible """
-    # disable help, parse only known arguments.  You're sniffing early!
-    parser = argparse.ArgumentParser(add_help=False)
-    parser.add_argument('--log-level', type=str)
 
-    args, unknown = parser.parse_known_args()
-    log_level = args.log_level
-    return log_level
+# message template for each level.  Anything else gets default_format.
+level_templates = dict( INFO=info_template, SUCCESS=success_template, WARNING=warning_template )
 
 
-log_level = sniff_log_level()
-if log_level is None:
-    log_level=DEFAULT_LOG_LEVEL
+def format_record( record ):
+    """ pick the template for a record by its level, so one sink serves every level """
+    return level_templates.get( record["level"].name, default_format ) + "\n{exception}"
 
-if not log_level==DEFAULT_LOG_LEVEL:
-    logger.success(f"Log level set to {log_level} by --log-level argument (early).")
 
-# Remove the default handler
-logger.remove()
+def configure_logging( level, enqueue=False ):
+    """ send log records at level and above to stderr
 
-simple_format = "{message}"
+    With enqueue=True records are handed to a background thread, so writing
+    to a slow terminal doesn't hold up the work being logged.  Messages below
+    level are dropped by loguru before any formatting is done.
+    """
+    logger.remove()
+    logger.add( sys.stderr, format=format_record, level=level, enqueue=enqueue )
 
-simple_levels = ["INFO","SUCCESS","WARNING"]
 
-log_levels = [level.name for level in logger._core.levels.values() if level.no >= logger.level(log_level).no and not level.name in simple_levels ]
+def capture_log_records( records, level ):
+    """ in a pool worker, collect log records at level and above in records instead of printing them """
+    def capture( message ):
+        record = message.record
+        records.append( (record["level"].name, record["message"], record["name"], record["function"], record["line"]) )
 
-# Remove the default logger configuration
-logger.remove()
+    logger.remove()
+    logger.add( capture, level=level, format="{message}" )
 
-logger.add(sys.stderr, format=default_format, level=log_level, filter=lambda record: record["level"].name in log_levels)
 
-# this code is written out because of a bug in logger.add
-if "INFO" in simple_levels and logger.level(log_level).no <= logger.level("INFO").no:
-    logger.add(sys.stderr, format=info_template, level='INFO', filter=lambda record: record["level"].name=='INFO' )
-if "SUCCESS" in simple_levels and logger.level(log_level).no <= logger.level("SUCCESS").no:
-    logger.add(sys.stderr, format=success_template, level='SUCCESS', filter=lambda record: record["level"].name=='SUCCESS' )
-if "WARNING" in simple_levels and logger.level(log_level).no <= logger.level("WARNING").no:
-    logger.add(sys.stderr, format=warning_template, level='WARNING', filter=lambda record: record["level"].name=='WARNING' )
-if "ERROR" in simple_levels and logger.level(log_level).no <= logger.level("ERROR").no:
-    logger.add(sys.stderr, format=default_format, level='ERROR', filter=lambda record: record["level"].name=='ERROR' )
-if "CRITICAL" in simple_levels and logger.level(log_level).no <= logger.level("CRITICAL").no:
-    logger.add(sys.stderr, format=default_format, level='CRITICAL', filter=lambda record: record["level"].name=='CRITICAL' )
+def replay_log_records( records ):
+    """ re-emit log records captured in a worker through this process's sinks """
+    for level, message, name, function, line in records:
+        origin = dict( name=name, function=function, line=line )
+        logger.patch( lambda record, origin=origin: record.update( origin ) ).log( level, message )
+
+
+# set from the command line by tasl._main before a command runs.  Importing
+# tasl leaves loguru's sinks alone, so library users keep their own.
+log_level = DEFAULT_LOG_LEVEL
+log_async = False
+
+# the public API, for using tasl from Python rather than the command line
+from tasl.errors import TaslError, TopicExistsError, TopicNotFoundError, TopicWriteError, LectureReadError, NotInGitRepositoryError, ConversionError, BatchError
+from tasl.library import TopicLibrary
@@ -1,20 +1,126 @@
 
 import os
+import sys
 import glob
 import click
-from tasl.utils import add_new_topic,scan_for_topics,copy_topic_file_to_folder, \
-    copy_topic_file,rename_topic_file, list_topic_files, \
-    delete_topic_files, update_yaml_header, get_yaml_header
-from tasl.slides_from_guide import slides_from_qmd
 from loguru import logger
-from tasl import DEFAULT_LOG_LEVEL
+import tasl
+from tasl import DEFAULT_LOG_LEVEL, DEFAULT_IO_WORKERS
 
-@click.group()
+# Commands import their own working modules (tasl.utils, tasl.slides_from_guide)
+# inside the command body.  This keeps `tasl --help`, `tasl --version` and the
+# light commands from paying for yaml, BeautifulSoup, markdown and friends.
+
+def sniff_option( name, flag=False ):
+    """ take early look at command line for --name VALUE or --name=VALUE.  A bare option gives True.
+
+    With flag=True the option takes no value, so the argument after it (usually
+    the command name) is left alone.
+    """
+    # argparse costs more to import than this whole scan.  You're sniffing early!
+    option = "--" + name
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg == option:
+            if not flag and i + 1 < len(args) and not args[i + 1].startswith("-"):
+                return args[i + 1]
+            return True
+        if arg.startswith(option + "="):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def configure_cli_logging():
+    """ set tasl.log_level and tasl.log_async from an early look at the command line and add the stderr sink """
+    level = sniff_option("log-level")
+    if level is None or level is True:
+        level = DEFAULT_LOG_LEVEL
+
+    if not level==DEFAULT_LOG_LEVEL:
+        logger.success(f"Log level set to {level} by --log-level argument (early).")
+
+    tasl.log_level = level
+    tasl.log_async = sniff_option("log-async", flag=True) is True
+    tasl.configure_logging( tasl.log_level, enqueue=tasl.log_async )
+
+
+class TaslGroup(click.Group):
+    """ click group that accepts a bare --profile, meaning --profile=tasl.pstats, and --profile PATH,
+    hands command lines to a running `tasl serve`, and reports TaslErrors """
+
+    def main(self, args=None, **kwargs):
+        # only a real command line configures logging and is forwarded; the server itself calls main with args
+        if args is None:
+            from tasl.serve import forward_to_server
+            configure_cli_logging()
+            code = forward_to_server( sys.argv[1:], tasl.log_level )
+            if code is not None:
+                sys.exit( code )
+        return super().main(args=args, **kwargs)
+
+    def parse_args(self, ctx, args):
+        if "--profile" in args:
+            from tasl.profiling import DEFAULT_PROFILE
+            # only options before the command name belong to the group
+            commands = [ i for i, arg in enumerate(args) if arg in self.commands ]
+            end = commands[0] if commands else len(args)
+            rewritten = []
+            skip = False
+            for i, arg in enumerate(args):
+                if skip:
+                    skip = False
+                elif arg == "--profile" and i < end:
+                    # --profile PATH, unless what follows is an option or the command
+                    skip = i + 1 < end and not args[i + 1].startswith("-")
+                    rewritten.append( f"--profile={args[i + 1] if skip else DEFAULT_PROFILE}" )
+                else:
+                    rewritten.append( arg )
+            args = rewritten
+        return super().parse_args(ctx, args)
+
+    def invoke(self, ctx):
+        from tasl.errors import TaslError
+        try:
+            return super().invoke(ctx)
+        except TaslError as e:
+            logger.error( str( e ) )
+            sys.exit(1)
+
+
+@click.group(cls=TaslGroup)
 @click.version_option( prog_name='tasl' )
 @click.option("--log-level",help="set level for logging messages",default=DEFAULT_LOG_LEVEL )
-def cli(log_level):
+@click.option("--log-async",help="write log messages from a background thread",is_flag=True, default=False)
+@click.option("--profile",metavar="[PATH]",help="Profile the command, saving PATH (default tasl.pstats) and PATH.folded stacks",default=None)
+@click.option("--profile-top",help="Print this many cumulative hotspots when profiling",type=click.IntRange(min=0),default=25)
+@click.option("--trace",metavar="PATH",help="Save per-phase time and memory spans to PATH in Chrome trace format",default=None)
+@click.pass_context
+def cli(ctx, log_level, log_async, profile, profile_top, trace):
     """This is a command group for topic-related commands."""
-    pass
+    if trace is not None:
+        from tasl.trace import start_trace
+        start_trace()
+        ctx.call_on_close( lambda: finish_trace( trace ) )
+    if profile is not None:
+        from tasl.profiling import start_profile, finish_profile
+        profiler = start_profile()
+        # runs after the command, even if it exits early with sys.exit()
+        ctx.call_on_close( lambda: finish_profile( profiler, path=profile, top=profile_top ) )
+
+def finish_trace( path ):
+    """ save the spans recorded by --trace and log where the time went """
+    from tasl.trace import stop_trace, write_trace, summarize_trace
+    recorded = stop_trace()
+    write_trace( path, recorded )
+    for name, count, wall, cpu, peak in summarize_trace( recorded ):
+        logger.info("{:<40} {:>5}x {:>10.1f} ms wall {:>10.1f} ms cpu {:>10.1f} KB peak", name, count, wall, cpu, peak)
+    logger.success(f"Trace saved to {path}: {len(recorded)} spans")
+
+@cli.result_callback()
+def report_output(result, **kwargs):
+    """ after any command, report files written and left unchanged """
+    from tasl.output import report_write_stats
+    report_write_stats()
 
 @cli.command()
 @click.argument('topic', metavar='<TOPIC>', type=str)
@@ -22,7 +128,8 @@ def cli(log_level):
 @click.option("--template",help="Basename of template file (e.g., template1)",default="template1")
 def create(topic,overwrite,template):
     """ Creates new topic files in current folder. """
-    logger.debug(f"{overwrite}")
+    from tasl.utils import add_new_topic
+    logger.debug("{}", overwrite)
     add_new_topic( topic,overwrite=overwrite, template_base=template )
 
 
@@ -31,20 +138,36 @@ def create(topic,overwrite,template):
 @click.option("--confirm",help="Save topics to separate files",is_flag=True, default=False)
 @click.option("--destination",help="Destination folder for topics",type=click.Path( exists=True, file_okay=False), default=".")
 @click.option("--overwrite",help="Overwrite existing topic files",is_flag=True, default=False)
-def scanl(filename, confirm, destination, overwrite):
+@click.option("--link",help="Hardlink or reflink assets instead of copying them",type=click.Choice(["hard","reflink"]), default=None)
+@click.option("--checksum",help="Compare assets by content, not size and mtime",is_flag=True, default=False)
+@click.option("--io-workers",help="Copy up to N files at once",type=click.IntRange(min=1),default=DEFAULT_IO_WORKERS)
+@click.option("--jobs",help="Parse lectures using N worker processes",type=click.IntRange(min=1),default=1)
+def scanl(filename, confirm, destination, overwrite, link, checksum, io_workers, jobs):
     """ Scan a QMD for topics (lecture file by section).
-    
+
+    Several lectures are scanned as one batch: topics that more than one
+    lecture would create, or that are already in the destination from
+    elsewhere, are reported before anything is written.
     """
+    from tasl.utils import scan_for_topics, scan_lectures
+    from tasl import log_level
 
-    logger.debug(f"entering scan")
+    logger.debug("entering scan")
+    errors = []
     if isinstance( filename, str ):
-        scan_for_topics( filename, confirm=confirm, overwrite=overwrite, destination=destination )
-    elif isinstance( filename, tuple ):
-        for file in filename:
-            scan_for_topics( file, confirm=confirm, overwrite=overwrite, destination=destination )
+        filename = ( filename, )
+    if not isinstance( filename, tuple ):
+        logger.debug("type: {}\n {}", type(filename), filename)
+    elif len( filename ) == 1:
+        errors = scan_for_topics( filename[0], confirm=confirm, overwrite=overwrite, destination=destination, link=link, checksum=checksum,
+                                  io_workers=io_workers )["errors"]
+    elif len( filename ) > 1:
+        errors = scan_lectures( filename, confirm=confirm, overwrite=overwrite, destination=destination, link=link, checksum=checksum,
+                                io_workers=io_workers, jobs=jobs, log_level=log_level )["errors"]
 
-    else:
-        logger.debug(f"type: {type(filename)}\n {filename}" )
+    if errors:
+        logger.error(f"{len(errors)} asset files could not be copied.")
+        sys.exit(1)
 
 
 @cli.command()
@@ -52,20 +175,27 @@ def scanl(filename, confirm, destination, overwrite):
 @click.option("--confirm",help="Save topics to separate files",is_flag=True, default=False)
 @click.option("--destination",help="Destination folder for topics",type=click.Path( exists=True, file_okay=False), default=".")
 @click.option("--overwrite",help="Overwrite existing topic files",is_flag=True, default=False)
-def copy_to_folder(filename, confirm, destination, overwrite):
+@click.option("--link",help="Hardlink or reflink assets instead of copying them",type=click.Choice(["hard","reflink"]), default=None)
+@click.option("--checksum",help="Compare assets by content, not size and mtime",is_flag=True, default=False)
+@click.option("--io-workers",help="Copy up to N files at once",type=click.IntRange(min=1),default=DEFAULT_IO_WORKERS)
+def copy_to_folder(filename, confirm, destination, overwrite, link, checksum, io_workers):
     """ Copies a topic (all related files) to a new folder.
      
        Does not rename topic.
 
     """
+    from tasl.utils import copy_topic_files_to_folder
 
     if isinstance( filename, str ):
-        copy_topic_file_to_folder( filename, confirm=confirm, overwrite=overwrite, destination=destination )
-    elif isinstance( filename, tuple ):
-        for file in filename:
-            copy_topic_file_to_folder( file, confirm=confirm, overwrite=overwrite, destination=destination )
-    else:
+        filename = ( filename, )
+    if not isinstance( filename, tuple ):
         logger.warning(f"Unprocessed type: {type(filename)}\n {filename}" )
+        return
+    errors = copy_topic_files_to_folder( filename, confirm=confirm, overwrite=overwrite, destination=destination,
+                                         link=link, checksum=checksum, io_workers=io_workers )
+    if errors:
+        logger.error(f"{len(errors)} files could not be copied.")
+        sys.exit(1)
 
 @cli.command()
 @click.argument('from_filename', type=click.Path(exists=True),nargs=1)
@@ -74,6 +204,7 @@ def copy(from_filename, to_filename ):
     """ Copies a topic (all related files) to new file
      
     """
+    from tasl.utils import copy_topic_file
     copy_topic_file( from_filename, to_filename )
 
 @cli.command()
@@ -82,6 +213,7 @@ def copy(from_filename, to_filename ):
 @click.option("--confirm",help="run the command",is_flag=True, default=False)
 def rename(wrapper_qmd, new_topic, confirm ):
     """ Renames topic QMD and related files to new topic in the current folder. """
+    from tasl.utils import rename_topic_file
     original_basename = os.path.splitext(os.path.basename(wrapper_qmd))[0]
     rename_topic_file( original_basename, new_topic, confirm=confirm )
 
@@ -91,6 +223,7 @@ def rename(wrapper_qmd, new_topic, confirm ):
 @click.option("--confirm",help="run the command",is_flag=True, default=False)
 def delete(wrapper_qmd, confirm ):
     """ Deletes topic QMD and related files. """
+    from tasl.utils import delete_topic_files
     original_basename = os.path.basename(wrapper_qmd)
     if confirm:
         delete_topic_files( ["_"+original_basename], confirm=confirm )
@@ -114,8 +247,11 @@ def parse_comma_separated(ctx, param, value):
 @click.option("--delete",help="Delete matching topics",is_flag=True, default=False)
 @click.option("--copy",help="Copy matching topics to destination",is_flag=True, default=False)
 @click.option("--destination",help="Destination folder for topics",type=click.Path( exists=True, file_okay=False), default=None)
-def list( filters, add_tag, with_tags, without_tags, remove_tag, confirm, delete, copy, destination ):
+@click.option("--substring",help="Match +word/-word anywhere in the topic, not only as whole words",is_flag=True, default=False)
+@click.option("--io-workers",help="Update up to N files at once",type=click.IntRange(min=1),default=DEFAULT_IO_WORKERS)
+def list( filters, add_tag, with_tags, without_tags, remove_tag, confirm, delete, copy, destination, substring, io_workers ):
     """ List topic files by tag """
+    from tasl.utils import list_topic_files
 
     logger.debug( filters )
     logger.debug( add_tag )
@@ -126,7 +262,32 @@ def list( filters, add_tag, with_tags, without_tags, remove_tag, confirm, delete
     logger.debug( destination )
 
     list_topic_files( filters, add_tag=add_tag, remove_tag=remove_tag, confirm=confirm, 
-                     with_tags=with_tags, without_tags=without_tags, delete=delete, copy=copy, destination=destination)
+                     with_tags=with_tags, without_tags=without_tags, delete=delete, copy=copy, destination=destination,
+                     match="substring" if substring else "token", io_workers=io_workers )
+
+
+@cli.command()
+@click.argument('operations', type=click.Path(exists=True, dir_okay=False, allow_dash=True),nargs=1)
+@click.option("--folder",help="Topic folder the operations apply to (default: folder: in the file, else .)",
+              type=click.Path( exists=True, file_okay=False), default=None)
+@click.option("--confirm",help="Write the results of the operations",is_flag=True, default=False)
+@click.option("--io-workers",help="Copy up to N files at once",type=click.IntRange(min=1),default=DEFAULT_IO_WORKERS)
+def batch(operations, folder, confirm, io_workers):
+    """ Run a file of operations (YAML, or NDJSON; - for stdin) on a topic folder.
+
+    Operations (tag, rename, create, delete, scan, copy) are checked for
+    conflicts first, applied to the topics in memory, and written once.
+    """
+    from tasl.batch import load_operations, run_batch
+
+    file_folder, operation_list = load_operations( operations )
+    folder = folder or file_folder or "."
+    if not os.path.isdir( folder ):
+        raise click.BadParameter(f"{folder} is not a folder", param_hint="folder")
+    result = run_batch( operation_list, folder=folder, confirm=confirm, io_workers=io_workers )
+    if result["errors"]:
+        logger.error(f"{len(result['errors'])} files could not be copied.")
+        sys.exit(1)
 
 
 @cli.command()
@@ -136,8 +297,16 @@ def list( filters, add_tag, with_tags, without_tags, remove_tag, confirm, delete
 @click.option("--confirm",help="perform the conversion",is_flag=True, default=False)
 @click.option("--delete",help="delete the files from current folder",is_flag=True, default=False)
 @click.option("--add-tag",help="Assign tag to the files",default=None)
-def slides_from(file, folder, exclude_files, confirm, delete,add_tag ):
+@click.option("--jobs",help="Convert files using N worker processes",type=click.IntRange(min=1),default=1)
+@click.option("--force",help="Rebuild even if the guide files are unchanged",is_flag=True, default=False)
+@click.option("--link",help="Hardlink or reflink assets instead of copying them",type=click.Choice(["hard","reflink"]), default=None)
+@click.option("--checksum",help="Compare assets by content, not size and mtime",is_flag=True, default=False)
+def slides_from(file, folder, exclude_files, confirm, delete,add_tag, jobs, force, link, checksum ):
     """ Deletes topic QMD and related files. """
+    from tasl.utils import mutate_tags
+    from tasl.slides_from_guide import slides_from_qmd, convert_guide_files
+    from tasl import log_level
+
     if file is None and folder is None:
         logger.error("Must specific either --file or --folder")
         return
@@ -145,7 +314,7 @@ def slides_from(file, folder, exclude_files, confirm, delete,add_tag ):
     if not file is None:
         one_file = file
         if confirm:
-            slides_from_qmd( file )        
+            slides_from_qmd( file, force=force, link=link, checksum=checksum )
             logger.success(f"Topic from guide: {os.path.splitext(os.path.basename(file))[0]}.")
         else:
             # Print or process the filtered files
@@ -159,35 +328,31 @@ def slides_from(file, folder, exclude_files, confirm, delete,add_tag ):
         filtered_files = [f for f in all_files if os.path.basename(f) not in exclude_files]
 
         if confirm:
+            to_build = []
+            to_tag = []
             for one_file in filtered_files:
                 if (not add_tag is None) and os.path.exists( os.path.basename(one_file) ):
-
-                    logger.debug(f"getting header from: { os.path.basename(one_file)}")
-                    header = get_yaml_header(  os.path.basename(one_file) )
-                    logger.debug( header )
-                    if not "tasl" in header.keys():
-                        header["tasl"] = {}
-                    if not "tags" in header["tasl"]:
-                        header["tasl"]["tags"] = []
-                    if not add_tag.lower() in header["tasl"]["tags"]:
-                        header["tasl"]["tags"].append( add_tag.lower() )
-                    logger.debug( header )
-                    update_yaml_header( os.path.basename(one_file), **header )
-                    h2 = get_yaml_header(  os.path.basename(one_file) ) 
-                    logger.debug(f"h2: {h2}")
-                    logger.success(f"Added tag: '{add_tag}' to YAML headers for { os.path.basename(one_file) }.")
+                    to_tag.append( os.path.basename(one_file) )
 
                 elif not delete:
-                    
-                    slides_from_qmd( one_file )
-                    logger.success(f"Topic from guide: {os.path.splitext(os.path.basename(one_file))[0]} built.")
-                  
+                    to_build.append( one_file )
+
                 else:
                     if os.path.exists( os.path.basename(one_file) ):
                         os.remove( os.path.basename(one_file) )
                     if os.path.exists( os.path.basename("_"+one_file) ):
                         os.remove( os.path.basename("_"+ one_file ) )
                     logger.success(f"Topic deleted from current folder: {os.path.splitext(os.path.basename(one_file))[0]}")
+
+            for result in mutate_tags( to_tag, add_tags=[add_tag] ):
+                if result["error"] is None:
+                    logger.success(f"Added tag: '{add_tag}' to YAML headers for { result['filename'] }.")
+
+            failures = convert_guide_files( to_build, jobs=jobs, log_level=log_level, force=force,
+                                           link=link, checksum=checksum )
+            if failures:
+                logger.error(f"{len(failures)} of {len(to_build)} conversions failed: {', '.join(os.path.basename(f) for f in failures)}")
+                sys.exit(1)
         else:
             for one_file in filtered_files:
                 if os.path.exists( os.path.basename(one_file) ):
@@ -201,5 +366,96 @@ def slides_from(file, folder, exclude_files, confirm, delete,add_tag ):
                     logger.success(f"Topic from guide: {os.path.splitext(os.path.basename(one_file))[0]} NOT built.  Use --confirm")
 
 
+@cli.command()
+@click.option("--exclude-files",multiple=True, type=click.Path(), help="ignore these guide files",default=['index.qmd'])
+@click.option("--debounce",help="Wait this many seconds for saves to settle before rebuilding",type=click.FloatRange(min=0),default=0.2)
+@click.option("--poll-interval",help="Seconds between checks when polling",type=click.FloatRange(min=0.05),default=0.5)
+@click.option("--polling",help="Poll for changes even where inotify is available",is_flag=True, default=False)
+@click.option("--link",help="Hardlink or reflink assets instead of copying them",type=click.Choice(["hard","reflink"]), default=None)
+@click.option("--checksum",help="Compare assets by content, not size and mtime",is_flag=True, default=False)
+def watch(exclude_files, debounce, poll_interval, polling, link, checksum):
+    """ Rebuild slides as guide files change.
+
+       Run from the slides folder.  Watches ../guide and ../docs/guide and
+       reconverts only the chapter that changed.
+    """
+    from tasl.watch import watch_guide
+
+    try:
+        watch_guide( exclude_files=exclude_files, debounce=debounce, poll_interval=poll_interval,
+                     polling=polling, link=link, checksum=checksum )
+    except KeyboardInterrupt:
+        logger.success("Stopped watching.")
+
+
+@cli.command()
+@click.option("--socket","socket_path",metavar="PATH",help="Listen on this socket (default $TASL_SOCKET or tasl-<uid>.sock in the runtime folder)",default=None)
+@click.option("--folder",multiple=True,type=click.Path(exists=True, file_okay=False),help="Load the topic index of this folder at startup",default=['.'])
+@click.option("--stop",help="Stop the running server",is_flag=True, default=False)
+@click.option("--status",help="Report whether a server is running",is_flag=True, default=False)
+def serve(socket_path, folder, stop, status):
+    """ Keep tasl loaded and answer commands over a Unix socket.
+
+       While the server runs, other tasl commands are forwarded to it, skipping
+       startup and imports.  Set TASL_NO_SERVER=1 to run a command locally.
+    """
+    from tasl.serve import serve, request, get_socket_path
+
+    path = socket_path or get_socket_path()
+    if stop or status:
+        answers = request( dict( stop=True ) if stop else dict( ping=True ), path=path, timeout=5 )
+        if answers is None:
+            logger.warning(f"No tasl server running on {path}")
+            sys.exit(1)
+        if stop:
+            logger.success(f"Stopped tasl server on {path}")
+        else:
+            logger.success(f"tasl server {answers[-1].get('version')} running on {path}, pid {answers[-1].get('pid')}")
+        return
+
+    try:
+        if not serve( cli, path=path, folders=folder ):
+            sys.exit(1)
+    except KeyboardInterrupt:
+        logger.success("tasl server stopped.")
+
+
+@cli.group()
+def cache():
+    """ Report on or prune the slides-from build cache. """
+    pass
+
+@cache.command()
+def stats():
+    """ Show build cache size and age. """
+    import time
+    from tasl.cache import get_cache_stats, get_cache_path
+    stats = get_cache_stats()
+    logger.success(f"Cache: {get_cache_path()}")
+    logger.success(f"Entries: {stats['entries']}")
+    logger.success(f"Size: {stats['size']/1024:.1f} KB")
+    if stats["entries"]:
+        logger.success(f"Least recently used: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats['oldest']))}")
+        logger.success(f"Most recently used: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats['newest']))}")
+
+@cache.command()
+@click.option("--max-entries",help="Keep at most N entries",type=click.IntRange(min=0),default=None)
+@click.option("--max-size",help="Keep at most this many MB of cached slides",type=click.FloatRange(min=0),default=None)
+@click.option("--older-than",help="Evict entries not used in this many days",type=click.FloatRange(min=0),default=None)
+@click.option("--all","clear",help="Evict every entry",is_flag=True, default=False)
+def prune(max_entries, max_size, older_than, clear):
+    """ Evict least recently used build cache entries. """
+    from tasl.cache import prune_cache
+    if clear:
+        max_entries = 0
+    if max_entries is None and max_size is None and older_than is None:
+        logger.warning("Nothing to prune.  Use --max-entries, --max-size, --older-than or --all")
+        return
+    evicted = prune_cache( max_entries=max_entries,
+                           max_size=None if max_size is None else int(max_size*1024*1024),
+                           older_than=None if older_than is None else older_than*86400 )
+    logger.success(f"Evicted {evicted} cache entries.")
+
+
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,492 @@
+"""
+Run many topic operations at once: `tasl batch ops.yaml`
+
+A batch is a list of operations on one topic folder, in YAML:
+
+    folder: topics
+    operations:
+      - op: tag
+        filters: ["+loop", "-stack"]
+        add: [week-3]
+      - op: rename
+        topic: loops
+        to: Loops and iteration
+      - op: scan
+        lecture: ../lectures/lect-03.qmd
+      - op: copy
+        topics: [loops-and-iteration]
+        destination: ../course/week-3
+
+or as NDJSON, one operation per line (use - to read it from stdin):
+
+    {"op": "tag", "topics": ["loops"], "remove": ["draft"]}
+
+The operations are:
+- tag: needs topics, or filters (with optional with_tags, without_tags and
+  match), plus any of add, remove and set.
+- rename: needs topic and to.
+- create: needs topic; template is optional.
+- delete: needs topics.
+- scan: needs lecture; overwrite, link and checksum are optional.
+- copy: needs topics and destination; overwrite, link and checksum are
+  optional.
+
+The cli names list, scanl and copy-to-folder also work.  Paths are relative
+to the current folder.
+
+The whole batch is checked before anything is read or written.  Topics that
+don't exist, or that an earlier operation renamed or deleted, are reported,
+as are names claimed twice, e.g. a rename onto a topic a scan creates.  The
+topics the batch touches are then loaded once.  Operations apply in order to
+this in-memory working set, so each one sees the results of those before it.
+At the end the changed files are written, stale ones removed, and copies
+made, each once.  Without --confirm nothing is written.
+"""
+import os
+import sys
+import json
+
+from loguru import logger
+
+from tasl import DEFAULT_IO_WORKERS
+from tasl.errors import BatchError, LectureReadError
+from tasl.output import write_file_if_changed
+
+# cli command names accepted as operation names
+OPERATION_ALIASES = { "list": "tag", "scanl": "scan", "copy-to-folder": "copy" }
+OPERATIONS = ( "tag", "rename", "create", "delete", "scan", "copy" )
+
+# where a topic name came from, for conflict messages
+ON_DISK = "the topic folder"
+
+
+def load_operations( path ):
+    """ read a batch file (YAML, or NDJSON for .ndjson/.jsonl files and - for stdin)
+
+    :return: (folder named in the file or None, list of operations)
+    """
+    import yaml
+
+    if path == "-" or os.path.splitext( path )[1] in ( ".ndjson", ".jsonl" ):
+        file = sys.stdin if path == "-" else open( path, 'r', encoding='utf-8' )
+        operations = []
+        problems = []
+        with file:
+            for number, line in enumerate( file, start=1 ):
+                if not line.strip():
+                    continue
+                try:
+                    operations.append( json.loads( line ) )
+                except ValueError as e:
+                    problems.append(f"line {number}: {e}")
+        if problems:
+            raise BatchError( problems )
+        return None, operations
+
+    with open( path, 'r', encoding='utf-8' ) as file:
+        try:
+            document = yaml.safe_load( file )
+        except yaml.YAMLError as e:
+            raise BatchError( [f"{path}: {e}"] ) from e
+    if isinstance( document, dict ):
+        return document.get("folder"), document.get("operations") or []
+    if isinstance( document, list ):
+        return None, document
+    raise BatchError( [f"{path}: expected a list of operations, or a mapping with 'operations'"] )
+
+
+def as_list( value ):
+    """ a list for a list, a tuple or a single value; [] for None """
+    if value is None:
+        return []
+    if isinstance( value, ( list, tuple ) ):
+        return [ str( item ) for item in value ]
+    return [ str( value ) ]
+
+
+def normalize_operation( number, raw, problems ):
+    """ return a checked copy of one operation, or None after adding to problems """
+    from tasl.utils import clean_topic_name
+
+    if not isinstance( raw, dict ):
+        problems.append(f"operation {number}: expected a mapping, got {raw!r}")
+        return None
+    op = OPERATION_ALIASES.get( raw.get("op"), raw.get("op") )
+    label = f"operation {number} ({op})"
+    if op not in OPERATIONS:
+        problems.append(f"operation {number}: unknown op {raw.get('op')!r}, expected one of {', '.join( OPERATIONS )}")
+        return None
+
+    operation = dict( op=op, label=label )
+    if op in ( "tag", "delete", "copy" ):
+        operation["topics"] = [ clean_topic_name( os.path.splitext( os.path.basename( name ) )[0].lstrip("_") )
+                                for name in as_list( raw.get("topics", raw.get("topic")) ) ]
+    if op == "tag":
+        operation.update( filters=as_list( raw.get("filters") ), with_tags=as_list( raw.get("with_tags") ),
+                          without_tags=as_list( raw.get("without_tags") ), match=raw.get("match", "token"),
+                          add=as_list( raw.get("add", raw.get("add_tag")) ), remove=as_list( raw.get("remove", raw.get("remove_tag")) ),
+                          set=None if raw.get("set") is None else as_list( raw.get("set") ) )
+        selected = operation["topics"] or operation["filters"] or operation["with_tags"] or operation["without_tags"]
+        if not selected:
+            problems.append(f"{label}: needs topics or filters")
+        if not ( operation["add"] or operation["remove"] or operation["set"] is not None ):
+            problems.append(f"{label}: needs add, remove or set")
+    elif op == "rename":
+        operation.update( topic=clean_topic_name( str( raw.get("topic", "") ).removesuffix(".qmd") ), to=str( raw.get("to", "") ) )
+        if not operation["topic"] or not clean_topic_name( operation["to"] ):
+            problems.append(f"{label}: needs topic and to")
+    elif op == "create":
+        operation.update( topic=str( raw.get("topic", "") ), template=raw.get("template") )
+        if not clean_topic_name( operation["topic"] ):
+            problems.append(f"{label}: needs topic")
+    elif op == "delete":
+        if not operation["topics"]:
+            problems.append(f"{label}: needs topics")
+    elif op == "scan":
+        operation.update( lecture=raw.get("lecture"), overwrite=bool( raw.get("overwrite", False) ),
+                          link=raw.get("link"), checksum=bool( raw.get("checksum", False) ) )
+        if not operation["lecture"]:
+            problems.append(f"{label}: needs lecture")
+    elif op == "copy":
+        operation.update( destination=raw.get("destination"), overwrite=bool( raw.get("overwrite", False) ),
+                          link=raw.get("link"), checksum=bool( raw.get("checksum", False) ) )
+        if not operation["topics"] or not operation["destination"]:
+            problems.append(f"{label}: needs topics and destination")
+    if op in ( "scan", "copy" ) and operation["link"] not in ( None, "hard", "reflink" ):
+        problems.append(f"{label}: link must be hard or reflink")
+    return operation
+
+
+def check_operations( operations, on_disk ):
+    """ check a batch before running it, by following topic names through the operations
+
+    Reads each lecture to be scanned, once; the blocks are kept on the
+    operation for the run.
+
+    :raises BatchError: listing every problem found
+    """
+    from tasl.utils import clean_topic_name, parse_lecture
+
+    # topic name -> who made it, ON_DISK or an operation label
+    names = { name: ON_DISK for name in on_disk }
+    # removed name -> the operation that renamed or deleted it
+    removed = {}
+    # destination wrapper path -> (topic, who made it) copied there
+    copies = {}
+    problems = []
+
+    def require( operation, name ):
+        if name in names:
+            return True
+        if name in removed:
+            problems.append(f"{operation['label']}: topic {name} was {removed[name]}")
+        else:
+            problems.append(f"{operation['label']}: topic {name} not found")
+        return False
+
+    def claim( operation, name, what ):
+        if name in names:
+            made_by = "already exists" if names[name] == ON_DISK else f"is created by {names[name]}"
+            problems.append(f"{operation['label']}: {what} {name}, which {made_by}")
+            return False
+        names[name] = operation["label"]
+        removed.pop( name, None )
+        return True
+
+    for operation in operations:
+        op = operation["op"]
+        if op in ( "tag", "delete", "copy" ):
+            for name in operation["topics"]:
+                if require( operation, name ) and op == "copy":
+                    path = os.path.abspath( os.path.join( operation["destination"], name + ".qmd" ) )
+                    earlier = copies.get( path )
+                    if earlier is not None and earlier != ( name, names[name] ):
+                        problems.append(f"{operation['label']}: copies a different topic {name} to {operation['destination']} than an earlier copy")
+                    copies[path] = ( name, names[name] )
+                elif op == "delete" and name in names:
+                    del names[name]
+                    removed[name] = f"deleted by {operation['label']}"
+        elif op == "rename":
+            source, target = operation["topic"], clean_topic_name( operation["to"] )
+            if require( operation, source ) and target != source:
+                made_by = names.pop( source )
+                if claim( operation, target, "renames to" ):
+                    removed[source] = f"renamed to {target} by {operation['label']}"
+                else:
+                    names[source] = made_by
+        elif op == "create":
+            claim( operation, clean_topic_name( operation["topic"] ), "creates" )
+        elif op == "scan":
+            try:
+                lecture = parse_lecture( operation["lecture"] )
+            except LectureReadError as e:
+                problems.append(f"{operation['label']}: {e}")
+                continue
+            operation["blocks"], operation["includes"] = lecture["blocks"], lecture["includes"]
+            seen = set()
+            for key, block in operation["blocks"]:
+                name = clean_topic_name( key )
+                if not name:
+                    problems.append(f"{operation['label']}: topic '{key}' in {operation['lecture']} has no usable name")
+                elif name in seen:
+                    logger.warning(f"Topic '{key}' appears more than once in {operation['lecture']}")
+                elif names.get( name ) not in ( None, ON_DISK ):
+                    problems.append(f"{operation['label']}: creates {name} from {operation['lecture']}, which is created by {names[name]}")
+                else:
+                    names.setdefault( name, operation["label"] )
+                    removed.pop( name, None )
+                seen.add( name )
+
+    if problems:
+        raise BatchError( problems )
+
+
+class WorkingSet:
+    """ the topics of one folder that a batch touches, loaded once and changed in memory
+
+    Each topic is a dict(name=, origin=, wrapper=[lines], topic=text, changed=, header=).
+    origin is the name the topic has on disk, or None for topics the batch
+    creates.  Nothing is written until flush().
+    """
+
+    def __init__( self, folder ):
+        from tasl.index import list_topic_pairs
+
+        self.folder = folder
+        self.on_disk = { filename[1:-4] for filename in list_topic_pairs( folder ) if filename.endswith(".qmd") }
+        self.topics = {}
+        # on-disk names already loaded, whatever they are called now
+        self.loaded = set()
+        # assets of scanned lectures: (lecture folder, asset, overwrite, link, checksum)
+        self.lecture_assets = []
+        # destination wrapper path -> dict(name=, destination=, wrapper=, topic=, overwrite=, link=, checksum=)
+        self.copies = {}
+
+    def get_path( self, name, folder=None ):
+        return os.path.join( folder or self.folder, name + ".qmd" ), os.path.join( folder or self.folder, "_" + name + ".qmd" )
+
+    def get( self, name ):
+        """ the topic called name, loading it from disk on first use, or None """
+        if name in self.topics:
+            return self.topics[name]
+        if name in self.on_disk and name not in self.loaded:
+            wrapper_path, topic_path = self.get_path( name )
+            with open( wrapper_path, 'r' ) as file:
+                wrapper = file.readlines()
+            with open( topic_path, 'r', encoding='utf-8' ) as file:
+                topic = file.read()
+            self.loaded.add( name )
+            self.topics[name] = dict( name=name, origin=name, wrapper=wrapper, topic=topic, changed=False, header=None )
+            return self.topics[name]
+        return None
+
+    def all( self ):
+        """ every topic, loading the rest of the folder """
+        for name in sorted( self.on_disk - self.loaded ):
+            self.get( name )
+        return [ self.topics[name] for name in sorted( self.topics ) ]
+
+    def add( self, name, wrapper, topic ):
+        self.topics[name] = dict( name=name, origin=None, wrapper=wrapper, topic=topic, changed=True, header=None )
+        return self.topics[name]
+
+    def set_wrapper( self, entry, wrapper ):
+        if wrapper != entry["wrapper"]:
+            entry.update( wrapper=wrapper, changed=True, header=None )
+
+    def get_tags( self, entry ):
+        """ tasl.tags of a topic's wrapper, as it is now """
+        import yaml
+        from tasl.utils import split_yaml_header, yaml_loader
+        from tasl.index import get_topic_tags
+
+        if entry["header"] is None:
+            try:
+                start_idx, end_idx = split_yaml_header( entry["wrapper"] )
+                entry["header"] = yaml.load( ''.join( entry["wrapper"][start_idx+1:end_idx] ), Loader=yaml_loader ) or {}
+            except ( ValueError, yaml.YAMLError ):
+                entry["header"] = {}
+        return get_topic_tags( entry["header"] )
+
+    def select( self, filters, with_tags, without_tags, match ):
+        """ topics matching filters, as search_files matches them against the index """
+        from tasl.utils import categorize_keywords
+        from tasl.index import text_matches
+
+        include, exclude = categorize_keywords( filters )
+
+        def matches( entry, keyword ):
+            return text_matches( entry["topic"].lower(), keyword, match=match )
+
+        selected = []
+        for entry in self.all():
+            tags = self.get_tags( entry )
+            if ( include or with_tags ) and not ( any( matches( entry, keyword ) for keyword in include )
+                                                   or any( tag.lower() in tags for tag in with_tags ) ):
+                continue
+            if any( matches( entry, keyword ) for keyword in exclude ) or any( tag.lower() in tags for tag in without_tags ):
+                continue
+            selected.append( entry )
+        return selected
+
+    def apply( self, operation ):
+        """ apply one checked operation to the working set """
+        getattr( self, "apply_" + operation["op"] )( operation )
+
+    def apply_tag( self, operation ):
+        from tasl.utils import change_tag_lines
+
+        if operation["topics"]:
+            entries = [ self.get( name ) for name in operation["topics"] ]
+        else:
+            entries = self.select( operation["filters"], operation["with_tags"], operation["without_tags"], operation["match"] )
+        changed = 0
+        for entry in entries:
+            wrapper, was_changed, tags = change_tag_lines( entry["wrapper"], add_tags=operation["add"], remove_tags=operation["remove"],
+                                                           set_tags=operation["set"] )
+            if was_changed:
+                self.set_wrapper( entry, wrapper )
+                changed += 1
+                logger.info("Tags of {}: {}", entry['name'], tags)
+        logger.success(f"{operation['label']}: tags changed on {changed} of {len( entries )} topics.")
+
+    def apply_rename( self, operation ):
+        from tasl.utils import clean_topic_name, update_yaml_header_lines
+
+        source, target = operation["topic"], clean_topic_name( operation["to"] )
+        entry = self.get( source )
+        old_include, new_include = "_" + source + ".qmd", "_" + target + ".qmd"
+        wrapper = [ line.replace( old_include, new_include ) for line in entry["wrapper"] ]
+        self.set_wrapper( entry, update_yaml_header_lines( wrapper, title=operation["to"] ) )
+        del self.topics[source]
+        entry["name"] = target
+        self.topics[target] = entry
+        logger.success(f"{operation['label']}: topic renamed from '{source}' to '{target}'")
+
+    def apply_create( self, operation ):
+        from tasl.utils import clean_topic_name, get_wrapper_contents, get_topic_contents
+
+        name = clean_topic_name( operation["topic"] )
+        template = operation["template"]
+        wrapper_template = None if template is None else os.path.join( self.folder, template + ".qmd" )
+        topic_template = None if template is None else os.path.join( self.folder, "_" + template + ".qmd" )
+        wrapper = get_wrapper_contents( operation["topic"], "_" + name + ".qmd", template=wrapper_template )
+        self.add( name, wrapper.splitlines( keepends=True ), get_topic_contents( operation["topic"], template=topic_template ) )
+        logger.success(f"{operation['label']}: topic created: '{operation['topic']}'")
+
+    def apply_delete( self, operation ):
+        for name in operation["topics"]:
+            self.get( name )
+            del self.topics[name]
+            logger.success(f"{operation['label']}: topic {name} deleted.")
+
+    def apply_scan( self, operation ):
+        from tasl.utils import clean_topic_name, get_wrapper_contents, update_yaml_header_lines, get_lecture_source, get_lecture_tags, \
+            extract_asset_files
+
+        lecture = operation["lecture"]
+        lecture_folder = os.path.dirname( lecture ) or "."
+        tasl = dict( source=get_lecture_source( lecture ), tags=get_lecture_tags( lecture ) )
+        for key, block in operation["blocks"]:
+            name = clean_topic_name( key )
+            entry = self.get( name )
+            if entry is None:
+                wrapper = get_wrapper_contents( key, "_" + name + ".qmd" )
+                entry = self.add( name, wrapper.splitlines( keepends=True ), f"\n# {key}\n" + "".join( block ) )
+            else:
+                logger.warning(f"Topic ({key}) already exists.  Topic file kept.")
+            self.set_wrapper( entry, update_yaml_header_lines( entry["wrapper"], tasl=dict( topic=key, **tasl ) ) )
+            for asset in extract_asset_files( block ):
+                self.lecture_assets.append( ( lecture_folder, asset, operation["overwrite"], operation["link"], operation["checksum"] ) )
+        for include in operation["includes"]:
+            logger.success(f"Includes: {include}")
+        logger.success(f"{operation['label']}: {len( operation['blocks'] )} topics from {lecture}")
+
+    def apply_copy( self, operation ):
+        for name in operation["topics"]:
+            entry = self.get( name )
+            path = os.path.abspath( os.path.join( operation["destination"], name + ".qmd" ) )
+            # a later copy of the same topic to the same place replaces the earlier one
+            self.copies[path] = dict( name=name, destination=operation["destination"], wrapper="".join( entry["wrapper"] ),
+                                      topic=entry["topic"], overwrite=operation["overwrite"], link=operation["link"],
+                                      checksum=operation["checksum"] )
+        logger.success(f"{operation['label']}: {len( operation['topics'] )} topics to copy to {operation['destination']}")
+
+    def plan( self ):
+        """ return (files to write as [(path, text)], files to remove, copies) """
+        writes = []
+        for name, entry in sorted( self.topics.items() ):
+            if entry["changed"] or entry["origin"] != name:
+                wrapper_path, topic_path = self.get_path( name )
+                writes.append( ( wrapper_path, "".join( entry["wrapper"] ) ) )
+                if entry["origin"] != name:
+                    writes.append( ( topic_path, entry["topic"] ) )
+        # files of topics renamed or deleted, unless another topic now has the name
+        removes = []
+        for name in sorted( self.loaded - set( self.topics ) ):
+            removes.extend( self.get_path( name ) )
+        return writes, removes, list( self.copies.values() )
+
+    def flush( self, io_workers=DEFAULT_IO_WORKERS ):
+        """ write the working set back: topic files, then lecture assets, then copies.  Returns [(file, error)] for failed copies. """
+        from tasl.utils import copy_files_to_destination, extract_filenames, load_yaml_header
+
+        writes, removes, copies = self.plan()
+        for path, text in writes:
+            write_file_if_changed( path, text )
+        for path in removes:
+            if os.path.exists( path ):
+                os.remove( path )
+                logger.info("Removed {}", path)
+        load_yaml_header.cache_clear()
+
+        errors = []
+        # lecture assets, grouped so each group is one pool of copies
+        groups = {}
+        for lecture_folder, asset, overwrite, link, checksum in self.lecture_assets:
+            groups.setdefault( ( lecture_folder, overwrite, link, checksum ), {} )[asset] = asset
+        for ( lecture_folder, overwrite, link, checksum ), assets in groups.items():
+            errors += copy_files_to_destination( self.folder, assets, overwrite=overwrite, confirm=True, link=link, checksum=checksum,
+                                                 io_workers=io_workers, source_folder=lecture_folder )
+
+        groups = {}
+        for job in copies:
+            os.makedirs( job["destination"], exist_ok=True )
+            for path, text in zip( self.get_path( job["name"], job["destination"] ), ( job["wrapper"], job["topic"] ) ):
+                if os.path.exists( path ) and not job["overwrite"]:
+                    logger.info("Skipped {} (already exists)", path)
+                else:
+                    write_file_if_changed( path, text )
+            assets = groups.setdefault( ( job["destination"], job["overwrite"], job["link"], job["checksum"] ), {} )
+            for asset in extract_filenames( job["topic"] ):
+                assets[asset] = asset
+        for ( destination, overwrite, link, checksum ), assets in groups.items():
+            errors += copy_files_to_destination( destination, assets, overwrite=overwrite, confirm=True, link=link, checksum=checksum,
+                                                 io_workers=io_workers, source_folder=self.folder )
+        return errors
+
+
+def run_batch( operations, folder=".", confirm=False, io_workers=DEFAULT_IO_WORKERS ):
+    """ check, apply and (with confirm=True) write a batch of operations on the topics in folder
+
+    :return: dict(writes=, removes=, copies=, errors=[(file, error)])
+    :raises BatchError: the batch is malformed or its operations conflict.  Nothing is read or written.
+    """
+    problems = []
+    checked = [ normalize_operation( number, raw, problems ) for number, raw in enumerate( operations, start=1 ) ]
+    if problems:
+        raise BatchError( problems )
+
+    working_set = WorkingSet( folder )
+    check_operations( checked, working_set.on_disk )
+    for operation in checked:
+        working_set.apply( operation )
+
+    writes, removes, copies = working_set.plan()
+    summary = dict( writes=len( writes ), removes=len( removes ), copies=len( copies ), errors=[] )
+    if not confirm:
+        logger.success(f"NOT writing {len( writes )} topic files, removing {len( removes )} and copying {len( copies )} topics.  Use --confirm")
+        return summary
+    summary["errors"] = working_set.flush( io_workers=io_workers )
+    logger.success(f"Batch of {len( checked )} operations: {len( writes )} topic files written, {len( removes )} removed, {len( copies )} topics copied.")
+    return summary
@@ -0,0 +1,151 @@
+"""
+Content-addressed build cache for slides_from_qmd
+
+Each entry is keyed on a hash of the guide QMD, its rendered HTML, the tasl
+version and the slide template handlers.  A hit lets slides-from write the
+cached slides without parsing anything.  Entries are evicted least recently
+used first by `tasl cache prune`.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+
+from loguru import logger
+
+from tasl.index import INDEX_FOLDER
+
+CACHE_FILENAME = "cache.db"
+
+SCHEMA_VERSION = 1
+
+
+def get_cache_path( directory_path="." ):
+    """ return path to the build cache database """
+    return os.path.join( directory_path, INDEX_FOLDER, CACHE_FILENAME )
+
+
+def get_tasl_version():
+    """ return installed tasl version, or 'unknown' when running from a source tree """
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version("tasl")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def open_build_cache( directory_path="." ):
+    """ open (and create, if needed) the build cache database """
+    cache_path = get_cache_path( directory_path )
+    os.makedirs( os.path.dirname( cache_path ), exist_ok=True )
+    conn = sqlite3.connect( cache_path, timeout=30 )
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS entries")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            source TEXT,
+            title TEXT,
+            output TEXT,
+            size INTEGER,
+            created REAL,
+            last_used REAL
+        )""")
+    conn.commit()
+    return conn
+
+
+def build_cache_key( input_files, handlers ):
+    """ return a hash of input_files' bytes, the tasl version and the handler set, or None if an input is missing """
+    digest = hashlib.sha256()
+    digest.update( get_tasl_version().encode('utf-8') )
+    for handler in handlers:
+        digest.update( b"\0" + handler.encode('utf-8') )
+    for filename in input_files:
+        try:
+            with open( filename, 'rb' ) as file:
+                data = file.read()
+        except OSError:
+            return None
+        digest.update( b"\0" + str( len( data ) ).encode('ascii') + b"\0" + data )
+    return digest.hexdigest()
+
+
+def lookup_build( key, directory_path="." ):
+    """ return (title, output) cached for key, or None.  A hit refreshes the entry's LRU time. """
+    if key is None:
+        return None
+    try:
+        conn = open_build_cache( directory_path )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Build cache unavailable: {e}")
+        return None
+    try:
+        row = conn.execute("SELECT title, output FROM entries WHERE key=?", ( key, ) ).fetchone()
+        if row is not None:
+            with conn:
+                conn.execute("UPDATE entries SET last_used=? WHERE key=?", ( time.time(), key ) )
+        return row
+    finally:
+        conn.close()
+
+
+def store_build( key, source, title, output, directory_path="." ):
+    """ remember output for key """
+    if key is None:
+        return
+    try:
+        conn = open_build_cache( directory_path )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Build cache unavailable: {e}")
+        return
+    try:
+        now = time.time()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?)",
+                         ( key, source, title, output, len( output.encode('utf-8') ), now, now ) )
+    finally:
+        conn.close()
+
+
+def get_cache_stats( directory_path="." ):
+    """ return dict(entries=, size=, oldest=, newest=) for the build cache """
+    conn = open_build_cache( directory_path )
+    try:
+        entries, size, oldest, newest = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size),0), MIN(last_used), MAX(last_used) FROM entries").fetchone()
+        return dict( entries=entries, size=size, oldest=oldest, newest=newest )
+    finally:
+        conn.close()
+
+
+def prune_cache( max_entries=None, max_size=None, older_than=None, directory_path="." ):
+    """ evict least recently used entries until the cache is within limits.  Returns number evicted.
+
+    :param max_entries: keep at most this many entries
+    :param max_size: keep at most this many bytes of cached output
+    :param older_than: evict entries not used in this many seconds
+    """
+    conn = open_build_cache( directory_path )
+    try:
+        rows = conn.execute("SELECT key, size, last_used FROM entries ORDER BY last_used DESC").fetchall()
+        now = time.time()
+        keep_size = 0
+        full = False
+        evict = []
+        for i, ( key, size, last_used ) in enumerate( rows ):
+            # once a limit is reached everything less recently used goes too
+            full = full or ( max_entries is not None and i >= max_entries ) \
+                        or ( max_size is not None and keep_size + size > max_size )
+            if full or ( older_than is not None and now - last_used > older_than ):
+                evict.append( key )
+            else:
+                keep_size += size
+        with conn:
+            conn.executemany("DELETE FROM entries WHERE key=?", [ ( key, ) for key in evict ] )
+        conn.execute("VACUUM")
+        return len( evict )
+    finally:
+        conn.close()
@@ -0,0 +1,42 @@
+"""
+Exceptions raised by tasl
+
+The cli reports any TaslError as an error message and exits with status 1.
+Code using tasl as a library (see tasl.library.TopicLibrary) can catch them.
+"""
+
+
+class TaslError(Exception):
+    """ base class for the errors tasl raises """
+
+
+class TopicExistsError(TaslError):
+    """ a topic (or one of its files) already exists where a new one would go """
+
+
+class TopicNotFoundError(TaslError):
+    """ a topic's wrapper or _topic file is missing """
+
+
+class TopicWriteError(TaslError):
+    """ a topic file could not be written """
+
+
+class LectureReadError(TaslError):
+    """ a lecture could not be read for scanning """
+
+
+class NotInGitRepositoryError(TaslError):
+    """ a lecture is not inside a git repository, so its source path can't be recorded """
+
+
+class ConversionError(TaslError):
+    """ a guide file could not be converted to slides """
+
+
+class BatchError(TaslError):
+    """ a batch of operations is malformed or its operations conflict.  Nothing has been written. """
+
+    def __init__( self, problems ):
+        self.problems = problems
+        super().__init__( "\n".join( problems ) )
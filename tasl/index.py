@@ -0,0 +1,215 @@
+"""
+Persistent topic index
+
+Topic metadata (wrapper YAML, tasl tags, title) and the words of each topic
+body are kept in a small SQLite database in `.tasl/index.db` inside the topic
+folder.  Rows are refreshed from (mtime_ns, size) of the wrapper and topic
+files, so an unchanged topic is never reopened.
+
+An inverted index (token -> topics) over the topic bodies answers +word/-word
+filters with set operations.  The bodies themselves are not stored: phrase
+and substring checks read the candidate topic files.
+"""
+import os
+import re
+import json
+import sqlite3
+import hashlib
+
+from loguru import logger
+
+INDEX_FOLDER = ".tasl"
+INDEX_FILENAME = "index.db"
+
+# bump when the table layout changes.  Old indexes are rebuilt from scratch.
+SCHEMA_VERSION = 3
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# how +word/-word filters are matched against topic bodies
+MATCH_TOKEN = "token"
+MATCH_SUBSTRING = "substring"
+
+def get_index_path( directory_path ):
+    """ return path to the index database for a topic folder """
+    return os.path.join( directory_path, INDEX_FOLDER, INDEX_FILENAME )
+
+
+def open_topic_index( directory_path ):
+    """ open (and create, if needed) the index database for a topic folder """
+    index_path = get_index_path( directory_path )
+    os.makedirs( os.path.dirname( index_path ), exist_ok=True )
+    conn = sqlite3.connect( index_path, timeout=30 )
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        logger.debug("rebuilding topic index: {}", index_path)
+        conn.execute("DROP TABLE IF EXISTS topics")
+        conn.execute("DROP TABLE IF EXISTS postings")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS topics (
+            filename TEXT PRIMARY KEY,
+            topic_mtime_ns INTEGER,
+            topic_size INTEGER,
+            wrapper_mtime_ns INTEGER,
+            wrapper_size INTEGER,
+            title TEXT,
+            yaml TEXT,
+            tags TEXT,
+            fingerprint TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS postings (
+            token TEXT,
+            filename TEXT,
+            PRIMARY KEY (token, filename)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS postings_filename ON postings (filename)")
+    conn.commit()
+    return conn
+
+
+def list_topic_pairs( directory_path ):
+    """ return topic files (_name.qmd) that have a matching wrapper (name.qmd) """
+    files = os.listdir( directory_path )
+    names = set( files )
+    return [file for file in files if str(file).startswith("_") and file[1:] in names]
+
+
+def tokenize( text ):
+    """ return the set of lowercased word tokens in text """
+    return set( TOKEN_PATTERN.findall( text.lower() ) )
+
+
+def get_topic_tags( header ):
+    """ return tasl.tags from a wrapper header, or [] """
+    tasl = header.get("tasl") if isinstance( header, dict ) else None
+    if isinstance( tasl, dict ) and isinstance( tasl.get("tags"), list ):
+        return tasl["tags"]
+    return []
+
+
+def read_topic_row( directory_path, filename ):
+    """ read a topic and its wrapper from disk, returning values for the index """
+    from tasl.utils import get_yaml_header
+
+    file_path = os.path.join( directory_path, filename )
+    with open( file_path, 'r', encoding='utf-8' ) as file:
+        content = file.read()
+    header = get_yaml_header( os.path.join( directory_path, filename[1:] ) )
+    title = header.get("title") if isinstance( header.get("title"), str ) else None
+    fingerprint = hashlib.sha256( content.encode('utf-8') ).hexdigest()
+    return dict( title=title, yaml=header, tags=get_topic_tags( header ),
+                 fingerprint=fingerprint, content=content.lower() )
+
+
+def read_topic_text( directory_path, filename ):
+    """ lowercased body of a topic file, or "" if it can no longer be read """
+    try:
+        with open( os.path.join( directory_path, filename ), 'r', encoding='utf-8' ) as file:
+            return file.read().lower()
+    except ( OSError, UnicodeDecodeError ) as e:
+        logger.debug("unable to read {}: {}", filename, e)
+        return ""
+
+
+def refresh_topic_index( conn, directory_path ):
+    """ bring the index up to date with the topic folder.  Returns number of topics reread. """
+    known = {}
+    for row in conn.execute("SELECT filename, topic_mtime_ns, topic_size, wrapper_mtime_ns, wrapper_size FROM topics"):
+        known[row[0]] = tuple( row[1:] )
+
+    present = set()
+    reread = 0
+    with conn:
+        for filename in list_topic_pairs( directory_path ):
+            file_path = os.path.join( directory_path, filename )
+            if not os.path.isfile( file_path ):
+                continue
+            topic_stat = os.stat( file_path )
+            wrapper_stat = os.stat( os.path.join( directory_path, filename[1:] ) )
+            stamp = ( topic_stat.st_mtime_ns, topic_stat.st_size, wrapper_stat.st_mtime_ns, wrapper_stat.st_size )
+            present.add( filename )
+            if known.get( filename ) == stamp:
+                continue
+
+            logger.debug("indexing: {}", filename)
+            row = read_topic_row( directory_path, filename )
+            conn.execute("INSERT OR REPLACE INTO topics VALUES (?,?,?,?,?,?,?,?,?)",
+                         ( filename, *stamp, row["title"], json.dumps( row["yaml"], default=str ),
+                           json.dumps( row["tags"], default=str ), row["fingerprint"] ) )
+            conn.execute("DELETE FROM postings WHERE filename=?", ( filename, ) )
+            conn.executemany("INSERT INTO postings VALUES (?,?)",
+                             [ ( token, filename ) for token in tokenize( row["content"] ) ] )
+            reread += 1
+
+        for filename in set( known ) - present:
+            logger.debug("dropping from index: {}", filename)
+            conn.execute("DELETE FROM topics WHERE filename=?", ( filename, ) )
+            conn.execute("DELETE FROM postings WHERE filename=?", ( filename, ) )
+
+    logger.debug("topic index: {} topics, {} reread", len(present), reread)
+    return reread
+
+
+def load_topic_headers( conn ):
+    """ return wrapper headers for every indexed topic, keyed and ordered by topic filename """
+    headers = {}
+    for filename, yaml_text in conn.execute("SELECT filename, yaml FROM topics ORDER BY filename"):
+        headers[filename] = json.loads( yaml_text )
+    return headers
+
+
+def parse_keyword( keyword, match=MATCH_TOKEN ):
+    """ return (keyword, tokens, check_text) describing how a +word/-word keyword matches a topic body
+
+    keyword is lowercased.  Every one of tokens must be a whole word of the
+    body, and with check_text the body must also contain keyword itself.  In
+    token mode a single plain word is answered by its token alone; a phrase
+    or a keyword with punctuation (c++, node.js) is also checked as text, so
+    "c++" doesn't match a topic that only says "c".  Substring mode, and
+    keywords without any word characters, are plain text checks.
+    """
+    keyword = keyword.lower()
+    tokens = TOKEN_PATTERN.findall( keyword )
+    if match == MATCH_SUBSTRING or len( tokens ) == 0:
+        return keyword, [], True
+    return keyword, tokens, tokens != [ keyword ]
+
+
+def text_matches( text, keyword, match=MATCH_TOKEN ):
+    """ True if text (a lowercased topic body) matches keyword, by the rules of parse_keyword """
+    keyword, tokens, check_text = parse_keyword( keyword, match=match )
+    if tokens and not set( tokens ) <= tokenize( text ):
+        return False
+    return not check_text or keyword in text
+
+
+def match_keyword( conn, directory_path, keyword, match=MATCH_TOKEN ):
+    """ return the set of topic filenames whose body matches keyword, by the rules of parse_keyword
+
+    Tokens are looked up in the posting lists; only the topics holding all
+    of them are read for a text check.
+    """
+    keyword, tokens, check_text = parse_keyword( keyword, match=match )
+    if tokens:
+        matches = None
+        for token in tokens:
+            hits = { row[0] for row in conn.execute("SELECT filename FROM postings WHERE token=?", ( token, ) ) }
+            matches = hits if matches is None else matches & hits
+            if not matches:
+                return set()
+    else:
+        matches = { row[0] for row in conn.execute("SELECT filename FROM topics") }
+
+    if check_text:
+        matches = { filename for filename in matches if keyword in read_topic_text( directory_path, filename ) }
+    return matches
+
+
+def match_keywords( conn, directory_path, keywords, match=MATCH_TOKEN ):
+    """ return the set of topic filenames matching any of keywords """
+    matches = set()
+    for keyword in keywords:
+        matches |= match_keyword( conn, directory_path, keyword, match=match )
+    return matches
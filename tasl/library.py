@@ -0,0 +1,187 @@
+"""
+tasl as a library
+
+TopicLibrary drives the same code as the cli from Python, for build scripts
+that handle many topics in one interpreter.  Methods return plain dicts and
+lists, and raise the exceptions in tasl.errors instead of exiting.
+
+    from tasl import TopicLibrary, TopicExistsError
+
+    library = TopicLibrary("topics")
+    library.scan("lectures/lect-01.qmd")
+    for topic in library.search("+loop", "-stack", with_tags=["python"]):
+        print(topic["name"], topic["tags"])
+    library.tag(["loops"], add_tags=["week-3"])
+    library.copy_to(["loops"], "course/week-3")
+
+Progress is still logged through loguru, as it is for the cli.  Call
+logger.disable("tasl") to silence it.
+
+Paths inside a library (assets/..., the _topic file of a wrapper) are
+resolved against the library folder, not the current folder.
+"""
+import os
+
+from tasl import DEFAULT_IO_WORKERS
+from tasl.errors import TopicExistsError, TopicNotFoundError
+
+
+class TopicLibrary:
+    """ a folder of topics: name.qmd wrappers, each with a _name.qmd topic file """
+
+    def __init__( self, path="." ):
+        if not os.path.isdir( path ):
+            raise TopicNotFoundError(f"Topic library {path} is not a folder")
+        self.path = path
+
+    def __repr__( self ):
+        return f"TopicLibrary({self.path!r})"
+
+    def get_name( self, name ):
+        """ topic name (wrapper basename) for a name, wrapper or _topic file name """
+        name = os.path.basename( name )
+        if name.endswith(".qmd"):
+            name = name[:-4]
+        return name[1:] if name.startswith("_") else name
+
+    def get_wrapper( self, name ):
+        """ path of the wrapper file of a topic, which must exist """
+        name = self.get_name( name )
+        wrapper = os.path.join( self.path, name + ".qmd" )
+        for filename in ( wrapper, os.path.join( self.path, "_" + name + ".qmd" ) ):
+            if not os.path.isfile( filename ):
+                raise TopicNotFoundError(f"Topic {name}: {filename} not found in {self.path}")
+        return wrapper
+
+    def get_topic( self, name ):
+        """ return dict(name=, wrapper=, topic_file=, title=, tags=) for a topic """
+        from tasl.utils import get_yaml_header
+
+        wrapper = self.get_wrapper( name )
+        header = get_yaml_header( wrapper )
+        tasl = header.get("tasl") if isinstance( header.get("tasl"), dict ) else {}
+        name = self.get_name( name )
+        return dict( name=name, wrapper=wrapper, topic_file=os.path.join( self.path, "_" + name + ".qmd" ),
+                     title=header.get("title"), tags=list( tasl.get("tags") or [] ) )
+
+    def names( self ):
+        """ names of every topic in the library, sorted """
+        from tasl.index import list_topic_pairs
+        return sorted( self.get_name( filename ) for filename in list_topic_pairs( self.path ) )
+
+    def search( self, *filters, with_tags=None, without_tags=None, match="token" ):
+        """ topics matching filters, as for `tasl list`
+
+        :param filters: "+word" to include topics with word, "-word" to exclude them
+        :param with_tags: also include topics with any of these tags
+        :param without_tags: exclude topics with any of these tags
+        :param match: "token" for whole words, "substring" to match anywhere
+        :return: list of topic dicts, see get_topic
+        """
+        from tasl.utils import categorize_keywords, search_files
+
+        include, exclude = categorize_keywords( filters )
+        result_files, result_tags = search_files( self.path, include, exclude, with_tags=with_tags, without_tags=without_tags, match=match )
+        return [ self.get_topic( filename ) for filename in result_files ]
+
+    def create( self, topic, template=None ):
+        """ create a new topic, optionally from template (a template file basename in the library, e.g. "template1")
+
+        :return: topic dict, see get_topic
+        :raises TopicExistsError: the topic's wrapper or _topic file already exists
+        """
+        from tasl.utils import add_new_topic, clean_topic_name
+
+        name = clean_topic_name( topic )
+        for filename in ( name + ".qmd", "_" + name + ".qmd" ):
+            if os.path.exists( os.path.join( self.path, filename ) ):
+                raise TopicExistsError(f"Topic {topic}: {filename} already exists in {self.path}")
+        template_base = None if template is None else os.path.join( self.path, template )
+        add_new_topic( topic, template_base=template_base, destination=self.path )
+        return self.get_topic( name )
+
+    def scan( self, lecture, overwrite=False, link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS ):
+        """ split a lecture into topics in this library, as `tasl scanl --confirm`
+
+        Assets are found relative to the lecture's folder.
+
+        :return: dict(topics=[topic dicts], includes=[files the lecture includes], errors=[(asset, error)])
+        :raises LectureReadError: the lecture could not be read
+        :raises NotInGitRepositoryError: the lecture is not inside a git repository
+        """
+        from tasl.utils import scan_for_topics, clean_topic_name
+
+        result = scan_for_topics( lecture, confirm=True, overwrite=overwrite, destination=self.path, link=link, checksum=checksum,
+                                  io_workers=io_workers, source_folder=os.path.dirname( lecture ) or "." )
+        return dict( topics=[ self.get_topic( clean_topic_name( key ) ) for key in result["topics"] ],
+                     includes=result["includes"], errors=result["errors"] )
+
+    def tag( self, names, add_tags=(), remove_tags=(), set_tags=None, io_workers=DEFAULT_IO_WORKERS ):
+        """ change the tags of topics
+
+        :param names: topic names (or wrapper file names)
+        :param add_tags: tags to add
+        :param remove_tags: tags to remove
+        :param set_tags: if not None, replace the tags with these before adding and removing
+        :return: list of dict(filename=, changed=, tags=, error=), one per topic
+        :raises TopicNotFoundError: a topic is not in the library.  No tags are changed.
+        """
+        from tasl.utils import mutate_tags
+
+        wrappers = [ self.get_wrapper( name ) for name in names ]
+        return mutate_tags( wrappers, add_tags=add_tags, remove_tags=remove_tags, set_tags=set_tags, workers=io_workers )
+
+    def rename( self, name, new_topic ):
+        """ rename a topic, its files and its title to new_topic
+
+        :return: topic dict for the renamed topic
+        :raises TopicNotFoundError: the topic is not in the library
+        :raises TopicExistsError: a topic already has the new name
+        """
+        from tasl.utils import rename_topic_file, clean_topic_name
+
+        self.get_wrapper( name )
+        new_name = clean_topic_name( new_topic )
+        for filename in ( new_name + ".qmd", "_" + new_name + ".qmd" ):
+            if os.path.exists( os.path.join( self.path, filename ) ):
+                raise TopicExistsError(f"Topic {new_topic}: {filename} already exists in {self.path}")
+        rename_topic_file( self.get_name( name ), new_topic, confirm=True, directory_path=self.path )
+        return self.get_topic( new_name )
+
+    def copy_to( self, names, destination, overwrite=False, link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS ):
+        """ copy topics, with their assets, to destination, as `tasl copy-to-folder --confirm`
+
+        :return: dict(topics=[names copied], errors=[(file, error)] for files that could not be copied)
+        :raises TopicNotFoundError: a topic is not in the library.  Nothing is copied.
+        """
+        from tasl.utils import copy_topic_files_to_folder
+
+        wrappers = [ self.get_wrapper( name ) for name in names ]
+        os.makedirs( destination, exist_ok=True )
+        errors = copy_topic_files_to_folder( wrappers, confirm=True, overwrite=overwrite, destination=destination,
+                                             link=link, checksum=checksum, io_workers=io_workers )
+        failed = set( os.path.basename( file ) for file, error in errors )
+        copied = [ self.get_name( wrapper ) for wrapper in wrappers
+                   if os.path.basename( wrapper ) not in failed and "_" + os.path.basename( wrapper ) not in failed ]
+        return dict( topics=copied, errors=errors )
+
+    def slides_from( self, guide_files, force=False, link=None, checksum=False ):
+        """ build slides in this folder from guide chapters, as `tasl slides-from --confirm`
+
+        The library folder is treated as the slides folder: guide files are
+        read from ../guide and their rendered HTML from ../docs/guide.
+
+        :param guide_files: guide chapter file names, e.g. ["ch01.qmd"]
+        :return: list of dict(file=, title=, cached=, error=), one per guide file.  error is None on success.
+        """
+        from tasl.errors import ConversionError
+        from tasl.slides_from_guide import slides_from_qmd
+
+        results = []
+        for guide_file in guide_files:
+            try:
+                built = slides_from_qmd( os.path.basename( guide_file ), force=force, link=link, checksum=checksum, folder=self.path )
+                results.append( dict( file=guide_file, error=None, **built ) )
+            except ( ConversionError, OSError ) as e:
+                results.append( dict( file=guide_file, title=None, cached=False, error=e ) )
+        return results
@@ -0,0 +1,215 @@
+"""
+Output writer
+
+File output from tasl goes through here.  New content is compared with what
+is already on disk first, so unchanged files keep their mtime and Quarto's
+freeze/incremental render leaves them alone.  Writes go to a temp file in the
+same folder and are renamed into place, so a reader never sees half a file.
+
+Asset files are synced rsync-style: a destination with the same size and
+mtime (or, with checksum=True, the same bytes) is skipped, anything else is
+copied, hardlinked or reflinked into place.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+
+from loguru import logger
+
+# files written / left unchanged by this process
+write_stats = Counter()
+write_stats_lock = threading.Lock()
+
+# mkstemp creates files 0600.  New files get the usual umask'd permissions instead.
+_umask = os.umask(0)
+os.umask(_umask)
+
+COMPARE_CHUNK = 1024 * 1024
+
+# ways sync_file can put a file in place
+LINK_HARD = "hard"
+LINK_REFLINK = "reflink"
+LINK_MODES = ( LINK_HARD, LINK_REFLINK )
+
+# Linux ioctl to share extents between files (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def count_write( key, n=1 ):
+    """ add n to one of the write counters """
+    with write_stats_lock:
+        write_stats[key] += n
+
+
+def get_write_stats():
+    """ return a copy of the write counters """
+    with write_stats_lock:
+        return dict( write_stats )
+
+
+def merge_write_stats( stats ):
+    """ add counters from another process (e.g. a slides-from worker) """
+    with write_stats_lock:
+        write_stats.update( stats )
+
+
+def format_bytes( size ):
+    """ human readable byte count """
+    for unit in ( "B", "KB", "MB", "GB" ):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size = size / 1024
+
+
+def report_write_stats():
+    """ log how many files were written and left unchanged, and assets synced, if any """
+    stats = get_write_stats()
+    if stats.get("written", 0) or stats.get("unchanged", 0):
+        logger.success(f"Files: {stats.get('written', 0)} written, {stats.get('unchanged', 0)} unchanged.")
+    if stats.get("copied", 0) or stats.get("linked", 0) or stats.get("skipped", 0):
+        logger.success(f"Assets: {stats.get('copied', 0)} copied ({format_bytes(stats.get('copied_bytes', 0))}), "
+                       f"{stats.get('linked', 0)} linked ({format_bytes(stats.get('linked_bytes', 0))}), "
+                       f"{stats.get('skipped', 0)} skipped ({format_bytes(stats.get('skipped_bytes', 0))}).")
+
+
+def file_has_bytes( filename, data ):
+    """ True if filename exists and holds exactly data """
+    try:
+        if os.path.getsize( filename ) != len( data ):
+            return False
+        with open( filename, 'rb' ) as file:
+            return file.read() == data
+    except OSError:
+        return False
+
+
+def files_are_identical( first, second ):
+    """ True if both files exist and have the same size and bytes """
+    try:
+        if os.path.getsize( first ) != os.path.getsize( second ):
+            return False
+        with open( first, 'rb' ) as a, open( second, 'rb' ) as b:
+            while True:
+                chunk = a.read( COMPARE_CHUNK )
+                if chunk != b.read( COMPARE_CHUNK ):
+                    return False
+                if not chunk:
+                    return True
+    except OSError:
+        return False
+
+
+def make_temp_file( filename ):
+    """ return path of a new, empty temp file next to filename """
+    folder = os.path.dirname( os.path.abspath( filename ) )
+    fd, temp_file = tempfile.mkstemp( dir=folder, prefix="." + os.path.basename( filename ) + ".", suffix=".tmp" )
+    os.close( fd )
+    return temp_file
+
+
+def atomic_write_bytes( filename, data ):
+    """ write data to filename through a temp file and rename """
+    temp_file = make_temp_file( filename )
+    try:
+        with open( temp_file, 'wb' ) as file:
+            file.write( data )
+        if os.path.exists( filename ):
+            shutil.copymode( filename, temp_file )
+        else:
+            os.chmod( temp_file, 0o666 & ~_umask )
+        os.replace( temp_file, filename )
+    except BaseException:
+        if os.path.exists( temp_file ):
+            os.remove( temp_file )
+        raise
+
+
+def write_file_if_changed( filename, contents, encoding="utf-8" ):
+    """ write text contents to filename unless it already holds them.  Returns True if written. """
+    if os.linesep != "\n":
+        # match what a text mode write would have produced
+        contents = contents.replace( "\n", os.linesep )
+    data = contents.encode( encoding )
+    if file_has_bytes( filename, data ):
+        logger.debug("unchanged: {}", filename)
+        count_write("unchanged")
+        return False
+    atomic_write_bytes( filename, data )
+    count_write("written")
+    return True
+
+
+def is_up_to_date( source, destination, checksum=False ):
+    """ rsync's quick check: True if destination has source's size and mtime (or bytes, with checksum=True) """
+    try:
+        source_stat = os.stat( source )
+        destination_stat = os.stat( destination )
+    except OSError:
+        return False
+    if os.path.samestat( source_stat, destination_stat ):
+        return True
+    if source_stat.st_size != destination_stat.st_size:
+        return False
+    if checksum:
+        return files_are_identical( source, destination )
+    # whole seconds, as rsync does, so filesystems with coarse timestamps still match
+    return int( source_stat.st_mtime ) == int( destination_stat.st_mtime )
+
+
+def reflink_file( source, destination ):
+    """ clone source into destination without copying data.  Raises OSError where unsupported. """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflinks are not supported on this platform")
+    with open( source, 'rb' ) as src, open( destination, 'wb' ) as dst:
+        fcntl.ioctl( dst.fileno(), FICLONE, src.fileno() )
+    shutil.copystat( source, destination )
+
+
+def place_file( source, temp_file, link=None ):
+    """ put source at temp_file by hardlink, reflink or copy.  Returns "linked" or "copied". """
+    if link == LINK_HARD:
+        try:
+            os.remove( temp_file )
+            os.link( source, temp_file )
+            return "linked"
+        except OSError as e:
+            logger.debug("hardlink failed, copying {}: {}", source, e)
+    elif link == LINK_REFLINK:
+        try:
+            reflink_file( source, temp_file )
+            return "linked"
+        except OSError as e:
+            logger.debug("reflink failed, copying {}: {}", source, e)
+    shutil.copy2( source, temp_file )
+    return "copied"
+
+
+def sync_file( source, destination, link=None, checksum=False ):
+    """ bring destination up to date with source.  Returns "skipped", "copied" or "linked".
+
+    :param link: None to copy bytes, "hard" to hardlink, "reflink" to clone extents.
+        Links fall back to a copy where the filesystem can't make them.
+    :param checksum: compare content rather than size and mtime
+    """
+    size = os.path.getsize( source )
+    if is_up_to_date( source, destination, checksum=checksum ):
+        logger.debug("up to date: {}", destination)
+        count_write("skipped")
+        count_write("skipped_bytes", size)
+        return "skipped"
+
+    temp_file = make_temp_file( destination )
+    try:
+        action = place_file( source, temp_file, link=link )
+        os.replace( temp_file, destination )
+    except BaseException:
+        if os.path.exists( temp_file ):
+            os.remove( temp_file )
+        raise
+    count_write( action )
+    count_write( action + "_bytes", size )
+    return action
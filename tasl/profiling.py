@@ -0,0 +1,116 @@
+"""
+Profiling for `tasl --profile[=path] <command>`
+
+The command runs under cProfile.  On exit the raw stats are saved to
+<path> (default tasl.pstats, for `python -m pstats` or snakeviz), a
+collapsed-stack file is saved next to it as <path minus .pstats>.folded
+(for flamegraph.pl, speedscope, inferno), and the top cumulative hotspots
+are printed to stderr.
+
+cProfile records caller/callee edges, not whole stacks.  The collapsed stacks
+are rebuilt by walking down from the entry points and splitting each
+function's time between its callers in proportion to the time each caller
+spent in it.  Each function's self time is then scaled so the stacks add up
+to what cProfile measured; the split across stacks is an estimate.
+"""
+import os
+import sys
+import pstats
+import cProfile
+
+from loguru import logger
+
+DEFAULT_PROFILE = "tasl.pstats"
+DEFAULT_PROFILE_TOP = 25
+
+# stop walking a branch once it is this small a share of the total time
+MIN_STACK_SHARE = 1e-4
+MAX_STACK_DEPTH = 200
+
+
+def start_profile():
+    """ start profiling this process, returning the profiler """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def get_folded_path( path ):
+    """ return the collapsed-stack file name for a pstats file name """
+    base, ext = os.path.splitext( path )
+    return ( base if ext == ".pstats" else path ) + ".folded"
+
+
+def format_frame( func ):
+    """ name a pstats function key (file, line, name) for a stack line """
+    filename, line, name = func
+    if filename == "~":
+        # built-ins, e.g. <built-in method posix.stat>
+        return name.replace( ";", ":" )
+    return f"{name} ({os.path.basename( filename )}:{line})".replace( ";", ":" )
+
+
+def collapse_stacks( stats ):
+    """ return {stack: seconds} of self time, with stacks as ';' joined frames from the entry point down """
+    callees = {}
+    for func, ( cc, nc, tt, ct, callers ) in stats.items():
+        # with recursion the edges into a function add up to more than its own time
+        edge_total = sum( edge[3] for edge in callers.values() )
+        for caller, edge in callers.items():
+            callees.setdefault( caller, [] ).append( ( func, edge[3] / edge_total if edge_total > 0 else 0.0 ) )
+
+    roots = [ func for func, value in stats.items() if not value[4] ]
+    total = sum( stats[root][3] for root in roots )
+    min_time = total * MIN_STACK_SHARE
+    folded = {}
+
+    def walk( func, stack, on_stack, fraction ):
+        cc, nc, tt, ct, callers = stats[func]
+        stack = stack + ( format_frame( func ), )
+        on_stack = on_stack | { func }
+        key = ( ";".join( stack ), func )
+        folded[key] = folded.get( key, 0.0 ) + tt * fraction
+        if len( stack ) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_share in callees.get( func, () ):
+            share = fraction * edge_share
+            # recursion is cut at the first repeat; small branches are dropped
+            if callee not in on_stack and share * stats[callee][3] >= min_time:
+                walk( callee, stack, on_stack, share )
+
+    for root in roots:
+        walk( root, (), frozenset(), 1.0 )
+
+    # recursion and dropped branches leave some functions short; scale each back to its measured self time
+    attributed = {}
+    for ( stack, func ), seconds in folded.items():
+        attributed[func] = attributed.get( func, 0.0 ) + seconds
+    collapsed = {}
+    for ( stack, func ), seconds in folded.items():
+        if attributed[func] > 0:
+            collapsed[stack] = collapsed.get( stack, 0.0 ) + seconds * stats[func][2] / attributed[func]
+    return collapsed
+
+
+def write_collapsed_stacks( stats, path ):
+    """ write stats in collapsed-stack format ('frame;frame;frame microseconds' per line) """
+    folded = collapse_stacks( stats )
+    with open( path, "w", encoding="utf-8" ) as file:
+        for stack, seconds in sorted( folded.items() ):
+            microseconds = int( round( seconds * 1e6 ) )
+            if microseconds > 0:
+                file.write( f"{stack} {microseconds}\n" )
+
+
+def finish_profile( profiler, path=DEFAULT_PROFILE, top=DEFAULT_PROFILE_TOP ):
+    """ stop profiler, save the .pstats and .folded files and print the top cumulative hotspots """
+    profiler.disable()
+    profiler.dump_stats( path )
+    stats = pstats.Stats( profiler, stream=sys.stderr )
+    folded_path = get_folded_path( path )
+    write_collapsed_stacks( stats.stats, folded_path )
+    if top > 0:
+        # let queued log messages out first, so they don't land in the middle of the table
+        logger.complete()
+        stats.sort_stats( pstats.SortKey.CUMULATIVE ).print_stats( top )
+    logger.success(f"Profile saved to {path}, collapsed stacks to {folded_path}")
@@ -0,0 +1,396 @@
+"""
+A resident tasl process for editors and scripts that call tasl often
+
+`tasl serve` imports everything once, warms the parsers and the topic index,
+and then answers requests on a Unix domain socket.  While it is running, a
+plain `tasl <command>` forwards its arguments to the server instead of
+running them itself, so repeated calls skip Python startup and the heavy
+imports.  Set TASL_NO_SERVER=1 to always run locally.  A socket that belongs
+to another user, or that others can open, is never used.
+
+The protocol is one JSON object per line.  A request:
+
+    {"argv": ["list", "+loop"], "cwd": "/path/to/topics", "log_level": "SUCCESS", "colorize": true}
+
+is answered with any number of output lines and then the exit code:
+
+    {"stderr": "topic-1-loop.qmd\\n"}
+    {"stdout": "..."}
+    {"exit": 0}
+
+{"ping": true} is answered with {"exit": 0, "version": ..., "pid": ...} and
+{"stop": true} shuts the server down.  Requests are run one at a time, in
+the client's working folder.
+
+This module is imported by every `tasl` run to look for a server, so the
+client half sticks to the standard library.
+"""
+import os
+import sys
+import json
+import socket
+
+SOCKET_ENV = "TASL_SOCKET"
+NO_SERVER_ENV = "TASL_NO_SERVER"
+
+# commands that must run in the caller's own process
+LOCAL_COMMANDS = ( "serve", "watch" )
+
+# commands that run locally when given - to read the caller's stdin
+STDIN_COMMANDS = ( "batch", )
+
+# group options that take a value, for finding the command name in argv
+VALUE_OPTIONS = ( "--log-level", "--profile-top", "--trace" )
+
+BUFFER_SIZE = 64 * 1024
+
+
+def get_socket_path():
+    """ return the server socket path: $TASL_SOCKET, else tasl-<uid>.sock in the runtime or temp folder """
+    path = os.environ.get( SOCKET_ENV )
+    if path:
+        return path
+    folder = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    uid = os.getuid() if hasattr( os, "getuid" ) else 0
+    return os.path.join( folder, f"tasl-{uid}.sock" )
+
+
+def get_command_name( argv ):
+    """ return the first argument that isn't a group option (or its value) """
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def is_own_socket( path ):
+    """ True if path is a socket owned by this user that no one else can use
+
+    In a shared temp folder another user could create the socket first and
+    answer our requests, so anything else is left alone.
+    """
+    import stat
+
+    try:
+        info = os.lstat( path )
+    except OSError:
+        return False
+    if not stat.S_ISSOCK( info.st_mode ):
+        return False
+    if hasattr( os, "getuid" ) and info.st_uid != os.getuid():
+        return False
+    return stat.S_IMODE( info.st_mode ) & 0o077 == 0
+
+
+def connect( path=None, timeout=None ):
+    """ return a socket connected to the server, or None if none is running (or it isn't ours) """
+    path = path or get_socket_path()
+    if not hasattr( socket, "AF_UNIX" ) or not is_own_socket( path ):
+        return None
+    client = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    client.settimeout( timeout )
+    try:
+        client.connect( path )
+    except OSError:
+        client.close()
+        return None
+    if hasattr( socket, "SO_PEERCRED" ) and hasattr( os, "getuid" ):
+        import struct
+        pid, uid, gid = struct.unpack( "3i", client.getsockopt( socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i") ) )
+        if uid != os.getuid():
+            client.close()
+            return None
+    return client
+
+
+def send_message( sock, message ):
+    sock.sendall( json.dumps( message ).encode("utf-8") + b"\n" )
+
+
+def iter_messages( sock ):
+    """ yield the JSON messages read from sock until it closes """
+    buffer = b""
+    while True:
+        data = sock.recv( BUFFER_SIZE )
+        if not data:
+            return
+        buffer += data
+        *lines, buffer = buffer.split( b"\n" )
+        for line in lines:
+            if line.strip():
+                yield json.loads( line )
+
+
+def request( message, path=None, timeout=None ):
+    """ send one request to the server and return its answers, or None if no server is running """
+    client = connect( path, timeout )
+    if client is None:
+        return None
+    with client:
+        send_message( client, message )
+        return list( iter_messages( client ) )
+
+
+def forward_to_server( argv, log_level ):
+    """ run a tasl command line on the server, copying its output here.
+
+    Returns the command's exit code, or None when it should run locally:
+    no server is running, TASL_NO_SERVER is set, the command is one of
+    LOCAL_COMMANDS, or it reads stdin.
+    """
+    if os.environ.get( NO_SERVER_ENV ) or not argv or get_command_name( argv ) in LOCAL_COMMANDS:
+        return None
+    if get_command_name( argv ) in STDIN_COMMANDS and "-" in argv:
+        return None
+    client = connect()
+    if client is None:
+        return None
+    with client:
+        try:
+            send_message( client, dict( argv=argv, cwd=os.getcwd(), log_level=log_level, colorize=sys.stderr.isatty() ) )
+        except OSError:
+            # a server that is going away; run locally instead
+            return None
+        for message in iter_messages( client ):
+            if "stderr" in message:
+                sys.stderr.write( message["stderr"] )
+                sys.stderr.flush()
+            if "stdout" in message:
+                sys.stdout.write( message["stdout"] )
+                sys.stdout.flush()
+            if "exit" in message:
+                return message["exit"]
+    sys.stderr.write("tasl server closed the connection without an exit code\n")
+    return 1
+
+
+class SocketWriter:
+    """ file-like object sending each write to the client as a {stream: text} message """
+
+    def __init__( self, sock, stream ):
+        self.sock = sock
+        self.stream = stream
+        self.connected = True
+
+    def write( self, text ):
+        if isinstance( text, bytes ):
+            # click.echo writes bytes to streams it doesn't recognise
+            text = text.decode( "utf-8", errors="replace" )
+        if text and self.connected:
+            try:
+                send_message( self.sock, { self.stream: text } )
+            except OSError:
+                # the client went away; finish the command anyway
+                self.connected = False
+        return len( text )
+
+    def flush( self ):
+        pass
+
+    def isatty( self ):
+        return False
+
+
+def warm_up( folders ):
+    """ import the working modules, build the parsers and refresh the topic index of each folder """
+    import sqlite3
+    from loguru import logger
+    import tasl.utils
+    from tasl.slides_from_guide import get_markdown_converter, get_markdown_parser
+    from tasl.index import list_topic_pairs, open_topic_index, refresh_topic_index
+
+    get_markdown_converter()
+    get_markdown_parser()
+    for folder in folders:
+        if list_topic_pairs( folder ):
+            try:
+                conn = open_topic_index( folder )
+                try:
+                    reread = refresh_topic_index( conn, folder )
+                finally:
+                    conn.close()
+            except ( sqlite3.Error, OSError ) as e:
+                logger.warning("Topic index of {} unavailable: {}", folder, e)
+                continue
+            logger.info("Refreshed topic index of {}: {} topics reread", folder, reread)
+
+
+# where log records go while a request runs: the client's stderr writer, and
+# the (level, colorize) of the sink added for it.  None between requests.
+current_request = dict( key=None, writer=None )
+
+# loguru handler ids by (level, colorize).  Adding a sink costs more than a
+# whole warm command, so each combination is added once and reused.
+request_sinks = {}
+
+
+def send_to_client( message ):
+    current_request["writer"].write( message )
+
+
+def route_logging( level, colorize, writer ):
+    """ send log records at level and above to writer, until route_logging(None, ...) """
+    import tasl
+    from loguru import logger
+
+    key = None if level is None else ( level, colorize )
+    if key is not None and key not in request_sinks:
+        request_sinks[key] = logger.add( send_to_client, format=tasl.format_record, level=level, colorize=colorize,
+                                         filter=lambda record, key=key: current_request["key"] == key )
+    current_request.update( key=key, writer=writer )
+
+
+def configure_server_logging( level ):
+    """ log to stderr at level, but only between requests; a request's records go to its client """
+    import tasl
+    from loguru import logger
+
+    logger.remove()
+    request_sinks.clear()
+    logger.add( sys.stderr, format=tasl.format_record, level=level,
+                filter=lambda record: current_request["key"] is None )
+
+
+def run_command( cli, argv, cwd, log_level, colorize, out, err ):
+    """ run a tasl command line in this process, sending its output to out and err.  Returns the exit code. """
+    import contextlib
+    import click
+    import tasl
+    from loguru import logger
+    from tasl.output import write_stats, write_stats_lock
+
+    saved_cwd = os.getcwd()
+    saved_level = tasl.log_level
+    try:
+        route_logging( log_level, colorize, err )
+    except ValueError as e:
+        err.write(f"tasl server: {e}\n")
+        return 2
+    tasl.log_level = log_level
+    try:
+        os.chdir( cwd )
+        with contextlib.redirect_stdout( out ), contextlib.redirect_stderr( err ):
+            try:
+                cli.main( args=argv, prog_name="tasl", standalone_mode=False )
+                return 0
+            except click.exceptions.Exit as e:
+                return e.exit_code
+            except click.ClickException as e:
+                e.show( file=err )
+                return e.exit_code
+            except click.Abort:
+                err.write("Aborted!\n")
+                return 1
+            except SystemExit as e:
+                return e.code if isinstance( e.code, int ) else ( 0 if e.code is None else 1 )
+            except Exception:
+                logger.exception(f"tasl {' '.join( argv )} failed")
+                return 1
+    except OSError as e:
+        err.write(f"tasl server cannot run in {cwd}: {e}\n")
+        return 1
+    finally:
+        logger.complete()
+        route_logging( None, False, None )
+        with write_stats_lock:
+            # each command reports only its own writes
+            write_stats.clear()
+        os.chdir( saved_cwd )
+        tasl.log_level = saved_level
+
+
+def handle_connection( cli, conn ):
+    """ answer one request.  Returns False if the server was asked to stop. """
+    import time
+    from loguru import logger
+    from tasl.cache import get_tasl_version
+
+    with conn:
+        try:
+            message = next( iter_messages( conn ), None )
+        except ( OSError, ValueError ) as e:
+            logger.warning(f"Bad request: {e}")
+            return True
+        if message is None:
+            return True
+        if message.get("stop"):
+            send_message( conn, dict( exit=0 ) )
+            return False
+        if message.get("ping"):
+            send_message( conn, dict( exit=0, version=get_tasl_version(), pid=os.getpid() ) )
+            return True
+
+        argv = [ str( arg ) for arg in message.get("argv", []) ]
+        err = SocketWriter( conn, "stderr" )
+        if get_command_name( argv ) in LOCAL_COMMANDS:
+            err.write(f"tasl {get_command_name( argv )} can't run on the server\n")
+            code = 2
+        else:
+            start = time.perf_counter()
+            code = run_command( cli, argv, message.get("cwd", os.getcwd()), message.get("log_level", "SUCCESS"),
+                                bool( message.get("colorize") ), SocketWriter( conn, "stdout" ), err )
+            logger.info("tasl {}: exit {} in {:.1f} ms", ' '.join( argv ), code, ( time.perf_counter() - start ) * 1000)
+        if err.connected:
+            try:
+                send_message( conn, dict( exit=code ) )
+            except OSError:
+                pass
+    return True
+
+
+def remove_stale_socket( path ):
+    """ remove a socket file left by a server that has died.  Returns False if a server is answering on it. """
+    if not os.path.exists( path ):
+        return True
+    client = connect( path, timeout=1 )
+    if client is not None:
+        client.close()
+        return False
+    os.unlink( path )
+    return True
+
+
+def serve( cli, path=None, folders=(".",) ):
+    """ answer requests on the socket at path until stopped """
+    from loguru import logger
+
+    if not hasattr( socket, "AF_UNIX" ):
+        logger.error("tasl serve needs Unix domain sockets, which this platform doesn't have.")
+        return False
+    path = path or get_socket_path()
+    if os.path.lexists( path ) and not is_own_socket( path ):
+        logger.error(f"{path} is not a private socket of this user.  Use --socket or ${SOCKET_ENV} to pick another path.")
+        return False
+    if not remove_stale_socket( path ):
+        logger.error(f"A tasl server is already running on {path}")
+        return False
+
+    import tasl
+    configure_server_logging( tasl.log_level )
+    warm_up( folders )
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    # other users' requests would run with our permissions
+    old_umask = os.umask( 0o177 )
+    try:
+        server.bind( path )
+    finally:
+        os.umask( old_umask )
+    server.listen( 16 )
+    logger.success(f"tasl server listening on {path}.  Press Ctrl-C to stop.")
+    try:
+        with server:
+            running = True
+            while running:
+                conn, _ = server.accept()
+                running = handle_connection( cli, conn )
+    finally:
+        if os.path.exists( path ):
+            os.unlink( path )
+        tasl.configure_logging( tasl.log_level )
+    logger.success("tasl server stopped.")
+    return True
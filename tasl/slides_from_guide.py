@@ -4,12 +4,16 @@ Slides from guide
 
 import os
 import re
-import sys
 import html
-import shutil
+import functools
 import frontmatter
+from concurrent.futures import ProcessPoolExecutor
 import markdown
 from loguru import logger
+from tasl.output import write_file_if_changed, sync_file, get_write_stats, merge_write_stats
+from tasl import trace, capture_log_records, replay_log_records
+from tasl.trace import span, begin_span, end_span
+from tasl.errors import ConversionError
 from markdown.extensions.toc import TocExtension
 from bs4 import BeautifulSoup, Tag
 
@@ -20,13 +24,17 @@ from mdformat.renderer import MDRenderer
 #logger.remove()
 #logger.add(sys.stderr, level="INFO")
 
+# slides-from and watch are run from the slides folder, next to these
+GUIDE_FOLDER = "../guide/"
+GUIDE_HTML_FOLDER = "../docs/guide/"
+
 
 def load_markdown_with_frontmatter(markdown_file_path):
     """ Loads a QMD file, keeping frontmatter separate """
     try:
         with open(markdown_file_path, 'r', encoding='utf-8') as file:
             post = frontmatter.load(file)
-            logger.info(f"loading QMD, keeping content: {markdown_file_path}")
+            logger.info("loading QMD, keeping content: {}", markdown_file_path)
         return post
     except FileNotFoundError:
         logger.error(f"File not found: {markdown_file_path}")
@@ -35,10 +43,21 @@ def load_markdown_with_frontmatter(markdown_file_path):
         logger.error(f"Error loading Markdown with front matter: {e}")
         return None
 
+@functools.lru_cache(maxsize=None)
+def get_markdown_converter():
+    """ return the Markdown to HTML converter.  Built once per process, it is slow to set up. """
+    # Initialize a Markdown parser with the Table of Contents (TOC) extension
+    return markdown.Markdown(extensions=[TocExtension(toc_depth="3")])
+
+@functools.lru_cache(maxsize=None)
+def get_markdown_parser():
+    """ return the markdown-it parser used to pull sections out of the guide """
+    return MarkdownIt("gfm-like",{"html": True})  # don't escape html or latex characters.
+
 def process_markdown(markdown_content):
     """ Process markdown, converting to html """
-    # Initialize a Markdown parser with the Table of Contents (TOC) extension
-    md = markdown.Markdown(extensions=[TocExtension(toc_depth="3")])
+    md = get_markdown_converter()
+    md.reset()
 
     # Parse the Markdown content
     html_content = md.convert(markdown_content)
@@ -63,22 +82,26 @@ def extract_content_under_h2(h2):
 
     return '\n'.join(content)
 
-def extract_md_content_under_h2(tokens, header_name):
-    """ extract h2 and children from markdown tokens """
-    h2_content = []
-    capture = False
+def index_md_h2_sections(tokens):
+    """ map each h2 title to its tokens (heading through to the next h2), in one pass """
+    sections = {}
+    current = None
 
-    for token in tokens:
+    for i, token in enumerate(tokens):
         if token.type == "heading_open" and token.tag == "h2":
-            capture = False  # Stop capturing if a new H2 is found
-            next_token = tokens[tokens.index(token) + 1]
-            if next_token.type == "inline" and next_token.content == header_name:
-                capture = True
+            current = None  # Stop capturing if a new H2 is found
+            if i + 1 < len(tokens) and tokens[i + 1].type == "inline":
+                # repeated titles collect into one section, as a scan by name would
+                current = sections.setdefault(tokens[i + 1].content, [])
+
+        if current is not None:
+            current.append(token)
 
-        if capture:
-            h2_content.append(token)
+    return sections
 
-    return h2_content
+def extract_md_content_under_h2(tokens, header_name):
+    """ extract h2 and children from markdown tokens """
+    return index_md_h2_sections(tokens).get(header_name, [])
 
 def unescape_string(input_string):
     # Replace "\\_" with "_"
@@ -129,40 +152,57 @@ def convert_headers(markdown):
     return cleaned_markdown
 
 
+# a fenced div line: ":::" (or more colons), then attributes for an opener, nothing for a closer
+fenced_div_pattern = re.compile(r"^\s*:{3,}\s*(.*?)\s*$")
+
+# a fenced code line: ``` or ~~~ (or longer), optionally followed by an info string
+fenced_code_pattern = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
 def convert_headers_outside_containers(markdown):
-    # Regular expression to find blocks that start with ::: {.something} and end with :::
-    block_pattern = r"::: \{.*?\}([\s\S]*?):::"
-    
-    # Find all blocks and store their positions
-    blocks = [(m.start(), m.end()) for m in re.finditer(block_pattern, markdown)]
-    
-    # Regular expression to match H3 headers (### something)
-    header_pattern = r"^### (.+)$"
-    
-    # Split the markdown into lines
+    """ convert ### headers to ## unless they sit inside a ::: fenced div
+
+    The first pass pairs ::: openers with closers, so nested divs such as
+    :::: {.columns} / ::: {.column} match up.  It skips lines inside ``` or
+    ~~~ code fences.  A closer with no open div is ignored.  An opener that is
+    never closed covers nothing.  The second pass converts the headers
+    outside the paired spans and leaves code fences untouched.
+    """
     lines = markdown.splitlines()
-    
-    # Function to check if a line index is within any container block
-    def is_inside_block(line_start, line_end):
-        for block_start, block_end in blocks:
-            if block_start <= line_start < block_end or block_start < line_end <= block_end:
-                return True
-        return False
-    
-    # Iterate through lines and convert headers that are outside containers
+    in_code = [False] * len(lines)
+    cover = [0] * (len(lines) + 1)
+    openers = []
+    code_fence = None
+
     for i, line in enumerate(lines):
-        if line.startswith("###"):
-            line_start = sum(len(l) + 1 for l in lines[:i])  # Calculate line start position in the original markdown
-            line_end = line_start + len(line)
-            
-            # If the line is not inside any container, convert it to H2
-            if not is_inside_block(line_start, line_end):
-                lines[i] = re.sub(header_pattern, r"## \1", line)
-    
-    # Join lines back together to form the final markdown
-    cleaned_markdown = "\n".join(lines)
-    
-    return cleaned_markdown
+        code = fenced_code_pattern.match(line)
+        if code_fence is not None:
+            in_code[i] = True
+            if code and code.group(1)[0] == code_fence[0] and len(code.group(1)) >= len(code_fence) \
+                    and not line[code.end():].strip():
+                code_fence = None
+            continue
+        if code:
+            in_code[i] = True
+            code_fence = code.group(1)
+            continue
+
+        fence = fenced_div_pattern.match(line)
+        if fence:
+            if fence.group(1):
+                openers.append(i)
+            elif openers:
+                cover[openers.pop()] += 1
+                cover[i + 1] -= 1
+
+    depth = 0
+    for i, line in enumerate(lines):
+        depth += cover[i]
+
+        # If the line is not inside any container, convert it to H2
+        if depth == 0 and not in_code[i] and line.startswith("### ") and len(line) > 4:
+            lines[i] = "## " + line[4:]
+
+    return "\n".join(lines)
 
 def replace_height_in_style(div_element,new_height):
     # Ensure that the input is a div element
@@ -192,15 +232,27 @@ def replace_height_in_style(div_element,new_height):
     return div_element
 
 
+# h2 classes with a dedicated handler in process_html_content.  Part of the
+# build cache key, so adding a handler invalidates cached slides.
+SLIDE_TEMPLATES = (
+    "slide-template-bullet-walk",
+    "slide-template-versus",
+    "slide-template-description-p5-widget",
+    "slide-template-2-column-with-image",
+)
+
 def process_html_content(post, html_content):
     # You can use BeautifulSoup to parse and manipulate HTML
     # Here, we'll print the headers and their content
 
     title = post.metadata["title"]
-    logger.debug(f"{title}")
-    soup = BeautifulSoup(html_content, 'html.parser')
+    logger.debug("{}", title)
+    with span("parse html"):
+        soup = BeautifulSoup(html_content, 'html.parser')
 
-    md = MarkdownIt("gfm-like",{"html": True})  # don't escape html or latex characters.
+    md = get_markdown_parser()
+    renderer = MDRenderer()
+    md_sections = None  # h2 title -> markdown tokens, parsed on first unlabeled section
 
     s = ""
     s = s + f"\n# {title}\n"
@@ -210,7 +262,9 @@ def process_html_content(post, html_content):
     for h2 in soup.find_all(['h2']):
 
         h2_text = h2.text.strip()
-        logger.debug(f"{str(h2)}")
+        logger.debug("{}", h2)
+        handler_span = begin_span( next( ( c for c in h2.get("class", []) if c in SLIDE_TEMPLATES ), "unlabeled section" ),
+                                   section=h2_text ) if trace.enabled else None
         block = extract_content_under_h2( h2 )
         bsoup = BeautifulSoup(block, 'html.parser')
 
@@ -224,7 +278,7 @@ def process_html_content(post, html_content):
                 strongs = bsoup.find_all(['strong'])
                 logger.info(h2.text.strip())
                 image = bsoup.find(['img'])
-                logger.debug(str(image))
+                logger.debug("{}", image)
 #                logger.debug( lis )
 
                 texts = []
@@ -303,7 +357,7 @@ def process_html_content(post, html_content):
                     s = s + ":::\n"
                     s = s + "::: {.column width=""30%""}\n"
                     if img:
-                        logger.debug(str(block))
+                        logger.debug("{}", block)
                         s = s + f"![]({img['src']})"
                         if str(block).find("lightbox")>-1:
                             s = s + "{.lightbox}"
@@ -311,7 +365,7 @@ def process_html_content(post, html_content):
                     s = s + ":::\n"
                     s = s + "::::\n"
                 else:
-                    logger.debug(f"unknown class type")
+                    logger.debug("unknown class type")
 
             elif "slide-template-description-p5-widget" in css_classes:
                 logger.debug("slide-template-description-p5-widget")
@@ -403,7 +457,7 @@ def process_html_content(post, html_content):
 
                 for i,section in enumerate( sections ):
     
-                    logger.debug( f"{section.find(['h3']).text}"   )
+                    logger.opt(lazy=True).debug("{}", lambda: section.find(['h3']).text)
                     s = s + f"\n##\n\n"
 
                     div_element = section.find('div', {'data-snack-id': True})
@@ -425,10 +479,10 @@ def process_html_content(post, html_content):
                 ## if the section is unlabeled, then simply copy the corresponding h2 block
                 ## from the original QMD file
 
-                logger.info(f"unlabeled section: {h2_text}")
-                tokens = md.parse(post.content)
-                results = extract_md_content_under_h2( tokens, h2_text )
-                renderer = MDRenderer()
+                logger.info("unlabeled section: {}", h2_text)
+                if md_sections is None:
+                    md_sections = index_md_h2_sections( md.parse(post.content) )
+                results = md_sections.get( h2_text, [] )
                 output_markdown = renderer.render(results, {}, {})
                 logger.debug( output_markdown )
 
@@ -486,6 +540,7 @@ def process_html_content(post, html_content):
 
 
         s = s + "\n\n"
+        end_span( handler_span )
 
 #        s = s + block
         
@@ -496,14 +551,13 @@ def process_html_content(post, html_content):
 
 def write_underline_file( filename, markdown ):
     try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.write( markdown )
+        write_file_if_changed( filename, markdown )
 
     except Exception as e:
         logger.error(f"Error writing underline file '{filename}': {e}")
 
 def write_main_qmd_file( filename, title ):
-    """ create a """
+    """ create the QMD that shows the slides in _filename, unless it already exists """
 
     # Define the content you want to write (as a Python dictionary)
     new_yaml_content = {
@@ -526,7 +580,8 @@ def write_main_qmd_file( filename, title ):
     try:
         # Create a new front matter object
 
-        content = "\n\n{{< include '" + f"{"_"+filename}" + "' >}}\n\n\n"
+        folder, basename = os.path.split( filename )
+        content = "\n\n{{< include '" + f"{"_"+basename}" + "' >}}\n\n\n"
 
         post = frontmatter.Post( content )
         post.metadata = new_yaml_content
@@ -536,81 +591,168 @@ def write_main_qmd_file( filename, title ):
         if os.path.exists(filename):
             logger.warning(f"{filename} exists. Not writing new QMD file.")
         else:
-            with open(filename, 'w', encoding='utf-8') as file:
-                file.write( frontmatter.dumps(post) )
+            write_file_if_changed( filename, frontmatter.dumps(post) )
 
     except Exception as e:
         logger.error(f"Error writing to YAML file: {e}")
 
-def copy_asset_files(source_folder, destination_folder):
+def copy_asset_files(source_folder, destination_folder, link=None, checksum=False):
+    """ sync the guide's assets folder into destination_folder
+
+    Files that are missing or stale (by size and mtime, or content with
+    checksum=True) are copied, or linked with link="hard"/"reflink".
+    """
     # Ensure both source and destination folders exist
     if not os.path.exists(source_folder):
         logger.warning(f"Source folder '{source_folder}' does not exist.")
         return
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
+    # several conversions may copy into the same folder at once
+    os.makedirs(destination_folder, exist_ok=True)
 
-    # Get a list of all files in the source folder
-    files = os.listdir(source_folder)
+    # Iterate through the files and sync them to the destination folder.
+    # Each file goes through a temp file and a rename, so a concurrent reader
+    # (or another worker) never sees a half-written file.
+    for entry in os.scandir(source_folder):
+        if not entry.is_file():
+            continue
+        destination_file = os.path.join(destination_folder, entry.name)
+        action = sync_file(entry.path, destination_file, link=link, checksum=checksum)
+        logger.debug("File '{}' {}.", entry.name, action)
 
-    # Iterate through the files and copy them to the destination folder
-    for file_name in files:
-        source_file = os.path.join(source_folder, file_name)
-        destination_file = os.path.join(destination_folder, file_name)
 
-        # Check if the file already exists in the destination folder
-        if os.path.exists(destination_file):
-            logger.debug(f"File '{file_name}' already exists in the destination folder.")
-        else:
-            shutil.copy2(source_file, destination_file)
-            logger.debug(f"File '{file_name}' copied to the destination folder.")
+def slides_from_qmd( original_filename, force=False, link=None, checksum=False, folder="." ):
+    """ convert markdown file into opinionated reveal js slides
 
+    Slides are written to folder (the slides folder, next to the guide).
+    Unchanged guide files are served from the build cache (.tasl/cache.db)
+    without parsing.  Use force=True to rebuild anyway.
 
-def slides_from_qmd( original_filename ):
-    """ convert markdown file into opinionated reveal js slides """
+    :return: dict(title=, cached=) for the slides written
+    :raises ConversionError: the guide file or its rendered HTML could not be loaded or converted
+    """
+    from tasl.cache import build_cache_key, lookup_build, store_build
 
     # Get the base filename without extension
     base_filename = os.path.splitext(os.path.basename(original_filename))[0]
 
-    qmd_filename = "../guide/" + original_filename
-    html_filename = "../docs/guide/" + os.path.splitext( original_filename )[0] + ".html"
-
-    assets_folder_source = "../docs/guide/" + os.path.join(os.path.split( original_filename )[0], "assets")
-    assets_folder_dest = "./assets"
-
-    post = load_markdown_with_frontmatter( qmd_filename )
-    if post:
-
-        # Now you can access front matter and content separately.
-
+    qmd_filename = os.path.normpath( os.path.join( folder, GUIDE_FOLDER + original_filename ) )
+    html_filename = os.path.normpath( os.path.join( folder, GUIDE_HTML_FOLDER + os.path.splitext( original_filename )[0] + ".html" ) )
+
+    assets_folder_source = os.path.normpath( os.path.join( folder, GUIDE_HTML_FOLDER + os.path.join(os.path.split( original_filename )[0], "assets") ) )
+    assets_folder_dest = os.path.join( folder, "assets" )
+    underline_filename = os.path.normpath( os.path.join( folder, "_"+base_filename+".qmd" ) )
+    main_filename = os.path.normpath( os.path.join( folder, base_filename+".qmd" ) )
+
+    with span("cache lookup"):
+        cache_key = build_cache_key( [qmd_filename, html_filename], SLIDE_TEMPLATES )
+        cached = None if force else lookup_build( cache_key, directory_path=folder )
+    if cached:
+        title, new_markdown = cached
+        logger.info("unchanged, using cached slides: {}.qmd", base_filename)
+        with span("write"):
+            write_underline_file( underline_filename, new_markdown )
+            write_main_qmd_file( main_filename, title )
+        with span("copy assets"):
+            copy_asset_files( assets_folder_source, assets_folder_dest, link=link, checksum=checksum )
+        return dict( title=title, cached=True )
+
+    with span("load frontmatter"):
+        post = load_markdown_with_frontmatter( qmd_filename )
+    if not post:
+        raise ConversionError(f"could not load guide file: {qmd_filename}")
+
+    # Now you can access front matter and content separately.
+
+    with span("process_markdown"):
         html = process_markdown( post.content )
 
-        logger.debug(f"loading html_filename: {html_filename}")
-        with open(html_filename, 'r', encoding='utf-8') as html_file:
+    logger.debug("loading html_filename: {}", html_filename)
+    try:
+        with span("read html"), open(html_filename, 'r', encoding='utf-8') as html_file:
             # Read the contents of the HTML file
             html_content = html_file.read()
-        if not html_content:
-            logger.error(f"could not load html_filename: {html_filename}")
-            sys.exit(1)
+    except OSError as e:
+        raise ConversionError(f"could not load html_filename: {html_filename}\n{e}") from e
+    if not html_content:
+        raise ConversionError(f"could not load html_filename: {html_filename}")
 
-        logger.info( base_filename+".qmd" )
+    logger.info( base_filename+".qmd" )
 
-        new_markdown = process_html_content( post, html_content )
+    new_markdown = process_html_content( post, html_content )
 #        logger.debug( new_markdown )
-        if not new_markdown:
-            logger.error(f"Error processing html_filename: {html_filename}")
-            sys.exit(1)
+    if not new_markdown:
+        raise ConversionError(f"Error processing html_filename: {html_filename}")
+
 
+    # Generate put an _underline file for use with includes.
+    # Generate a QMD file to test the _underline file
+    # and move the assets.
+    with span("write"):
+        write_underline_file( underline_filename, new_markdown )
+        write_main_qmd_file( main_filename, post.metadata["title"] )
+    with span("copy assets"):
+        copy_asset_files( assets_folder_source, assets_folder_dest, link=link, checksum=checksum )
+    with span("cache store"):
+        store_build( cache_key, qmd_filename, post.metadata["title"], new_markdown, directory_path=folder )
+    return dict( title=post.metadata["title"], cached=False )
 
-        # Generate put an _underline file for use with includes.
-        # Generate a QMD file to test the _underline file
-        # and move the assets.
-        write_underline_file( "_"+base_filename+".qmd", new_markdown )
-        write_main_qmd_file( base_filename+".qmd",post.metadata["title"] )
-        copy_asset_files( assets_folder_source, assets_folder_dest )
 
 
 
+def convert_guide_file( original_filename, force=False, link=None, checksum=False ):
+    """ convert one guide file, returning True on success.  Errors are logged, not raised. """
+    try:
+        with span("slides_from_qmd", file=original_filename):
+            slides_from_qmd( original_filename, force=force, link=link, checksum=checksum )
+    except ConversionError as e:
+        logger.error( str( e ) )
+        return False
+    except Exception as e:
+        logger.error(f"Error converting {original_filename}: {e}")
+        return False
+    logger.success(f"Topic from guide: {os.path.splitext(os.path.basename(original_filename))[0]} built.")
+    return True
+
+def convert_guide_file_captured( original_filename, log_level, force=False, link=None, checksum=False, tracing=False ):
+    """ process pool worker.  Log records (and trace spans) are handed back so the parent can print them in file order. """
+    records = []
+    capture_log_records( records, log_level )
+    before = get_write_stats()
+    if tracing:
+        trace.start_trace()
+    ok = convert_guide_file( original_filename, force=force, link=link, checksum=checksum )
+    spans = trace.stop_trace() if tracing else []
+    # worker processes are reused, so return only this file's write counts
+    stats = { key: value - before.get(key, 0) for key, value in get_write_stats().items() }
+    return ok, records, stats, spans
+
+def convert_guide_files( filenames, jobs=1, log_level="SUCCESS", force=False, link=None, checksum=False ):
+    """ convert guide files, optionally across a process pool.  Returns list of files that failed. """
+    failures = []
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            if not convert_guide_file( filename, force=force, link=link, checksum=checksum ):
+                failures.append( filename )
+        return failures
+
+    logger.info("Converting {} files with {} workers", len(filenames), jobs)
+    with ProcessPoolExecutor( max_workers=jobs ) as pool:
+        futures = [ pool.submit( convert_guide_file_captured, filename, log_level, force, link, checksum, trace.enabled )
+                    for filename in filenames ]
+        # results are collected in submission order, so each file's log stays together
+        for filename, future in zip( filenames, futures ):
+            try:
+                ok, records, stats, spans = future.result()
+                merge_write_stats( stats )
+                trace.add_trace_events( spans )
+            except Exception as e:
+                ok, records = False, []
+                logger.error(f"Worker failed converting {filename}: {e}")
+            replay_log_records( records )
+            if not ok:
+                failures.append( filename )
+    return failures
+
 
 def main():
 
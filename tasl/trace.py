@@ -0,0 +1,144 @@
+"""
+Per-phase timing and memory spans, saved in Chrome trace format
+
+`tasl --trace out.json <command>` records a span around each phase of the
+pipeline (loading, parsing, each slide template handler, writing, ...) with
+its wall time, CPU time and tracemalloc peak.  Open the file in
+chrome://tracing or https://ui.perfetto.dev.
+
+Spans cost a global lookup and a no-op context manager when tracing is off.
+
+    with span("parse html", file=html_filename):
+        ...
+
+    handle = begin_span("slide-template-versus")
+    ...
+    end_span(handle)
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+
+enabled = False
+
+# finished spans, as Chrome trace events
+events = []
+events_lock = threading.Lock()
+
+# open spans of the current thread, for attributing memory peaks to parents
+_local = threading.local()
+
+NO_SPAN = contextlib.nullcontext()
+
+
+def start_trace( memory=True ):
+    """ start recording spans in this process """
+    global enabled
+    enabled = True
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop_trace():
+    """ stop recording spans, returning the events recorded so far """
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    with events_lock:
+        recorded = list( events )
+        events.clear()
+    return recorded
+
+
+def add_trace_events( more ):
+    """ add events recorded elsewhere (e.g. in a slides-from worker process) """
+    with events_lock:
+        events.extend( more )
+
+
+def _open_spans():
+    spans = getattr( _local, "spans", None )
+    if spans is None:
+        spans = _local.spans = []
+    return spans
+
+
+def begin_span( name, **args ):
+    """ start a span.  Returns a handle for end_span, or None when tracing is off. """
+    if not enabled:
+        return None
+    spans = _open_spans()
+    memory = tracemalloc.is_tracing()
+    current = 0
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        # the parent keeps the peak seen so far; this span measures from here
+        if spans:
+            spans[-1]["peak"] = max( spans[-1]["peak"], peak )
+        tracemalloc.reset_peak()
+    handle = dict( name=name, args=args, start=time.perf_counter_ns(), cpu=time.thread_time_ns(),
+                   memory=memory, base=current, peak=current )
+    spans.append( handle )
+    return handle
+
+
+def end_span( handle, **args ):
+    """ finish a span started by begin_span, adding args to it """
+    if handle is None:
+        return
+    end = time.perf_counter_ns()
+    cpu = time.thread_time_ns() - handle["cpu"]
+    spans = _open_spans()
+    while spans and spans[-1] is not handle:
+        # a span left open by an exception inside it
+        spans.pop()
+    if spans:
+        spans.pop()
+    event_args = dict( handle["args"], **args )
+    event_args["cpu_ms"] = round( cpu / 1e6, 3 )
+    if handle["memory"] and tracemalloc.is_tracing():
+        peak = max( handle["peak"], tracemalloc.get_traced_memory()[1] )
+        event_args["mem_peak_kb"] = round( ( peak - handle["base"] ) / 1024, 1 )
+        if spans:
+            spans[-1]["peak"] = max( spans[-1]["peak"], peak )
+    event = dict( name=handle["name"], cat="tasl", ph="X", ts=handle["start"] / 1000, dur=( end - handle["start"] ) / 1000,
+                  pid=os.getpid(), tid=threading.get_ident(), args=event_args )
+    with events_lock:
+        events.append( event )
+
+
+@contextlib.contextmanager
+def _span( name, args ):
+    handle = begin_span( name, **args )
+    try:
+        yield handle
+    finally:
+        end_span( handle )
+
+
+def span( name, **args ):
+    """ context manager recording a span named name, with args shown in the trace viewer """
+    if not enabled:
+        return NO_SPAN
+    return _span( name, args )
+
+
+def write_trace( path, recorded ):
+    """ save events to path in Chrome trace format """
+    with open( path, "w", encoding="utf-8" ) as file:
+        json.dump( dict( traceEvents=recorded, displayTimeUnit="ms" ), file, default=str )
+        file.write( "\n" )
+
+
+def summarize_trace( recorded ):
+    """ return [(name, count, total wall ms, total cpu ms, max memory peak kb)], slowest first """
+    totals = {}
+    for event in recorded:
+        count, wall, cpu, peak = totals.get( event["name"], ( 0, 0.0, 0.0, 0.0 ) )
+        totals[event["name"]] = ( count + 1, wall + event["dur"] / 1000, cpu + event["args"].get( "cpu_ms", 0 ),
+                                  max( peak, event["args"].get( "mem_peak_kb", 0 ) ) )
+    return sorted( ( ( name, *values ) for name, values in totals.items() ), key=lambda row: -row[2] )
@@ -2,13 +2,20 @@
 """
 import re
 import os
-import sys
 import yaml
 import shutil
-import subprocess
+import copy
+import sqlite3
+import functools
 
 from loguru import logger
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tasl import DEFAULT_IO_WORKERS, capture_log_records, replay_log_records
+from tasl.errors import TopicExistsError, TopicWriteError, LectureReadError, NotInGitRepositoryError
+from tasl.output import write_file_if_changed, sync_file, is_up_to_date
+from tasl.trace import span, begin_span, end_span
 
 def clean_topic_name( input_string ):
     """ clean topic name for use as a basename in a filename """
@@ -27,13 +34,27 @@ def clean_topic_name( input_string ):
     cleaned_string = cleaned_string.strip('-')
     return cleaned_string
 
+def find_git_root( start ):
+    """ walk up from start to the folder holding .git (a folder, or a file for worktrees and submodules) """
+    path = os.path.abspath( start )
+    while True:
+        if os.path.exists( os.path.join( path, ".git" ) ):
+            return path
+        parent = os.path.dirname( path )
+        if parent == path:
+            return None
+        path = parent
+
+@functools.lru_cache(maxsize=None)
+def get_git_root_for( directory ):
+    """ git root for directory, found once per process without forking git """
+    git_root = find_git_root( directory )
+    if git_root is None:
+        raise NotInGitRepositoryError(f"{directory} is not in a git repository")
+    return git_root
+
 def get_git_root():
-    try:
-        # Run the Git command to get the root directory
-        git_root = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], universal_newlines=True).strip()
-        return git_root
-    except subprocess.CalledProcessError:
-        raise RuntimeError("Not a git repository or no git repository found.")
+    return get_git_root_for( os.getcwd() )
 
 def get_repo_relative_path(target_folder):
     git_root = get_git_root()
@@ -54,15 +75,47 @@ def get_repo_relative_path_from_current_dir(git_relative_path):
     relative_path = os.path.relpath(target_path, current_dir)
     return relative_path
 
+# LibYAML's loader is several times faster than the pure-Python one, when available
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def read_yaml_header_text(filename: str):
+    """ Read filename only as far as the closing '---', returning the YAML header text """
+    header = []
+    started = False
+    with open(filename, 'r') as file:
+        for line in file:
+            if line.strip() == "---":
+                if started:
+                    return ''.join(header)
+                started = True
+            elif started:
+                header.append(line)
+
+    raise ValueError("YAML section not properly marked with '---' in the document.")
+
+@functools.lru_cache(maxsize=256)
+def load_yaml_header(path: str, mtime_ns: int, size: int):
+    """ Parse the YAML header of path.  Cached on (path, mtime_ns, size), so keep results read-only. """
+    return yaml.load(read_yaml_header_text(path), Loader=yaml_loader) or {}
+
 def get_yaml_header(filename: str):
     """ Opens filename and returns YAML header as python object """
     if not os.path.exists(filename):
         raise FileNotFoundError(f"The file {filename} does not exist.")
 
-    with open(filename, 'r') as file:
-        lines = file.readlines()
+    stat = os.stat(filename)
+    # callers edit the header they get back, so hand out a copy of the cached one
+    return copy.deepcopy(load_yaml_header(os.path.abspath(filename), stat.st_mtime_ns, stat.st_size))
 
-    # Find the start and end of the YAML header
+
+# Custom representer to dump OrderedDict as a regular dict
+def dict_representer(dumper, data):
+    return dumper.represent_dict(data.items())
+
+yaml.add_representer(OrderedDict, dict_representer)
+
+def split_yaml_header(lines):
+    """ return (start_idx, end_idx) of the '---' lines around the YAML header in lines """
     start_idx = None
     end_idx = None
     for i, line in enumerate(lines):
@@ -74,12 +127,105 @@ def get_yaml_header(filename: str):
 
     if start_idx is None or end_idx is None:
         raise ValueError("YAML section not properly marked with '---' in the document.")
+    return start_idx, end_idx
 
-    # Extract the YAML header
-    yaml_header = ''.join(lines[start_idx+1:end_idx])
-    content = yaml.safe_load(yaml_header) or {}
-    return content
+def dump_yaml_header(content):
+    """ return YAML text for a header, with "title" as the first key """
+    content = dict(content)
+    ordered_content = OrderedDict()
+    if 'title' in content:
+        ordered_content['title'] = content.pop('title')
+    ordered_content.update(content)
+    return yaml.dump(ordered_content, default_flow_style=False, indent=4)
+
+def replace_yaml_header(lines, start_idx, end_idx, new_yaml_header):
+    """ return lines with the header between start_idx and end_idx replaced by new_yaml_header """
+    return lines[:start_idx+1] + new_yaml_header.splitlines(keepends=True) + ["---","\n"] + lines[end_idx+1:]
+
+def find_yaml_key_block(header_lines, key):
+    """ return (start, end) of the lines holding a top-level key of the header, or None
 
+    The block ends at its last value line.  Blank lines and comments after it
+    belong to whatever follows, so rewriting the block leaves them alone.
+    """
+    start = None
+    end = None
+    for i, line in enumerate(header_lines):
+        if start is None:
+            if line.startswith(key + ":"):
+                start = end = i + 1
+        elif line[:1] not in ("", " ", "\t", "-", "#", "\n", "\r"):
+            break
+        elif line.strip() and not line.lstrip().startswith("#"):
+            end = i + 1
+    if start is None:
+        return None
+    return start - 1, end
+
+def patch_yaml_header_keys(header_lines, updates):
+    """ return header lines with only the top-level keys in updates rewritten (or added) """
+    new_lines = list(header_lines)
+    for key, value in updates.items():
+        rendered = yaml.dump({key: value}, default_flow_style=False, indent=4).splitlines(keepends=True)
+        block = find_yaml_key_block(new_lines, key)
+        if block:
+            new_lines[block[0]:block[1]] = rendered
+        elif key == 'title':
+            new_lines[0:0] = rendered
+        else:
+            new_lines.extend(rendered)
+    return new_lines
+
+def patch_yaml_header_tags(header_lines, tags):
+    """ return header lines with tasl.tags set to tags, editing only list items where possible
+
+    Items that are kept stay byte-for-byte as they were, new tags are appended
+    after the last item.  Anything other than a block list of plain values
+    under tasl: falls back to rewriting the tasl: block.
+    """
+    block = find_yaml_key_block(header_lines, "tasl")
+    if block:
+        start, end = block
+        for i in range(start + 1, end):
+            match = re.match(r"^(\s+)tags:\s*$", header_lines[i])
+            if not match:
+                continue
+            indent = match.group(1)
+            items = {}
+            j = i + 1
+            while j < end and header_lines[j].startswith(indent) and header_lines[j].lstrip().startswith("- "):
+                value = yaml.load(header_lines[j].strip(), Loader=yaml_loader)
+                if not isinstance(value, list) or len(value) != 1 or isinstance(value[0], (dict, list)):
+                    break
+                items.setdefault(value[0], header_lines[j])
+                j += 1
+            if len(items) == 0 or len(tags) == 0 or (j < end and header_lines[j].startswith(indent + " ")):
+                # an empty list, or something other than plain items nested under tags:
+                break
+            item_line = next(iter(items.values()))
+            item_indent = item_line[:len(item_line) - len(item_line.lstrip())]
+            new_items = [items.get(tag) or item_indent + yaml.dump([tag], default_flow_style=False) for tag in tags]
+            return header_lines[:i+1] + new_items + header_lines[j:]
+
+    header = yaml.load(''.join(header_lines), Loader=yaml_loader) or {}
+    tasl = dict(header["tasl"]) if isinstance(header.get("tasl"), dict) else {}
+    tasl["tags"] = tags
+    return patch_yaml_header_keys(header_lines, {"tasl": tasl})
+
+def rewrite_yaml_header(lines, start_idx, end_idx, content, new_header_lines):
+    """ return lines with the header replaced by new_header_lines, which must parse to content
+
+    A patched header that does not parse back to content is replaced by a full
+    dump, so a surgical edit can never change the meaning of the header.
+    """
+    try:
+        patched = yaml.load(''.join(new_header_lines), Loader=yaml_loader) or {}
+    except yaml.YAMLError:
+        patched = None
+    if patched != content:
+        logger.debug("patched YAML header did not round trip, rewriting whole header")
+        return replace_yaml_header(lines, start_idx, end_idx, dump_yaml_header(content))
+    return lines[:start_idx+1] + new_header_lines + lines[end_idx:]
 
 def update_yaml_header(filename: str, **kwargs ):
     if not os.path.exists(filename):
@@ -88,49 +234,104 @@ def update_yaml_header(filename: str, **kwargs ):
     with open(filename, 'r') as file:
         lines = file.readlines()
 
-    # Find the start and end of the YAML header
-    start_idx = None
-    end_idx = None
-    for i, line in enumerate(lines):
-        if line.strip() == "---" and start_idx is None:
-            start_idx = i
-        elif line.strip() == "---" and start_idx is not None:
-            end_idx = i
-            break
+    write_file_if_changed(filename, ''.join(update_yaml_header_lines(lines, **kwargs)))
+    # a rewrite can land within the same mtime tick and size as the old header
+    load_yaml_header.cache_clear()
 
-    if start_idx is None or end_idx is None:
-        raise ValueError("YAML section not properly marked with '---' in the document.")
+def update_yaml_header_lines(lines, **kwargs):
+    """ return the lines of a document with the header keys in kwargs set, as update_yaml_header does to a file """
+    # Find the start and end of the YAML header
+    start_idx, end_idx = split_yaml_header(lines)
 
     # Extract the YAML header
     yaml_header = ''.join(lines[start_idx+1:end_idx])
-    content = yaml.safe_load(yaml_header) or {}
+    content = yaml.load(yaml_header, Loader=yaml_loader) or {}
 
     # Update the "tasl" section with the new dictionary
 
     for key in kwargs.keys():
         content[key] = kwargs.get(key,None)
 
-    # Reorder the content so that "title" is the first key
-    ordered_content = OrderedDict()
-    if 'title' in content:
-        ordered_content['title'] = content.pop('title')
-    ordered_content.update(content)
+    # Rewrite only the keys that were passed, leaving the rest of the header as it was
+    new_header_lines = patch_yaml_header_keys(lines[start_idx+1:end_idx], kwargs)
+    logger.opt(lazy=True).debug( "{}", lambda: ''.join(new_header_lines) )
 
-    # Custom representer to dump OrderedDict as a regular dict
-    def dict_representer(dumper, data):
-        return dumper.represent_dict(data.items())
+    # Reassemble the document with the updated YAML header
+    return rewrite_yaml_header(lines, start_idx, end_idx, content, new_header_lines)
 
-    yaml.add_representer(OrderedDict, dict_representer)
+def apply_tag_changes(header, add_tags=(), remove_tags=(), set_tags=None):
+    """ apply tag changes to header["tasl"]["tags"] in place.  Returns True if the tags changed. """
+    tasl = header.get("tasl") if isinstance(header.get("tasl"), dict) else {}
+    old_tags = tasl.get("tags") if isinstance(tasl.get("tags"), list) else []
 
-    # Convert the updated and ordered content back to YAML
-    new_yaml_header = yaml.dump(ordered_content, default_flow_style=False, indent=4)
-    logger.debug( new_yaml_header )
+    tags = [tag for tag in old_tags] if set_tags is None else [tag.lower() for tag in set_tags]
+    for tag in add_tags:
+        if not tag.lower() in tags:
+            tags.append( tag.lower() )
+    for tag in remove_tags:
+        tags = [ t for t in tags if not str(t).lower()==tag.lower() ]
 
-    # Reassemble the document with the updated YAML header
-    new_lines = lines[:start_idx+1] + new_yaml_header.splitlines(keepends=True) + ["---","\n"] + lines[end_idx+1:]
+    if tags == old_tags:
+        return False
+    if not isinstance(header.get("tasl"), dict):
+        header["tasl"] = {}
+    header["tasl"]["tags"] = tags
+    return True
+
+def mutate_topic_tags(filename, add_tags=(), remove_tags=(), set_tags=None):
+    """ apply tag changes to one wrapper file with one read and at most one write
+
+    :return: dict(filename=, changed=, tags=, error=)
+    """
+    try:
+        with open(filename, 'r') as file:
+            lines = file.readlines()
+        new_lines, changed, tags = change_tag_lines(lines, add_tags=add_tags, remove_tags=remove_tags, set_tags=set_tags)
+        if changed:
+            write_file_if_changed(filename, ''.join(new_lines))
+        return dict(filename=filename, changed=changed, tags=tags, error=None)
+    except Exception as e:
+        return dict(filename=filename, changed=False, tags=None, error=e)
+
+def change_tag_lines(lines, add_tags=(), remove_tags=(), set_tags=None):
+    """ apply tag changes to the lines of a wrapper document
+
+    :return: (new lines, True if the tags changed, the tags after the change)
+    """
+    start_idx, end_idx = split_yaml_header(lines)
+    header = yaml.load(''.join(lines[start_idx+1:end_idx]), Loader=yaml_loader) or {}
+    changed = apply_tag_changes(header, add_tags=add_tags, remove_tags=remove_tags, set_tags=set_tags)
+    if changed:
+        new_header_lines = patch_yaml_header_tags(lines[start_idx+1:end_idx], header["tasl"]["tags"])
+        lines = rewrite_yaml_header(lines, start_idx, end_idx, header, new_header_lines)
+    tags = header["tasl"]["tags"] if isinstance(header.get("tasl"), dict) and "tags" in header["tasl"] else []
+    return lines, changed, tags
+
+def mutate_tags(filenames, add_tags=(), remove_tags=(), set_tags=None, workers=DEFAULT_IO_WORKERS):
+    """ apply the same tag changes to many wrapper files across a thread pool
+
+    Each file is read once and written only if its tags changed.
+
+    :param filenames: wrapper files, e.g. sample-topic.qmd
+    :param add_tags: tags to add (lowercased)
+    :param remove_tags: tags to remove (case insensitive)
+    :param set_tags: if not None, replace the tags with these before adding and removing
+    :return: list of dict(filename=, changed=, tags=, error=), in the order of filenames
+    """
+    def mutate(filename):
+        return mutate_topic_tags(filename, add_tags=add_tags, remove_tags=remove_tags, set_tags=set_tags)
 
-    with open(filename, 'w') as file:
-        file.writelines(new_lines)
+    if workers <= 1 or len(filenames) <= 1:
+        results = [mutate(filename) for filename in filenames]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(mutate, filenames))
+
+    load_yaml_header.cache_clear()
+    for result in results:
+        if result["error"] is not None:
+            logger.error(f"Unable to update tags in {result['filename']}: {result['error']}")
+    return results
 
 def create_file(filename, contents, overwrite=False ):
     """Creates a new file with the given contents.
@@ -139,52 +340,85 @@ def create_file(filename, contents, overwrite=False ):
         filename (str): The name of the file to create.
         contents (str): The contents to write to the file.
         overwrite (bool): Whether to overwrite the file if it already exists.
+
+    Raises:
+        TopicExistsError: filename exists and overwrite is False.
+        TopicWriteError: filename could not be written.
     """
     if os.path.exists(filename):
         if not overwrite:
-            logger.warning(f"File '{filename}' already exists. Use --overwrite to store")
-            sys.exit(1)
+            raise TopicExistsError(f"File '{filename}' already exists. Use --overwrite to store")
         else:
-            logger.info(f"File '{filename}' already exists. Overwriting.")
+            logger.info("File '{}' already exists. Overwriting.", filename)
     
     try:
-        with open(filename, 'w', encoding="utf-8") as file:
-            file.write(contents)
-        logger.info(f"File '{filename}' created successfully.")
+        if write_file_if_changed(filename, contents):
+            logger.info("File '{}' created successfully.", filename)
+        else:
+            logger.info("File '{}' unchanged.", filename)
     except Exception as e:
-        logger.error(f"An error occurred while creating the file {filename}\n{e}")
-        sys.exit(1)
+        raise TopicWriteError(f"An error occurred while creating the file {filename}\n{e}") from e
+
+
+def escape_format( text ):
+    """ text with its braces doubled, for use as literal text in a str.format pattern """
+    return text.replace("{", "{{").replace("}", "}}")
 
+def compile_wrapper_template( lines ):
+    """ str.format pattern for a wrapper template: its title: line becomes {title} and its {{< include >}} line {include} """
+    parts = []
+    for line in lines:
+        if line.startswith("title:"):
+            parts.append("title: {title}\n")
+        elif line.startswith("{{<"):
+            parts.append("{include}")
+        else:
+            parts.append( escape_format( line ) )
+    return "".join( parts )
+
+def compile_topic_template( lines ):
+    """ str.format pattern for a topic template: its first line is replaced by a '# {title}' heading """
+    return "# {title}\n" + escape_format( "".join( lines[1:] ) )
+
+template_compilers = dict( wrapper=compile_wrapper_template, topic=compile_topic_template )
+
+@functools.lru_cache(maxsize=32)
+def load_template(path: str, mtime_ns: int, size: int, kind: str):
+    """ Read and compile a template.  Cached on (path, mtime_ns, size), so an edited template is read again. """
+    with open(path, 'r') as file:
+        return template_compilers[kind]( file.readlines() )
+
+def get_template( template, kind ):
+    """ compiled pattern of a "wrapper" or "topic" template file, or None if it can't be read """
+    try:
+        stat = os.stat( template )
+        return load_template( os.path.abspath( template ), stat.st_mtime_ns, stat.st_size, kind )
+    except (OSError, UnicodeDecodeError):
+        return None
 
 def get_wrapper_contents( topic_name, topic_file, template=None ):
     """ return contents of a wrapper file.  If template is available, use it. """
-    contents = f"""---
+    if not template is None:
+        pattern = get_template( template, "wrapper" )
+        if pattern is not None:
+            logger.info("Using default template: {}", template)
+            return pattern.format( title=topic_name, include=f"{{{{< include '{topic_file}' >}}}}" )
+    return f"""---
 title: "{topic_name}"
 ---
 
 {{{{< include '{topic_file}' >}}}}
 
     """
-    if not template is None:
-        if os.path.exists(template):
-            logger.info(f"Using default template: {template}")
-            try:
-                with open(template, 'r') as file:
-                    lines = file.readlines()
-                    for i, line in enumerate(lines):
-                        if line.startswith("title:"):
-                            lines[i] = f"title: {topic_name}\n"
-                        if line.startswith("{{<"):
-                            lines[i] = f"{{{{< include '{topic_file}' >}}}}"
-                    contents = ''.join(lines)
-                    return contents
-            except Exception as e:
-                pass
-    return contents
 
 def get_topic_contents( topic_name, template=None ):
     """ return contents for a topic file.  If template is available, use it. """
-    contents = f"""<!-- # {topic_name} -->
+    if not template is None:
+        pattern = get_template( template, "topic" )
+        if pattern is not None:
+            logger.info("Using default template: {}", template)
+            return pattern.format( title=topic_name )
+    return f"""<!-- # {topic_name} -->
 
 ## {topic_name}
 :::: {{.columns}}
@@ -206,24 +440,11 @@ def get_topic_contents( topic_name, template=None ):
 ::::
 
 """
-    if not template is None:
-        if os.path.exists(template):
-            logger.info(f"Using default template: {template}")
-            try:
-                with open(template, 'r') as file:
-                    # read the lines and drop first line
-                    lines = file.readlines()[1:]
-                    contents = ''.join(lines)
-                    contents = f"# {topic_name}\n" + contents
-                    return contents
-            except Exception as e:
-                pass
-    return contents
 
-def add_new_topic( topic_name, overwrite=False, template_base=None,topic_contents=None, destination="." ):
-    """ Add new set of topic files to current folder. """
+def add_new_topic( topic_name, overwrite=False, template_base=None,topic_contents=None, destination=".", wrapper_header=None ):
+    """ Add new set of topic files to current folder.  A new wrapper gets the header keys in wrapper_header (a dict) as it is written. """
 
-    logger.debug(f"Adding new topic: {topic_name}")
+    logger.debug("Adding new topic: {}", topic_name)
     basename = clean_topic_name( topic_name )
     wrapper_file = basename + ".qmd"
     wrapper_file_and_path = os.path.normpath( os.path.join( destination, basename+".qmd" ) )
@@ -234,7 +455,8 @@ def add_new_topic( topic_name, overwrite=False, template_base=None,topic_content
     topic_template = None
     if not template_base is None:
         wrapper_template = template_base+".qmd"
-        topic_template = "_" + wrapper_template
+        template_folder, template_file = os.path.split( wrapper_template )
+        topic_template = os.path.join( template_folder, "_" + template_file )
 
     if os.path.exists( topic_file_and_path ) and os.path.exists( wrapper_file_and_path ):
         logger.warning(f"Topic ({topic_name}) already exists.  No changes made.")
@@ -242,17 +464,19 @@ def add_new_topic( topic_name, overwrite=False, template_base=None,topic_content
 
     if not os.path.exists( wrapper_file_and_path ):
         contents = get_wrapper_contents( topic_name, topic_file, template=wrapper_template )
+        if wrapper_header:
+            contents = ''.join( update_yaml_header_lines( contents.splitlines( keepends=True ), **wrapper_header ) )
         create_file( wrapper_file_and_path, contents, overwrite=overwrite )
     else:
-        logger.info(f"Using existing wrapper file: {wrapper_file}")
+        logger.info("Using existing wrapper file: {}", wrapper_file)
 
     if not os.path.exists( topic_file_and_path ):
-        contents = get_topic_contents( topic_name, template=topic_template )
-        if not topic_contents is None:
-            contents = topic_contents
+        contents = topic_contents
+        if contents is None:
+            contents = get_topic_contents( topic_name, template=topic_template )
         create_file( topic_file_and_path, contents, overwrite=overwrite )
     else:
-        logger.info(f"Using existing topic file: {topic_file}")
+        logger.info("Using existing topic file: {}", topic_file)
 
     logger.success(f"Topic created: '{topic_name}' to '{os.path.normpath( os.path.join(destination,basename))}' wrapper, topic, and assets")
     return topic_file_and_path, wrapper_file_and_path
@@ -272,45 +496,105 @@ def extract_assets_from_file( filename ):
     return assets
 
 
-def copy_files_to_destination(destination_folder, file_list, overwrite=False, confirm=False):
+def copy_files_to_destination(destination_folder, file_list, overwrite=False, confirm=False, link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS,
+                               source_folder="."):
+    """ copy files to the same relative paths under destination_folder
+
+    Paths in file_list are relative to source_folder, the current folder by
+    default.
+
+    Existing files are only replaced with overwrite=True, and then only if
+    they differ from the source by size and mtime (or content, with
+    checksum=True).  With link="hard" or link="reflink" files are linked
+    rather than copied where the filesystem allows.
+
+    Copies run on a pool of io_workers threads.  A failed copy doesn't stop
+    the others; failures are logged once everything has finished.
+
+    :return: list of (file_path, error) for the copies that failed
+    """
+    copies = []
+    queued = set()
     for file_path in file_list:
         # Construct the full source path
-        full_source_path = os.path.normpath( os.path.abspath(file_path) )
+        full_source_path = os.path.normpath( os.path.abspath( os.path.join( source_folder, file_path ) ) )
         
         # Check if the source file exists
         if not os.path.exists(full_source_path):
-            logger.info(f'Source file does not exist: {full_source_path}')
+            logger.info('Source file does not exist: {}', full_source_path)
             continue
 
         if confirm:
             # Construct the full destination path
-            relative_path = os.path.normpath( os.path.relpath(file_path) )
+            relative_path = os.path.normpath( os.path.relpath( full_source_path, source_folder ) )
             full_destination_path = os.path.normpath( os.path.join(destination_folder, relative_path) )
-            
-            # Create any necessary directories at the destination
-            os.makedirs(os.path.dirname(full_destination_path), exist_ok=True)
-            
+            # the same asset is often used by several topics
+            if full_destination_path not in queued:
+                queued.add( full_destination_path )
+                copies.append( (file_path, full_source_path, full_destination_path) )
+        else:
+            logger.info("Found: {}", file_path)
+
+    # Create each destination directory once, not once per file
+    folder_errors = {}
+    for folder in sorted( set( os.path.dirname( job[2] ) for job in copies ) ):
+        try:
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            folder_errors[folder] = e
+
+    def copy_one(job):
+        file_path, full_source_path, full_destination_path = job
+        error = folder_errors.get( os.path.dirname( full_destination_path ) )
+        if error is not None:
+            return error
+        try:
             # Check if the file exists and if we should overwrite it
             if os.path.exists(full_destination_path) and not overwrite:
-                logger.info(f'Skipped {full_destination_path} (already exists)')
-                continue
-            
+                if is_up_to_date(full_source_path, full_destination_path, checksum=checksum):
+                    return f'Skipped {full_destination_path} (already exists)'
+                return f'Skipped {full_destination_path} (already exists and differs, use --overwrite)'
+
             # Copy the file to the destination
-            shutil.copy2(full_source_path, full_destination_path)
-            logger.info(f'Copied {file_path} to {full_destination_path}')
+            action = sync_file(full_source_path, full_destination_path, link=link, checksum=checksum)
+        except OSError as e:
+            return e
+        if action == "skipped":
+            return f'Skipped {full_destination_path} (unchanged)'
+        return f'{action.capitalize()} {file_path} to {full_destination_path}'
+
+    if io_workers <= 1 or len(copies) <= 1:
+        results = [copy_one(job) for job in copies]
+    else:
+        with ThreadPoolExecutor(max_workers=io_workers) as pool:
+            results = list(pool.map(copy_one, copies))
+
+    errors = []
+    for job, result in zip(copies, results):
+        if isinstance(result, OSError):
+            errors.append( (job[0], result) )
         else:
-            logger.info(f"Found: {file_path}")
+            logger.info(result)
+    for file_path, error in errors:
+        logger.error(f'Unable to copy {file_path} to {destination_folder}: {error}')
+    return errors
 
-def copy_asset_files( content, destination=".", overwrite=False, confirm=False ):
-    """ scan and copy content (a list) looking for 'assets/*'. """
-    logger.debug(f"copying asset files")
+def extract_asset_files( content ):
+    """ return the 'assets/*' paths referenced in content (a list of lines) """
     files = []
-    for i,line in enumerate( content ):
-        matches = extract_filenames( line )
-        for match in matches:
-            files.append( match )
+    for line in content:
+        files.extend( extract_filenames( line ) )
+    return files
+
+def copy_asset_files( content, destination=".", overwrite=False, confirm=False, link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS,
+                      source_folder="." ):
+    """ scan and copy content (a list) looking for 'assets/*'. """
+    logger.debug("copying asset files")
+    files = extract_asset_files( content )
     logger.debug( files )
-    copy_files_to_destination( destination, files, overwrite=overwrite, confirm=confirm )
+    return copy_files_to_destination( destination, files, overwrite=overwrite, confirm=confirm, link=link, checksum=checksum,
+                                      io_workers=io_workers, source_folder=source_folder )
     
 def extract_lecture_number(filename):
     match = re.search(r'lect(?:ure)?-?(\d+)', filename)
@@ -318,103 +602,347 @@ def extract_lecture_number(filename):
         return int(match.group(1))
     return None
 
-def scan_for_topics( filename, confirm=False, overwrite=False, destination="." ):
-    """ scan filename for topics """
-    logger.debug(f'entering scan_for_topics: {filename}')
-    include_pattern = r'\{\{< include [\'"]?([^\'">]+)[\'"]? >\}\}'
+include_pattern = re.compile(r'\{\{< include [\'"]?([^\'">]+)[\'"]? >\}\}')
+
+def iter_topic_blocks( lines, uses_topics=None, filename=None ):
+    """ yield (topic, lines) for each '# ' block of a lecture, as soon as the next '# ' closes it
 
-    blocks = {}
+    The text before the first topic is yielded as "prefix".  Fenced code is
+    passed through untouched and "## Housekeeping" sections are dropped.
+    Files named by {{< include >}} are recorded in uses_topics.
+    """
     key = "prefix"
-    blocks["prefix"] = []
-    logger.success(f'Loading: {filename}')
-    uses_topics = {}
-    try:
-        with open(filename, 'r',  encoding='utf-8' ) as file:
-            lines = file.readlines()
-            ignore = False
-            in_housekeeping = False
-            logger.debug(filename)
-            for i, line in enumerate(lines):
-                if line.startswith("```"):
-                    ignore = not ignore
-                    if ignore:
-                        logger.trace("block on")
-                    else:
-                        logger.trace("block off")
-                    if not in_housekeeping:
-                        blocks[key].append(line)
-                    continue
-                if not ignore:
-                    # Toggle in and out of Housekeeping sections.
-                    if line.lower().startswith("## housekeeping"):
-                        logger.debug(f"Housekeeping  ON: {key}  - {filename}")
-                        in_housekeeping = True
-                    elif in_housekeeping and (line.startswith("# ") or line.startswith("## ")):
-                        in_housekeeping = False
-                        logger.debug(f"Housekeeping OFF: {key}  - {filename}")
-                        logger.debug(f"{line}")
-                    
-                    # this identifies a topic block.
-                    if line.startswith("# "):
-                        key = line[2:].strip()
-                        logger.debug(f"found {key}")
-                        blocks[key] = []
-                        continue
-    
-                    # Track any use of {{< include ... }} statements.
-                    # If found, add to "uses_topics" list.
-                    match = re.search(include_pattern, line)
-                    if match:
-                        uses_topics[ match.group(1) ] = match.group(1)
-                if not in_housekeeping:
-                    blocks[key].append( line )
-    except Exception as e:
-        logger.error(f"unable to load file: {filename}\n{e}")
-        sys.exit(1)
+    block = []
+    ignore = False
+    in_housekeeping = False
+    for line in lines:
+        if line.startswith("```"):
+            ignore = not ignore
+            if ignore:
+                logger.trace("block on")
+            else:
+                logger.trace("block off")
+            if not in_housekeeping:
+                block.append(line)
+            continue
+        if not ignore:
+            # Toggle in and out of Housekeeping sections.
+            if line.lower().startswith("## housekeeping"):
+                logger.debug("Housekeeping  ON: {}  - {}", key, filename)
+                in_housekeeping = True
+            elif in_housekeeping and (line.startswith("# ") or line.startswith("## ")):
+                in_housekeeping = False
+                logger.debug("Housekeeping OFF: {}  - {}", key, filename)
+                logger.debug("{}", line)
+
+            # this identifies a topic block.
+            if line.startswith("# "):
+                yield key, block
+                key = line[2:].strip()
+                logger.debug("found {}", key)
+                block = []
+                continue
+
+            # Track any use of {{< include ... }} statements.
+            # If found, add to "uses_topics" list.
+            match = include_pattern.search(line)
+            if match and uses_topics is not None:
+                uses_topics[ match.group(1) ] = match.group(1)
+        if not in_housekeeping:
+            block.append( line )
+    yield key, block
+
+def get_lecture_tags( filename ):
+    """ tags for topics scanned from a lecture: lecture, and lecture-NN when the file name has a number """
+    number = extract_lecture_number( filename )
+    return ["lecture"] if number is None else ["lecture", f"lecture-{number:02}"]
 
+def get_lecture_source( filename ):
+    """ lecture path relative to the root of the git repository holding it """
+    path = os.path.abspath( filename )
+    return os.path.relpath( path, get_git_root_for( os.path.dirname( path ) ) )
+
+def write_topic_block( filename, key, block, confirm=False, overwrite=False, destination=".", source_folder=".", replace=False ):
+    """ create topic files for one block of a lecture.
+
+    With replace=True the topic was created from an earlier block with the same
+    title in this scan, and only its _topic file is rewritten with this block.
+
+    :return: the assets the block uses.  They are copied by the caller, together with those of other blocks.
+    """
+    logger.debug( key )
+    logger.trace( block )
+    if confirm and replace:
+        topic_file_and_path = os.path.normpath( os.path.join( destination, "_" + clean_topic_name( key ) + ".qmd" ) )
+        create_file( topic_file_and_path, f"\n# {key}\n" + "".join(block), overwrite=True )
+    elif confirm:
+        content = f"\n# {key}\n" + "".join(block)
+        tasl = dict( topic=key, source=get_lecture_source( filename ), tags=get_lecture_tags( filename ) )
+        # a new wrapper is written with its tasl header; an existing one is updated
+        wrapper_existed = os.path.exists( os.path.join( destination, clean_topic_name( key ) + ".qmd" ) )
+        topic_file_and_path,wrapper_file_and_path = add_new_topic( key, destination=destination, overwrite=overwrite, topic_contents=content,
+                                                                   wrapper_header=dict( tasl=tasl ) )
+        if wrapper_existed:
+            update_yaml_header( wrapper_file_and_path, tasl=tasl )
+    else:
+        logger.success(f"Found: {clean_topic_name( key )}" )
+        # this call to copy_asset_files will only display asset file found
+        copy_asset_files( block, destination=destination, overwrite=overwrite, confirm=confirm, source_folder=source_folder )
+    return extract_asset_files( block )
+
+def scan_for_topics( filename, confirm=False, overwrite=False, destination=".", link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS,
+                     source_folder=".", lecture=None, copy_assets=True ):
+    """ scan filename for topics
+
+    Topics are written as soon as they are read, so memory is bounded by the
+    largest topic rather than the whole lecture.  When a title appears more
+    than once the last block wins, as it did when the whole lecture was read
+    first.  Assets, found relative to source_folder, are copied at the end,
+    io_workers at a time.
+
+    scan_lectures passes lecture, the parse_lecture dict of filename, so the
+    file isn't read again, and copy_assets=False to copy the assets of every
+    lecture together.
+
+    :return: dict(topics=[topic titles], includes=[included files], assets=[asset files],
+                  errors=[(asset, error)] for assets that could not be copied)
+    :raises LectureReadError: filename could not be read
+    """
+    logger.debug('entering scan_for_topics: {}', filename)
+
+    logger.success(f'Loading: {filename}')
     if destination==".":
         logger.warning(f"Creating topics in current directory. Topics are usually created somewhere else.")
-        
-    # with each block identified, create new files in destination
-    for key in [ key for key in blocks.keys() if not key in ['prefix'] ]:
-        logger.debug( key )
-        logger.trace( blocks[key] )
-        if confirm:
-            content = f"\n# {key}\n" + "".join(blocks[key])
-            topic_file_and_path,wrapper_file_and_path = add_new_topic( key, destination=destination, overwrite=overwrite, topic_contents=content )
-            copy_asset_files( blocks[key], destination=destination, overwrite=overwrite, confirm=confirm )
-            tasl = dict( topic=key, source=get_repo_relative_path( filename ), tags=["lecture",f"lecture-{extract_lecture_number( filename ):02}"] )
-            update_yaml_header( wrapper_file_and_path, tasl=tasl )
-        else:
-            logger.success(f"Found: {clean_topic_name( key )}" )
-            # this call to copy_asset_files will only display asset file found
-            copy_asset_files( blocks[key], destination=destination, overwrite=overwrite, confirm=confirm )
+
+    uses_topics = {}
+    # topic title -> True when this scan created its _topic file, so a later block with the title replaces it
+    seen = {}
+    block_assets = {}
+
+    def write_blocks( blocks ):
+        for key, block in blocks:
+            if key in ['prefix']:
+                continue
+            replace = seen.get( key, False )
+            if key in seen:
+                logger.warning(f"Topic '{key}' appears more than once in {filename}.  The last one is kept.")
+            else:
+                seen[key] = confirm and not os.path.exists( os.path.join( destination, "_" + clean_topic_name( key ) + ".qmd" ) )
+            with span("write topic", topic=key):
+                block_assets[key] = write_topic_block( filename, key, block, confirm=confirm, overwrite=overwrite, destination=destination,
+                                                       source_folder=source_folder, replace=replace )
+
+    scan_span = begin_span("scan", file=filename)
+    if lecture is not None:
+        uses_topics = { include: include for include in lecture["includes"] }
+        write_blocks( lecture["blocks"] )
+    else:
+        try:
+            with open(filename, 'r',  encoding='utf-8' ) as file:
+                logger.debug(filename)
+                write_blocks( iter_topic_blocks( file, uses_topics, filename=filename ) )
+        except (OSError, UnicodeDecodeError) as e:
+            raise LectureReadError(f"unable to load file: {filename}\n{e}") from e
+
+    end_span( scan_span, topics=len( seen ) )
+
+    assets = { asset: asset for found in block_assets.values() for asset in found }
+    errors = []
+    if confirm and copy_assets:
+        with span("copy assets", assets=len( assets )):
+            errors = copy_files_to_destination( destination, assets, overwrite=overwrite, confirm=confirm, link=link, checksum=checksum,
+                                                io_workers=io_workers, source_folder=source_folder )
 
     for key in uses_topics:
         logger.success(f"Includes: {key}")
 
-    if (not confirm) and (len( blocks.keys() ) > 1):
+    if (not confirm) and (len( seen ) > 0):
         logger.warning(f"Use --confirm to save topics to files.  Use --overwrite if files already exists.")
+    return dict( topics=list( seen ), includes=list( uses_topics ), assets=list( assets ), errors=errors )
 
 
-def copy_topic_file_to_folder( filename, confirm=False, overwrite=False, destination="." ):
-    """ Copy a topic identified by it's wrapper file to a new destination folder """
-    logger.debug(f"Entering copy_topic_file_to_folder: {filename}")
-    files = []
-    files.append( filename )
-    topic_file = "_" + filename
-    files.append( topic_file )
-    files = files + extract_assets_from_file( topic_file )
-    logger.debug( files )
-    copy_files_to_destination( destination, files, overwrite=overwrite, confirm=confirm )
-    if confirm:
-        logger.success(f"Topic {filename} copied to {destination}")
+def parse_lecture( filename ):
+    """ read the topic blocks of a lecture
+
+    :return: dict(filename=, blocks=[(topic title, lines)], includes=[included files])
+    :raises LectureReadError: filename could not be read
+    """
+    uses_topics = {}
+    try:
+        with open(filename, 'r',  encoding='utf-8' ) as file:
+            blocks = [ (key, block) for key, block in iter_topic_blocks( file, uses_topics, filename=filename ) if key != "prefix" ]
+    except (OSError, UnicodeDecodeError) as e:
+        raise LectureReadError(f"unable to load file: {filename}\n{e}") from e
+    return dict( filename=filename, blocks=blocks, includes=list( uses_topics ) )
+
+def parse_lecture_captured( filename, log_level ):
+    """ process pool worker.  Log records are handed back so the parent can print them in file order. """
+    records = []
+    capture_log_records( records, log_level )
+    try:
+        return parse_lecture( filename ), None, records
+    except LectureReadError as e:
+        return None, str( e ), records
+
+def parse_lectures( filenames, jobs=1, log_level="SUCCESS" ):
+    """ parse lectures, optionally across a process pool.  Returns their parse_lecture dicts in order.
+
+    :raises LectureReadError: listing every lecture that could not be read
+    """
+    lectures = []
+    errors = []
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            try:
+                lectures.append( parse_lecture( filename ) )
+            except LectureReadError as e:
+                errors.append( str( e ) )
     else:
-        logger.success(f"Topic {filename} NOT copied to {destination}.  Use --confirm")
+        logger.info("Scanning {} lectures with {} workers", len(filenames), jobs)
+        with ProcessPoolExecutor( max_workers=min( jobs, len(filenames) ) ) as pool:
+            futures = [ pool.submit( parse_lecture_captured, filename, log_level ) for filename in filenames ]
+            # results are collected in submission order, so each lecture's log stays together
+            for filename, future in zip( filenames, futures ):
+                try:
+                    lecture, error, records = future.result()
+                except Exception as e:
+                    lecture, error, records = None, f"Worker failed scanning {filename}: {e}", []
+                replay_log_records( records )
+                if error is None:
+                    lectures.append( lecture )
+                else:
+                    errors.append( error )
+    if errors:
+        raise LectureReadError( "\n".join( errors ) )
+    return lectures
+
+def get_topic_header( wrapper_file ):
+    """ YAML header of a topic wrapper, or {} when it can't be read """
+    try:
+        header = get_yaml_header( wrapper_file )
+    except ( OSError, ValueError, yaml.YAMLError ):
+        return {}
+    return header if isinstance( header, dict ) else {}
+
+def find_topic_collisions( lectures, destination="." ):
+    """ return {topic name: [(lecture or topic file, topic title), ...]} for the names that would be created twice
+
+    A name collides when more than one lecture would create it, or when a
+    topic of that name in destination was scanned from another lecture or
+    made by hand.
+    """
+    sources = {}
+    for lecture in lectures:
+        for key, block in lecture["blocks"]:
+            found = sources.setdefault( clean_topic_name( key ), {} )
+            # a topic repeated within one lecture is warned about, not a collision
+            found.setdefault( lecture["filename"], key )
+
+    for name, found in sources.items():
+        wrapper_file = os.path.join( destination, name + ".qmd" )
+        if not os.path.exists( wrapper_file ):
+            continue
+        header = get_topic_header( wrapper_file )
+        tasl = header.get( "tasl" )
+        source = tasl.get( "source" ) if isinstance( tasl, dict ) else None
+        try:
+            lecture_sources = { get_lecture_source( filename ) for filename in found }
+        except NotInGitRepositoryError:
+            lecture_sources = set()
+        # rescanning the lecture a topic came from updates it, that's no collision
+        if source is None or source not in lecture_sources:
+            found[ os.path.normpath( wrapper_file ) ] = header.get( "title", name )
+    return { name: list( found.items() ) for name, found in sources.items() if len( found ) > 1 }
+
+def scan_lectures( filenames, confirm=False, overwrite=False, destination=".", link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS,
+                   jobs=1, log_level="SUCCESS", source_folder="." ):
+    """ scan several lectures for topics as one batch
+
+    The lectures are parsed first, jobs at a time in worker processes.  Topic
+    names that two lectures would create, or that a topic already in
+    destination has, are then reported: as an error before anything is
+    written with confirm, as a warning on a dry run.  Each lecture's topics
+    are written by scan_for_topics, and the assets of every lecture, found
+    relative to source_folder, are copied together.
+
+    :return: dict(topics=[topic titles], includes=[included files], assets=[asset files],
+                  errors=[(asset, error)] for assets that could not be copied)
+    :raises LectureReadError: a lecture could not be read.  Nothing is written.
+    :raises TopicExistsError: with confirm, topic names collide.  Nothing is written.
+    """
+    with span("parse lectures", files=len( filenames )):
+        lectures = parse_lectures( filenames, jobs=jobs, log_level=log_level )
+
+    collisions = find_topic_collisions( lectures, destination=destination )
+    if collisions:
+        lines = [ f"  {name}: " + ", ".join( f"'{key}' in {filename}" for filename, key in found )
+                  for name, found in sorted( collisions.items() ) ]
+        message = f"{len(collisions)} topics are in more than one lecture or already in {destination}."
+        if confirm:
+            raise TopicExistsError( message + "  Nothing written.\n" + "\n".join( lines ) )
+        logger.warning( message + "\n" + "\n".join( lines ) )
+
+    topics = {}
+    uses_topics = {}
+    assets = {}
+    for lecture in lectures:
+        result = scan_for_topics( lecture["filename"], confirm=confirm, overwrite=overwrite, destination=destination,
+                                  source_folder=source_folder, lecture=lecture, copy_assets=False )
+        topics.update( ( key, key ) for key in result["topics"] )
+        uses_topics.update( ( include, include ) for include in result["includes"] )
+        assets.update( ( asset, asset ) for asset in result["assets"] )
+
+    errors = []
+    if confirm:
+        with span("copy assets", assets=len( assets )):
+            errors = copy_files_to_destination( destination, assets, overwrite=overwrite, confirm=confirm, link=link, checksum=checksum,
+                                                io_workers=io_workers, source_folder=source_folder )
+    return dict( topics=list( topics ), includes=list( uses_topics ), assets=list( assets ), errors=errors )
+
+def copy_topic_file_to_folder( filename, confirm=False, overwrite=False, destination=".", link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS ):
+    """ Copy a topic identified by it's wrapper file to a new destination folder """
+    return copy_topic_files_to_folder( [filename], confirm=confirm, overwrite=overwrite, destination=destination,
+                                       link=link, checksum=checksum, io_workers=io_workers )
+
+
+def copy_topic_files_to_folder( filenames, confirm=False, overwrite=False, destination=".", link=None, checksum=False, io_workers=DEFAULT_IO_WORKERS ):
+    """ Copy topics identified by their wrapper files to a new destination folder
+
+    The files of all the topics are copied together on one pool of io_workers threads.
+
+    :return: list of (file, error) for files that could not be copied
+    """
+    logger.debug("Entering copy_topic_files_to_folder: {}", filenames)
+    # files and assets are copied relative to the folder holding each wrapper
+    folders = {}
+    for filename in filenames:
+        folder, wrapper_file = os.path.split( filename )
+        files, assets = folders.setdefault( folder or ".", ( [], [] ) )
+        files.append( wrapper_file )
+        files.append( "_" + wrapper_file )
+        assets.extend( extract_assets_from_file( os.path.join( folder, "_" + wrapper_file ) ) )
+    errors = []
+    for folder, ( files, assets ) in folders.items():
+        logger.debug( "{} {} {}", folder, files, assets )
+        # topic files are always real copies, they get edited.  Only assets are linked.
+        errors = errors + copy_files_to_destination( destination, files, overwrite=overwrite, confirm=confirm, checksum=checksum,
+                                                     io_workers=io_workers, source_folder=folder )
+        errors = errors + copy_files_to_destination( destination, assets, overwrite=overwrite, confirm=confirm, link=link, checksum=checksum,
+                                                     io_workers=io_workers, source_folder=folder )
+    failed = set( os.path.basename( file ) for file, error in errors )
+    for filename in filenames:
+        wrapper_file = os.path.basename( filename )
+        if confirm and ( wrapper_file in failed or "_" + wrapper_file in failed ):
+            logger.warning(f"Topic {filename} only partly copied to {destination}")
+        elif confirm:
+            logger.success(f"Topic {filename} copied to {destination}")
+        else:
+            logger.success(f"Topic {filename} NOT copied to {destination}.  Use --confirm")
+    return errors
 
 
 def copy_topic_file( from_filename, to_filename ):
-    logger.info(f"Entering copy_topic_file: {from_filename} to {to_filename}")
+    logger.info("Entering copy_topic_file: {} to {}", from_filename, to_filename)
     try:
         # Step 1: check if to_filename exists
         if os.path.exists(to_filename):
@@ -444,10 +972,9 @@ def copy_topic_file( from_filename, to_filename ):
 
         content = content.replace("_" + from_filename, "_" + to_filename)
 
-        with open(to_filename, "w", encoding="utf-8") as f:
-            f.write(content)
+        write_file_if_changed(to_filename, content)
 
-        logger.info(f"Successfully copied and updated {from_filename} -> {to_filename}")
+        logger.info("Successfully copied and updated {} -> {}", from_filename, to_filename)
         return True
 
     except Exception as e:
@@ -462,19 +989,23 @@ def rename_topic_includes( filename, old_topic_file, new_topic_file ):
     for i,line in enumerate(lines):
         if old_topic_file in line:
             line = line.replace(old_topic_file, new_topic_file )
-            logger.debug(f"replacing {old_topic_file} with {new_topic_file}")
+            logger.debug("replacing {} with {}", old_topic_file, new_topic_file)
         new_lines.append( line )
-    with open(filename, 'w') as file:
-        file.writelines(new_lines)
+    write_file_if_changed(filename, ''.join(new_lines))
+    # a rewrite can land within the same mtime tick and size as the old header
+    load_yaml_header.cache_clear()
     return
 
 
-def rename_topic_file( basename, new_topic, confirm=False ):
-    """ rename a topic identified by it's wrapper file to a new topic name """
-    logger.debug(f"Renaming {basename} to {new_topic}")
+def rename_topic_file( basename, new_topic, confirm=False, directory_path="." ):
+    """ rename a topic identified by it's wrapper file to a new topic name
+
+    :return: True if the topic was renamed
+    """
+    logger.debug("Renaming {} to {}", basename, new_topic)
 
-    original_wrapper_file = basename + ".qmd"
-    original_topic_file = "_" + original_wrapper_file
+    original_wrapper_file = os.path.normpath( os.path.join( directory_path, basename + ".qmd" ) )
+    original_topic_file = os.path.normpath( os.path.join( directory_path, "_" + basename + ".qmd" ) )
     ok = True
     if not os.path.exists( original_wrapper_file ):
         logger.warning(f"Missing {original_wrapper_file}.  Check your folder.")
@@ -484,8 +1015,8 @@ def rename_topic_file( basename, new_topic, confirm=False ):
         ok = False
 
     new_basename = clean_topic_name( new_topic )
-    new_wrapper_file = new_basename + ".qmd"
-    new_topic_file = "_" + new_wrapper_file
+    new_wrapper_file = os.path.normpath( os.path.join( directory_path, new_basename + ".qmd" ) )
+    new_topic_file = os.path.normpath( os.path.join( directory_path, "_" + new_basename + ".qmd" ) )
 
     if os.path.exists( new_wrapper_file ):
         logger.warning(f"Already exists {new_wrapper_file}.  Try a different topic name.")
@@ -498,11 +1029,13 @@ def rename_topic_file( basename, new_topic, confirm=False ):
     if ok and confirm:
         shutil.move( original_wrapper_file, new_wrapper_file )
         shutil.move( original_topic_file, new_topic_file )
-        rename_topic_includes( new_wrapper_file, original_topic_file, new_topic_file )
+        rename_topic_includes( new_wrapper_file, os.path.basename( original_topic_file ), os.path.basename( new_topic_file ) )
         update_yaml_header( new_wrapper_file, title=new_topic )
         logger.success(f"Topic renamed from '{basename}' to '{new_basename}'")
+        return True
     elif not confirm:
         logger.success(f"Topic NOT renamed from '{basename}' to '{new_basename}'.  Use --confirm")
+    return False
 
 
 def categorize_keywords(keywords):
@@ -530,7 +1063,16 @@ def load_topic_files_from_directory(directory_path):
     Load all files in the specified directory.
 
     :param directory_path: Path to the directory containing files.
-    :return: Dictionary with filenames as keys and file contents as values.
+    :return: Dictionary with filenames as keys and lowercased file contents and wrapper YAML as values.
+    """
+    return read_topic_files_from_directory( directory_path )
+
+def read_topic_files_from_directory(directory_path):
+    """
+    Read all topic files in the specified directory, bypassing the topic index.
+
+    :param directory_path: Path to the directory containing files.
+    :return: Dictionary with filenames as keys and lowercased file contents and wrapper YAML as values.
     """
     files_content = {}
 
@@ -541,73 +1083,103 @@ def load_topic_files_from_directory(directory_path):
         if os.path.isfile(file_path):
             try:
                 with open(file_path, 'r', encoding='utf-8') as file:
-                    files_content[filename] = dict(content=file.read())
-                files_content[filename]["yaml"] = get_yaml_header( filename[1:] )
+                    files_content[filename] = dict(content=file.read().lower())
+                files_content[filename]["yaml"] = get_yaml_header( os.path.join(directory_path, filename[1:]) )
             except Exception as e:
                 logger.error(f"An error occurred: {file_path}\n{e}")
                 return {}
             
     return files_content
 
-def search_files(directory_path, include_keywords, exclude_keywords, with_tags=[], without_tags=[]):
+def search_files(directory_path, include_keywords, exclude_keywords, with_tags=[], without_tags=[], match="token"):
     """
     Search text files for specific keywords to include and exclude.
 
+    Keywords are resolved against the inverted index in .tasl/index.db.  With
+    match="token" a keyword must appear as a whole word; match="substring"
+    matches anywhere in the topic, as a plain `in` test would.
+
     :param directory_path: Path to the directory containing files.
     :param include_keywords: List of keywords to include.
     :param exclude_keywords: List of keywords to exclude.
     :param with_tag: list of tags to include
     :param without_tags
+    :param match: "token" or "substring"
     :return: List of filenames that meet the criteria.
     """
+    from tasl.index import open_topic_index, refresh_topic_index, load_topic_headers, match_keywords
 
-    files_content = load_topic_files_from_directory(directory_path)
+    with_tags = with_tags or []
+    without_tags = without_tags or []
 
-    if files_content=={}:
+    load_span = begin_span("load", folder=directory_path)
+    filter_span = None
+    try:
+        conn = open_topic_index( directory_path )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Topic index unavailable, reading files directly: {e}")
+        conn = None
+
+    if conn is None:
+        # no index, fall back to substring matching over the file contents
+        files_content = read_topic_files_from_directory( directory_path )
+        headers = { filename: content["yaml"] for filename, content in files_content.items() }
+        end_span( load_span, topics=len( headers ) )
+        filter_span = begin_span("filter")
+        included = { filename for filename, content in files_content.items()
+                     if any(keyword.lower() in content["content"] for keyword in include_keywords) }
+        excluded = { filename for filename, content in files_content.items()
+                     if any(keyword.lower() in content["content"] for keyword in exclude_keywords) }
+    else:
+        try:
+            refresh_topic_index( conn, directory_path )
+            headers = load_topic_headers( conn )
+            end_span( load_span, topics=len( headers ) )
+            filter_span = begin_span("filter")
+            included = match_keywords( conn, directory_path, include_keywords, match=match )
+            excluded = match_keywords( conn, directory_path, exclude_keywords, match=match )
+        except Exception as e:
+            logger.error(f"An error occurred: {directory_path}\n{e}")
+            return [],[]
+        finally:
+            conn.close()
+
+    if headers=={}:
         return [],[]
 
-    result_files = [file for file in files_content]
-    logger.debug(f"include_keywords: {include_keywords}")
-    logger.debug(f"with_tags: {with_tags}")
+    def get_tags( filename ):
+        header = headers[filename]
+        if isinstance(header, dict) and isinstance(header.get("tasl"), dict):
+            return header["tasl"].get("tags") or []
+        return []
+
+    result_files = [file for file in headers]
+    logger.debug("include_keywords: {}", include_keywords)
+    logger.debug("with_tags: {}", with_tags)
     if (len(include_keywords)>0) or (len(with_tags)>0):
         result_files = []
-        for filename, content in files_content.items():
-            include = any(keyword.lower() in content["content"].lower() for keyword in include_keywords)
-            if include:
+        for filename in headers:
+            if filename in included:
                 result_files.append(filename)
-                logger.debug(f'including: {filename}')
-            if "yaml" in content.keys():
-                if "tasl" in content["yaml"].keys():
-                    if "tags" in content["yaml"]["tasl"]:
-                        include = any(keyword.lower() in content["yaml"]["tasl"]["tags"] for keyword in with_tags)
-                        if include and not( filename in result_files ):
-                            result_files.append( filename )
-                            logger.debug(f'including: {filename} for tags: {content["yaml"]["tasl"]["tags"]}')
+                logger.debug('including: {}', filename)
+            elif any(keyword.lower() in get_tags( filename ) for keyword in with_tags):
+                result_files.append( filename )
+                logger.debug('including: {} for tags: {}', filename, get_tags( filename ))
 
     if len(exclude_keywords)>0 or (len(without_tags)>0):
-        for filename, content in files_content.items():
-            exclude = any(keyword.lower() in content["content"].lower() for keyword in exclude_keywords)
-            if exclude:
-                logger.debug(f'excluding: {filename}')
-                result_files = [ file for file in result_files if not file==filename ]
-            if "yaml" in content.keys():
-                if "tasl" in content["yaml"].keys():
-                    if "tags" in content["yaml"]["tasl"]:
-                        exclude = any(keyword.lower() in content["yaml"]["tasl"]["tags"] for keyword in without_tags)
-                        if exclude and ( filename in result_files ):
-                            result_files = [ file for file in result_files if not file==filename ]
-
-    available_tags = []
-    for file in result_files:
-        if "yaml" in files_content[file].keys():
-            logger.debug( files_content[file]["yaml"] )
-            if "tasl" in files_content[file]["yaml"].keys():
-                if "tags" in files_content[file]["yaml"]["tasl"].keys():
-                    for tag in files_content[file]["yaml"]["tasl"]["tags"]:
-                        logger.debug( tag )
-                        if not tag in available_tags:
-                            available_tags.append( tag )
-                            logger.debug(f"Adding tag: {tag}")
+        for filename in [ file for file in result_files if file in excluded ]:
+            logger.debug('excluding: {}', filename)
+        result_files = [ file for file in result_files
+                         if not file in excluded and not any(keyword.lower() in get_tags( file ) for keyword in without_tags) ]
+    end_span( filter_span, results=len( result_files ) )
+
+    with span("tags"):
+        available_tags = []
+        for file in result_files:
+            for tag in get_tags( file ):
+                if not tag in available_tags:
+                    available_tags.append( tag )
+                    logger.debug("Adding tag: {}", tag)
 
     return result_files, available_tags
 
@@ -632,11 +1204,11 @@ def delete_topic_files( files,confirm=False ):
     return
 
 
-def list_topic_files( filters, source_directory_path=".", add_tag=None, remove_tag=None, confirm=False, with_tags=None, without_tags=None, delete=False, copy=False, destination=None):
+def list_topic_files( filters, source_directory_path=".", add_tag=None, remove_tag=None, confirm=False, with_tags=None, without_tags=None, delete=False, copy=False, destination=None, match="token", io_workers=DEFAULT_IO_WORKERS):
     """ List topic files with filters """
     
     include,exclude = categorize_keywords( filters )
-    result_files, result_tags = search_files( source_directory_path, include, exclude, with_tags=with_tags, without_tags=without_tags )
+    result_files, result_tags = search_files( source_directory_path, include, exclude, with_tags=with_tags, without_tags=without_tags, match=match )
     logger.debug( result_files )
     logger.debug( result_tags )
 
@@ -679,41 +1251,25 @@ def list_topic_files( filters, source_directory_path=".", add_tag=None, remove_t
             logger.success("NOT copying matching topics.  Use --confirm")
         return
     
+    wrapper_files = [ os.path.join( source_directory_path, file[1:] ) for file in result_files ]
+
     if not add_tag is None:
         if confirm:
-            for file in result_files:
-                logger.debug(f"getting header from: {file[1:]}")
-                header = get_yaml_header( file[1:] )
-                logger.debug( header )
-                if not "tasl" in header.keys():
-                    header["tasl"] = {}
-                if not "tags" in header["tasl"]:
-                    header["tasl"]["tags"] = []
-                if not add_tag.lower() in header["tasl"]["tags"]:
-                    header["tasl"]["tags"].append( add_tag.lower() )
-                logger.debug( header )
-                update_yaml_header(file[1:], **header )
-                h2 = get_yaml_header( file[1:] )
-                logger.debug(f"h2: {h2}")
-                logger.success(f"Adding tag: '{add_tag}' to YAML headers for {file[1:]}.")
+            for result in mutate_tags( wrapper_files, add_tags=[add_tag], workers=io_workers ):
+                if result["changed"]:
+                    logger.success(f"Adding tag: '{add_tag}' to YAML headers for {os.path.basename(result['filename'])}.")
+                elif result["error"] is None:
+                    logger.info("Tag '{}' already in YAML headers for {}.", add_tag, os.path.basename(result['filename']))
         else:
             logger.success(f"NOT Adding tag: '{add_tag}' to YAML headers.  Use --confirm")
 
     if not remove_tag is None:
         if confirm:
-            for file in result_files:
-                logger.debug(f"getting header from: {file[1:]}")
-                header = get_yaml_header( file[1:] )
-                logger.debug( header )
-                if not "tags" in header.keys():
-                    header["tags"] = []
-                if remove_tag in header["tags"]:
-                    header["tags"] = [ tag for tag in header["tags"] if not tag.lower()==remove_tag.lower() ]
-                logger.debug( header )
-                update_yaml_header(file[1:], **header )
-                h2 = get_yaml_header( file[1:] )
-                logger.debug(f"h2: {h2}")
-            logger.success(f"Removing tag: '{add_tag}' from YAML headers.")
+            results = mutate_tags( wrapper_files, remove_tags=[remove_tag], workers=io_workers )
+            for result in results:
+                if result["changed"]:
+                    logger.debug("Removed tag: '{}' from {}", remove_tag, result['filename'])
+            logger.success(f"Removing tag: '{remove_tag}' from YAML headers ({sum(1 for r in results if r['changed'])} changed).")
         else:
             logger.success(f"NOT Removing tag: '{remove_tag}' to YAML headers.  Use --confirm")
 
@@ -0,0 +1,204 @@
+"""
+Watch the guide and rebuild slides as it changes
+
+`tasl watch` runs in the slides folder, like `tasl slides-from`.  It watches
+the guide QMDs (../guide), their rendered HTML (../docs/guide) and the guide
+assets, and reconverts only the chapter that changed.  Bursts of saves (an
+editor's save followed by Quarto's render) are debounced into one rebuild.
+
+Linux inotify is used where available, through ctypes so nothing extra needs
+installing.  Elsewhere the folders are polled by (mtime, size).
+"""
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from loguru import logger
+
+from tasl.slides_from_guide import GUIDE_FOLDER, GUIDE_HTML_FOLDER, convert_guide_file, copy_asset_files
+
+# inotify event bits, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+
+# a save is finished on close, or on the rename editors use for atomic saves
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_POLL_INTERVAL = 0.5
+
+# shortest wait between inotify checks, so --debounce 0 doesn't spin
+MIN_TICK = 0.05
+
+
+def load_inotify():
+    """ return libc if it has inotify, else None """
+    try:
+        libc = ctypes.CDLL( ctypes.util.find_library("c"), use_errno=True )
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def open_inotify( libc, folders ):
+    """ return (inotify fd, {watch descriptor: folder}) watching folders """
+    fd = libc.inotify_init1( IN_CLOEXEC )
+    if fd < 0:
+        raise OSError( ctypes.get_errno(), "inotify_init1 failed" )
+    watches = {}
+    for folder in folders:
+        wd = libc.inotify_add_watch( fd, os.fsencode( folder ), WATCH_MASK )
+        if wd < 0:
+            os.close( fd )
+            raise OSError( ctypes.get_errno(), f"unable to watch {folder}" )
+        watches[wd] = folder
+    return fd, watches
+
+
+def read_inotify_events( fd, watches ):
+    """ read pending events from an inotify fd, returning the set of paths changed """
+    data = os.read( fd, 64 * 1024 )
+    changed = set()
+    offset = 0
+    while offset < len( data ):
+        wd, mask, cookie, length = INOTIFY_EVENT.unpack_from( data, offset )
+        offset += INOTIFY_EVENT.size
+        name = data[offset:offset + length].rstrip( b"\0" )
+        offset += length
+        if wd in watches and name:
+            changed.add( os.path.join( watches[wd], os.fsdecode( name ) ) )
+    return changed
+
+
+def iter_inotify_changes( folders, tick ):
+    """ yield the set of paths changed in folders, or an empty set every tick seconds without events """
+    libc = load_inotify()
+    if libc is None:
+        raise OSError( errno.ENOSYS, "inotify is not available" )
+    fd, watches = open_inotify( libc, folders )
+    try:
+        while True:
+            ready, _, _ = select.select( [fd], [], [], tick )
+            yield read_inotify_events( fd, watches ) if ready else set()
+    finally:
+        os.close( fd )
+
+
+def snapshot_folders( folders ):
+    """ return {path: (mtime_ns, size)} for the files directly in folders """
+    snapshot = {}
+    for folder in folders:
+        try:
+            entries = os.scandir( folder )
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.path] = ( stat.st_mtime_ns, stat.st_size )
+                except OSError:
+                    pass
+    return snapshot
+
+
+def iter_polled_changes( folders, interval ):
+    """ yield the set of paths changed in folders every interval seconds, by comparing stat snapshots """
+    before = snapshot_folders( folders )
+    while True:
+        time.sleep( interval )
+        after = snapshot_folders( folders )
+        yield { path for path in before.keys() | after.keys() if before.get( path ) != after.get( path ) }
+        before = after
+
+
+def iter_changes( folders, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL, polling=False ):
+    """ yield sets of changed paths, using inotify unless polling=True or it is unavailable """
+    if not polling:
+        try:
+            # wake at least twice per debounce period, to notice when saves have settled
+            yield from iter_inotify_changes( folders, max( debounce / 2, MIN_TICK ) )
+            return
+        except OSError as e:
+            logger.info("inotify unavailable ({}), polling every {}s", e, poll_interval)
+    yield from iter_polled_changes( folders, poll_interval )
+
+
+def classify_change( path, exclude_files=() ):
+    """ return ("chapter", guide qmd name), ("assets", None) or (None, None) for a changed path """
+    folder, name = os.path.split( path )
+    base, ext = os.path.splitext( name )
+    if name.startswith(".") or name.endswith("~"):
+        # editor swap files and our own temp files
+        return None, None
+    if os.path.normpath( folder ) == os.path.normpath( os.path.join( GUIDE_HTML_FOLDER, "assets" ) ):
+        return "assets", None
+    if ext not in ( ".qmd", ".html" ):
+        return None, None
+    qmd_name = base + ".qmd"
+    if qmd_name in exclude_files:
+        return None, None
+    return "chapter", qmd_name
+
+
+def rebuild( chapters, assets_changed, link=None, checksum=False ):
+    """ reconvert the chapters named (guide qmd names) and resync assets if needed """
+    for qmd_name in sorted( chapters ):
+        if not os.path.exists( GUIDE_FOLDER + qmd_name ):
+            logger.info("Skipping {}: not in {}", qmd_name, GUIDE_FOLDER)
+            continue
+        if not os.path.exists( GUIDE_HTML_FOLDER + os.path.splitext( qmd_name )[0] + ".html" ):
+            logger.info("Skipping {}: not rendered yet", qmd_name)
+            continue
+        start = time.perf_counter()
+        if convert_guide_file( qmd_name, link=link, checksum=checksum ):
+            logger.success(f"Rebuilt {qmd_name} in {time.perf_counter() - start:.2f}s")
+            # a conversion syncs the assets too
+            assets_changed = False
+    if assets_changed:
+        copy_asset_files( GUIDE_HTML_FOLDER + "assets", "./assets", link=link, checksum=checksum )
+        logger.success("Assets synced.")
+
+
+def watch_guide( exclude_files=("index.qmd",), debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 polling=False, link=None, checksum=False ):
+    """ rebuild slides for guide chapters as they change.  Runs until interrupted. """
+    folders = [ folder for folder in ( GUIDE_FOLDER, GUIDE_HTML_FOLDER, os.path.join( GUIDE_HTML_FOLDER, "assets" ) )
+                if os.path.isdir( folder ) ]
+    if not folders:
+        logger.error(f"Nothing to watch: {GUIDE_FOLDER} and {GUIDE_HTML_FOLDER} not found.  Run tasl watch from the slides folder.")
+        return
+    logger.success(f"Watching {', '.join( folders )}.  Press Ctrl-C to stop.")
+
+    chapters = set()
+    assets_changed = False
+    last_change = None
+    for changed in iter_changes( folders, debounce=debounce, poll_interval=poll_interval, polling=polling ):
+        now = time.monotonic()
+        for path in changed:
+            kind, qmd_name = classify_change( path, exclude_files )
+            if kind == "chapter":
+                chapters.add( qmd_name )
+            elif kind == "assets":
+                assets_changed = True
+            else:
+                continue
+            logger.debug("changed: {}", path)
+            last_change = now
+        # wait for the burst of saves to settle, then rebuild once
+        if ( chapters or assets_changed ) and now - last_change >= debounce:
+            rebuild( chapters, assets_changed, link=link, checksum=checksum )
+            chapters = set()
+            assets_changed = False
@@ -0,0 +1,21 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+
+def run_python( code, *args, cwd=None, env=None, python_options=() ):
+    """ run code in a fresh interpreter with this checkout importable; sys.argv[1:] is args """
+    environment = dict( os.environ, PYTHONPATH=ROOT, TASL_NO_SERVER="1" )
+    environment.update( env or {} )
+    return subprocess.run( [ sys.executable, *python_options, "-c", code, *args ], cwd=cwd or ROOT,
+                           env=environment, capture_output=True, text=True, timeout=60 )
+
+
+def write_topic( folder, name, body, tags=() ):
+    """ write a topic (name.qmd wrapper and _name.qmd body) into folder """
+    tag_lines = "".join( f"    - {tag}\n" for tag in tags )
+    tasl = f"tasl:\n  topic: {name}\n  tags:\n{tag_lines}" if tags else ""
+    ( folder / f"{name}.qmd" ).write_text( f"---\ntitle: \"{name}\"\n{tasl}---\n\n{{{{< include '_{name}.qmd' >}}}}\n" )
+    ( folder / f"_{name}.qmd" ).write_text( f"\n# {name}\n\n{body}\n" )
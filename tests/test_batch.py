@@ -0,0 +1,75 @@
+import os
+
+import pytest
+import yaml
+
+from tasl.batch import run_batch
+from tasl.errors import BatchError
+from tasl.utils import search_files
+
+from conftest import write_topic
+
+
+@pytest.fixture
+def topics( tmp_path ):
+    folder = tmp_path / "topics"
+    folder.mkdir()
+    write_topic( folder, "c", "Pointers in the c language.", tags=[ "draft" ] )
+    write_topic( folder, "cpp", "Templates in C++ build on c.", tags=[ "draft" ] )
+    write_topic( folder, "node", "Node.js runs JavaScript on a server." )
+    return folder
+
+
+def tags_of( folder, name ):
+    with open( folder / f"{name}.qmd" ) as file:
+        header = next( yaml.safe_load_all( file ) )
+    return ( header.get("tasl") or {} ).get("tags")
+
+
+def listing( folder ):
+    return sorted( name for name in os.listdir( folder ) if name.endswith(".qmd") )
+
+
+@pytest.mark.parametrize( "filters", [ [ "+c++" ], [ "+c", "-c++" ], [ "+node.js" ], [ "+c", "-node.js" ] ] )
+def test_tag_filters_select_what_list_finds( topics, filters ):
+    include = [ f[1:] for f in filters if f.startswith("+") ]
+    exclude = [ f[1:] for f in filters if f.startswith("-") ]
+    expected = sorted( name[1:-4] for name in search_files( str( topics ), include, exclude )[0] )
+    run_batch( [ dict( op="tag", filters=filters, add="picked" ) ], folder=str( topics ), confirm=True )
+    picked = sorted( name for name in ( "c", "cpp", "node" ) if "picked" in ( tags_of( topics, name ) or [] ) )
+    assert picked == expected
+
+
+def test_operations_see_earlier_results( topics, tmp_path ):
+    operations = [
+        dict( op="rename", topic="cpp", to="C plus plus" ),
+        dict( op="tag", topics=[ "c-plus-plus" ], remove="draft", add="week-3" ),
+        dict( op="create", topic="Brand new" ),
+        dict( op="copy", topics=[ "c-plus-plus", "brand-new" ], destination=str( tmp_path / "out" ) ),
+        dict( op="delete", topics=[ "node" ] ),
+    ]
+    before = listing( topics )
+    run_batch( operations, folder=str( topics ), confirm=False )
+    assert listing( topics ) == before
+
+    run_batch( operations, folder=str( topics ), confirm=True )
+    assert listing( topics ) == [ "_brand-new.qmd", "_c-plus-plus.qmd", "_c.qmd", "brand-new.qmd", "c-plus-plus.qmd", "c.qmd" ]
+    assert tags_of( topics, "c-plus-plus" ) == [ "week-3" ]
+    assert "_c-plus-plus.qmd" in ( topics / "c-plus-plus.qmd" ).read_text()
+    assert listing( tmp_path / "out" ) == [ "_brand-new.qmd", "_c-plus-plus.qmd", "brand-new.qmd", "c-plus-plus.qmd" ]
+    assert ( tmp_path / "out" / "c-plus-plus.qmd" ).read_text() == ( topics / "c-plus-plus.qmd" ).read_text()
+
+
+def test_conflicts_are_reported_before_anything_is_written( topics ):
+    operations = [
+        dict( op="rename", topic="cpp", to="c" ),
+        dict( op="delete", topics=[ "node" ] ),
+        dict( op="tag", topics=[ "node", "missing" ], add="x" ),
+        dict( op="create", topic="Brand new" ),
+        dict( op="create", topic="brand new" ),
+    ]
+    before = { name: ( topics / name ).read_text() for name in listing( topics ) }
+    with pytest.raises( BatchError ) as raised:
+        run_batch( operations, folder=str( topics ), confirm=True )
+    assert len( raised.value.problems ) == 4
+    assert { name: ( topics / name ).read_text() for name in listing( topics ) } == before
@@ -0,0 +1,45 @@
+"""
+Import-time budget: light commands (tasl --help, --version, list) must not
+pay for the working modules, which are imported inside the commands.
+"""
+import os
+import re
+
+from conftest import run_python
+
+# cumulative microseconds for `import tasl._main`, best of a few runs.  Most
+# of it is click and loguru; the tasl modules themselves are a few ms.
+IMPORT_BUDGET_MS = float( os.environ.get( "TASL_IMPORT_BUDGET_MS", "300" ) )
+
+HEAVY_MODULES = ( "yaml", "markdown", "bs4", "frontmatter", "markdown_it", "mdformat", "sqlite3",
+                  "tasl.utils", "tasl.index", "tasl.slides_from_guide", "tasl.batch" )
+
+
+def import_time_ms():
+    result = run_python( "import tasl._main", python_options=( "-X", "importtime" ) )
+    assert result.returncode == 0, result.stderr
+    match = re.search( r"import time:\s+\d+ \|\s+(\d+) \| tasl\._main$", result.stderr, re.MULTILINE )
+    assert match, result.stderr[-2000:]
+    return int( match.group(1) ) / 1000
+
+
+def test_import_within_budget():
+    best = min( import_time_ms() for _ in range( 3 ) )
+    assert best < IMPORT_BUDGET_MS, f"import tasl._main took {best:.1f} ms, budget {IMPORT_BUDGET_MS} ms"
+
+
+def test_heavy_modules_not_imported():
+    code = "import sys, tasl._main; print( ' '.join( name for name in sys.argv[1:] if name in sys.modules ) )"
+    result = run_python( code, *HEAVY_MODULES )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == []
+
+
+def test_help_runs_without_heavy_modules():
+    code = ( "import sys\nfrom tasl._main import cli\n"
+             "try:\n    cli( ['--help'] )\nexcept SystemExit as e:\n    assert not e.code\n"
+             f"print( 'heavy:', *[ name for name in {HEAVY_MODULES!r} if name in sys.modules ] )" )
+    result = run_python( code )
+    assert result.returncode == 0, result.stderr
+    assert "Usage:" in result.stdout
+    assert result.stdout.strip().splitlines()[-1] == "heavy:"
@@ -0,0 +1,99 @@
+import os
+import errno
+import sqlite3
+
+import pytest
+
+import tasl.index
+from tasl.index import get_index_path
+from tasl.utils import search_files
+
+from conftest import write_topic
+
+
+@pytest.fixture
+def topics( tmp_path ):
+    write_topic( tmp_path, "loops", "A for loop repeats.  While loops too.", tags=[ "python" ] )
+    write_topic( tmp_path, "stacks", "A stack is last in, first out.", tags=[ "data" ] )
+    write_topic( tmp_path, "recursion", "Recursion uses the call stack.  Looping is an alternative." )
+    return tmp_path
+
+
+def found( folder, include=(), exclude=(), **kwargs ):
+    return sorted( search_files( str( folder ), list( include ), list( exclude ), **kwargs )[0] )
+
+
+def test_token_and_substring_matching( topics ):
+    assert found( topics, [ "loop" ] ) == [ "_loops.qmd" ]
+    assert found( topics, [ "loop" ], match="substring" ) == [ "_loops.qmd", "_recursion.qmd" ]
+    assert found( topics, [ "for loop" ] ) == [ "_loops.qmd" ]
+    assert found( topics, [ "loop for" ] ) == []
+    assert found( topics, [ "stack" ], [ "recursion" ] ) == [ "_stacks.qmd" ]
+    assert found( topics, with_tags=[ "data" ] ) == [ "_stacks.qmd" ]
+    assert found( topics, without_tags=[ "python" ] ) == [ "_recursion.qmd", "_stacks.qmd" ]
+
+
+def test_index_follows_edits( topics ):
+    assert found( topics, [ "queue" ] ) == []
+    write_topic( topics, "stacks", "Now a queue: first in, first out.  Some more words to change the size." )
+    assert found( topics, [ "queue" ] ) == [ "_stacks.qmd" ]
+    assert found( topics, [ "stack" ] ) == [ "_recursion.qmd" ]
+    os.remove( topics / "_loops.qmd" )
+    assert found( topics, [ "loop" ] ) == []
+
+
+def test_index_does_not_store_bodies( topics ):
+    found( topics, [ "loop" ] )
+    conn = sqlite3.connect( get_index_path( str( topics ) ) )
+    columns = [ row[1] for row in conn.execute("PRAGMA table_info(topics)") ]
+    conn.close()
+    assert "content" not in columns
+
+
+def test_unwritable_index_falls_back_to_reading_files( topics, monkeypatch ):
+    def read_only( directory_path ):
+        raise OSError( errno.EROFS, "Read-only file system" )
+
+    monkeypatch.setattr( tasl.index, "open_topic_index", read_only )
+    assert found( topics, [ "loop" ], match="substring" ) == [ "_loops.qmd", "_recursion.qmd" ]
+    assert found( topics, [ "stack" ], [ "recursion" ], match="substring" ) == [ "_stacks.qmd" ]
+
+
+@pytest.fixture
+def languages( tmp_path ):
+    write_topic( tmp_path, "c", "Pointers in the c language." )
+    write_topic( tmp_path, "cpp", "Templates in C++ build on c." )
+    write_topic( tmp_path, "csharp", "C# has properties." )
+    write_topic( tmp_path, "node", "Node.js runs JavaScript on a server." )
+    write_topic( tmp_path, "plain", "A node in a linked list, and some js." )
+    return tmp_path
+
+
+def test_keywords_with_punctuation_match_as_text( languages ):
+    assert found( languages, [ "c++" ] ) == [ "_cpp.qmd" ]
+    assert found( languages, [ "c#" ] ) == [ "_csharp.qmd" ]
+    assert found( languages, [ "node.js" ] ) == [ "_node.qmd" ]
+    assert found( languages, [ "c" ] ) == [ "_c.qmd", "_cpp.qmd", "_csharp.qmd" ]
+
+
+def test_excluding_keywords_with_punctuation( languages ):
+    assert found( languages, [ "c" ], [ "c#" ] ) == [ "_c.qmd", "_cpp.qmd" ]
+    assert found( languages, [ "c" ], [ "c++" ] ) == [ "_c.qmd", "_csharp.qmd" ]
+    assert found( languages, [ "node" ], [ "node.js" ] ) == [ "_plain.qmd" ]
+
+
+@pytest.mark.parametrize( "keyword, text, expected", [
+    ( "c++", "the c language", False ),
+    ( "c++", "templates in c++", True ),
+    ( "c#", "c and c++", False ),
+    ( "node.js", "a node and some js", False ),
+    ( "for loop", "loop for ever", False ),
+    ( "for loop", "a for loop", True ),
+    ( "loop", "looping", False ),
+] )
+def test_text_matches_agrees_with_the_index( tmp_path, keyword, text, expected ):
+    from tasl.index import text_matches
+
+    write_topic( tmp_path, "topic", text )
+    assert text_matches( text.lower(), keyword ) == expected
+    assert ( found( tmp_path, [ keyword ] ) == [ "_topic.qmd" ] ) == expected
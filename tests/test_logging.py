@@ -0,0 +1,52 @@
+from conftest import run_python
+
+ASYNC_CHECK = """
+import threading
+import tasl
+from tasl._main import cli
+cli.main( standalone_mode=False )
+writers = [ thread.name for thread in threading.enumerate() if thread.name.startswith("loguru-writer") ]
+print( "checked", tasl.log_async, bool( writers ) )
+"""
+
+
+def checked( result ):
+    out = result.stdout.split()
+    return out[ out.index("checked") + 1: ]
+
+
+def test_log_async_before_command_uses_async_sink( tmp_path ):
+    result = run_python( ASYNC_CHECK, "--log-async", "list", cwd=tmp_path )
+    assert result.returncode == 0, result.stderr
+    assert checked( result ) == [ "True", "True" ]
+
+
+def test_log_async_last_uses_async_sink( tmp_path ):
+    result = run_python( ASYNC_CHECK, "list", "--log-async", cwd=tmp_path )
+    assert checked( result ) == [ "True", "True" ]
+
+
+def test_without_log_async_logs_synchronously( tmp_path ):
+    result = run_python( ASYNC_CHECK, "list", cwd=tmp_path )
+    assert checked( result ) == [ "False", "False" ]
+
+
+def test_log_level_still_takes_a_value( tmp_path ):
+    result = run_python( "import tasl; from tasl._main import cli; cli.main( standalone_mode=False ); print( tasl.log_level )",
+                         "--log-level", "INFO", "list", cwd=tmp_path )
+    assert result.stdout.split()[-1] == "INFO"
+
+
+def test_import_leaves_loguru_sinks_alone( tmp_path ):
+    code = """
+import sys
+from loguru import logger
+logger.remove()
+sink = logger.add( sys.stdout, format="{message}" )
+import tasl
+from tasl import TopicLibrary
+logger.info( "still here" )
+"""
+    result = run_python( code, "--log-level", "ERROR", "--log-async", "list", cwd=tmp_path )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == [ "still", "here" ]
@@ -0,0 +1,47 @@
+import os
+import stat
+
+from tasl.output import write_file_if_changed, sync_file
+
+
+def test_unchanged_content_is_not_rewritten( tmp_path ):
+    path = tmp_path / "topic.qmd"
+    assert write_file_if_changed( str( path ), "# Loops\n" )
+    os.utime( path, ( 1_000_000, 1_000_000 ) )
+    assert not write_file_if_changed( str( path ), "# Loops\n" )
+    assert path.stat().st_mtime == 1_000_000
+
+    assert write_file_if_changed( str( path ), "# Loops\n\nmore\n" )
+    assert path.read_text() == "# Loops\n\nmore\n"
+    assert [ name for name in os.listdir( tmp_path ) if name.endswith(".tmp") ] == []
+
+
+def test_rewrite_keeps_file_mode( tmp_path ):
+    path = tmp_path / "topic.qmd"
+    path.write_text( "old" )
+    path.chmod( 0o640 )
+    write_file_if_changed( str( path ), "new" )
+    assert stat.S_IMODE( path.stat().st_mode ) == 0o640
+
+
+def test_sync_skips_up_to_date_assets( tmp_path ):
+    source = tmp_path / "picture.png"
+    destination = tmp_path / "copy.png"
+    source.write_bytes( b"png" )
+    assert sync_file( str( source ), str( destination ) ) == "copied"
+    assert sync_file( str( source ), str( destination ) ) == "skipped"
+
+    # same size and mtime but different bytes: only a checksum notices
+    destination.write_bytes( b"PNG" )
+    os.utime( destination, ( source.stat().st_atime, source.stat().st_mtime ) )
+    assert sync_file( str( source ), str( destination ) ) == "skipped"
+    assert sync_file( str( source ), str( destination ), checksum=True ) == "copied"
+    assert destination.read_bytes() == b"png"
+
+
+def test_sync_hardlinks_when_asked( tmp_path ):
+    source = tmp_path / "picture.png"
+    destination = tmp_path / "link.png"
+    source.write_bytes( b"png" )
+    assert sync_file( str( source ), str( destination ), link="hard" ) == "linked"
+    assert os.path.samefile( source, destination )
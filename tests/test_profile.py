@@ -0,0 +1,18 @@
+import pytest
+
+from conftest import run_python
+
+CLI = "from tasl._main import cli; cli()"
+
+
+@pytest.mark.parametrize( "args, saved", [
+    ( [ "--profile", "p.pstats", "--profile-top", "0", "list" ], "p.pstats" ),
+    ( [ "--profile=p.pstats", "--profile-top", "0", "list" ], "p.pstats" ),
+    ( [ "--profile", "--profile-top", "0", "list" ], "tasl.pstats" ),
+    ( [ "--profile-top", "0", "--profile", "list" ], "tasl.pstats" ),
+] )
+def test_profile_path_forms( tmp_path, args, saved ):
+    result = run_python( CLI, *args, cwd=tmp_path )
+    assert result.returncode == 0, result.stderr
+    assert ( tmp_path / saved ).is_file()
+    assert ( tmp_path / saved.replace( ".pstats", ".folded" ) ).is_file()
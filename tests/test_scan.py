@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from tasl import TopicLibrary, NotInGitRepositoryError
+
+from conftest import run_python, write_topic
+
+CLI = "from tasl._main import cli; cli()"
+
+
+def write_lecture( folder, name, *topics ):
+    """ write a lecture with one # section per (title, text) in topics """
+    sections = "".join( f"# {title}\n\n{text}\n\n" for title, text in topics )
+    path = folder / name
+    path.write_text( f"---\ntitle: {name}\n---\n\n{sections}" )
+    return path
+
+
+@pytest.fixture
+def course( tmp_path ):
+    ( tmp_path / "topics" ).mkdir()
+    return tmp_path
+
+
+def test_lecture_outside_git_raises_tasl_error( course ):
+    lecture = write_lecture( course, "lect-01.qmd", ( "Loops", "Going round." ) )
+    with pytest.raises( NotInGitRepositoryError ):
+        TopicLibrary( course / "topics" ).scan( str( lecture ) )
+
+
+def test_scanl_outside_git_reports_error_without_traceback( course ):
+    write_lecture( course, "lect-01.qmd", ( "Loops", "Going round." ) )
+    result = run_python( CLI, "scanl", "lect-01.qmd", "--confirm", "--destination", "topics", cwd=course )
+    assert result.returncode == 1
+    assert "not in a git repository" in result.stderr
+    assert "Traceback" not in result.stderr
+
+
+@pytest.fixture
+def repo( course ):
+    ( course / ".git" ).mkdir()
+    return course
+
+
+def test_repeated_topic_keeps_the_last_block( repo ):
+    lecture = write_lecture( repo, "lect-01.qmd", ( "Loops", "first body" ), ( "Arrays", "arrays" ), ( "Loops", "second body" ) )
+    result = TopicLibrary( repo / "topics" ).scan( str( lecture ) )
+    assert [ topic["name"] for topic in result["topics"] ] == [ "loops", "arrays" ]
+    body = ( repo / "topics" / "_loops.qmd" ).read_text()
+    assert "second body" in body and "first body" not in body
+
+
+def test_repeated_topic_leaves_existing_topic_alone( repo ):
+    write_topic( repo / "topics", "loops", "mine" )
+    lecture = write_lecture( repo, "lect-01.qmd", ( "Loops", "first body" ), ( "Loops", "second body" ) )
+    TopicLibrary( repo / "topics" ).scan( str( lecture ) )
+    assert "mine" in ( repo / "topics" / "_loops.qmd" ).read_text()
+
+
+def scanl( repo, *args ):
+    return run_python( CLI, "scanl", *args, "--destination", "topics", cwd=repo )
+
+
+def topic_files( repo ):
+    return sorted( path.name for path in ( repo / "topics" ).iterdir() )
+
+
+def test_lectures_sharing_a_topic_are_reported_before_writing( repo ):
+    write_lecture( repo, "lect-01.qmd", ( "Loops", "for" ), ( "Arrays", "arrays" ) )
+    write_lecture( repo, "lect-02.qmd", ( "loops!", "while" ) )
+
+    dry_run = scanl( repo, "lect-01.qmd", "lect-02.qmd" )
+    assert dry_run.returncode == 0, dry_run.stderr
+    assert "'Loops' in lect-01.qmd, 'loops!' in lect-02.qmd" in dry_run.stderr
+
+    confirmed = scanl( repo, "lect-01.qmd", "lect-02.qmd", "--confirm" )
+    assert confirmed.returncode == 1
+    assert "Nothing written" in confirmed.stderr
+    assert topic_files( repo ) == []
+
+
+def test_topics_already_in_destination_are_collisions_unless_from_the_same_lecture( repo ):
+    write_lecture( repo, "lect-01.qmd", ( "Loops", "for" ) )
+    write_lecture( repo, "lect-02.qmd", ( "Arrays", "arrays" ) )
+
+    first = scanl( repo, "lect-01.qmd", "lect-02.qmd", "--confirm" )
+    assert first.returncode == 0, first.stderr
+    assert topic_files( repo ) == [ "_arrays.qmd", "_loops.qmd", "arrays.qmd", "loops.qmd" ]
+
+    again = scanl( repo, "lect-01.qmd", "lect-02.qmd", "--confirm", "--overwrite" )
+    assert again.returncode == 0, again.stderr
+
+    write_topic( repo / "topics", "queues", "made by hand" )
+    write_lecture( repo, "lect-03.qmd", ( "Queues", "from a lecture" ) )
+    clash = scanl( repo, "lect-02.qmd", "lect-03.qmd", "--confirm", "--overwrite" )
+    assert clash.returncode == 1
+    assert os.path.join( "topics", "queues.qmd" ) in clash.stderr
+    assert "made by hand" in ( repo / "topics" / "_queues.qmd" ).read_text()
+
+
+LECTURE = """---
+title: Lecture 1
+---
+
+## Housekeeping
+
+- due dates
+
+# Loops
+
+{{< include '_arrays.qmd' >}}
+
+```python
+# not a topic
+## Housekeeping
+```
+
+## Housekeeping
+
+- dropped
+
+## Kept
+
+# Arrays
+![](assets/arrays.png)
+"""
+
+
+def test_blocks_stream_as_the_whole_file_was_split():
+    from tasl.utils import iter_topic_blocks
+    uses_topics = {}
+    blocks = list( iter_topic_blocks( LECTURE.splitlines( keepends=True ), uses_topics ) )
+    assert blocks == [
+        ( "prefix", [ "---\n", "title: Lecture 1\n", "---\n", "\n" ] ),
+        ( "Loops", [ "\n", "{{< include '_arrays.qmd' >}}\n", "\n", "```python\n", "# not a topic\n", "## Housekeeping\n", "```\n", "\n",
+                     "## Kept\n", "\n" ] ),
+        ( "Arrays", [ "![](assets/arrays.png)\n" ] ),
+    ]
+    assert list( uses_topics ) == [ "_arrays.qmd" ]
@@ -0,0 +1,64 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from tasl import serve
+
+pytestmark = pytest.mark.skipif( not hasattr( socket, "AF_UNIX" ), reason="needs Unix domain sockets" )
+
+
+@pytest.fixture
+def listening( tmp_path ):
+    """ a socket at tmp_path/tasl.sock answering every connection with exit 0 """
+    path = str( tmp_path / "tasl.sock" )
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    server.bind( path )
+    server.listen( 4 )
+
+    def answer():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv( 65536 )
+                serve.send_message( conn, dict( exit=0 ) )
+
+    threading.Thread( target=answer, daemon=True ).start()
+    yield path
+    server.close()
+
+
+def test_private_socket_is_used( listening, monkeypatch ):
+    os.chmod( listening, 0o600 )
+    monkeypatch.setenv( serve.SOCKET_ENV, listening )
+    monkeypatch.delenv( serve.NO_SERVER_ENV, raising=False )
+    assert serve.is_own_socket( listening )
+    assert serve.forward_to_server( [ "list" ], "SUCCESS" ) == 0
+
+
+def test_socket_others_can_open_is_not_used( listening, monkeypatch ):
+    os.chmod( listening, 0o666 )
+    monkeypatch.setenv( serve.SOCKET_ENV, listening )
+    monkeypatch.delenv( serve.NO_SERVER_ENV, raising=False )
+    assert not serve.is_own_socket( listening )
+    assert serve.connect( listening ) is None
+    assert serve.forward_to_server( [ "list" ], "SUCCESS" ) is None
+
+
+def test_plain_file_is_not_a_server( tmp_path ):
+    path = tmp_path / "tasl.sock"
+    path.write_text( "" )
+    os.chmod( path, 0o600 )
+    assert not serve.is_own_socket( str( path ) )
+
+
+@pytest.mark.skipif( not hasattr( os, "geteuid" ) or os.geteuid() != 0, reason="needs root to give the socket away" )
+def test_socket_of_another_user_is_not_used( listening ):
+    os.chmod( listening, 0o600 )
+    os.chown( listening, 65534, -1 )
+    assert not serve.is_own_socket( listening )
+    assert serve.connect( listening ) is None
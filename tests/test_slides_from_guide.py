@@ -0,0 +1,25 @@
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif( sys.version_info < (3, 12), reason="slides_from_guide uses PEP 701 f-strings" )
+
+
+def convert( markdown ):
+    from tasl.slides_from_guide import convert_headers_outside_containers
+    return convert_headers_outside_containers( markdown )
+
+
+@pytest.mark.parametrize( "markdown, expected", [
+    ( "### a\n::: {.x}\n### b\n:::\n### c", "## a\n::: {.x}\n### b\n:::\n## c" ),
+    ( ":::: {.columns}\n::: {.column}\n### a\n:::\n### b\n::::\n### c",
+      ":::: {.columns}\n::: {.column}\n### a\n:::\n### b\n::::\n## c" ),
+    ( "::: {.x}\n### a\n:::\n:::\n### b", "::: {.x}\n### a\n:::\n:::\n## b" ),
+    ( "::: {.x}\n### a", "::: {.x}\n## a" ),
+    ( "```\n::: {.x}\n```\n### after", "```\n::: {.x}\n```\n## after" ),
+    ( "~~~~ python\n:::\n```\n::: {.x}\n~~~~\n### after", "~~~~ python\n:::\n```\n::: {.x}\n~~~~\n## after" ),
+    ( "::: {.x}\n```\n:::\n```\n### a\n:::\n### b", "::: {.x}\n```\n:::\n```\n### a\n:::\n## b" ),
+    ( "```md\n### code\n```", "```md\n### code\n```" ),
+] )
+def test_convert_headers_outside_containers( markdown, expected ):
+    assert convert( markdown ) == expected
@@ -0,0 +1,43 @@
+import yaml
+
+from tasl.utils import find_yaml_key_block, update_yaml_header_lines, change_tag_lines
+
+WRAPPER = """---
+title: "Loops"
+tasl:
+  topic: Loops
+  tags: []
+# trailing comment
+format: revealjs
+---
+
+{{< include '_loops.qmd' >}}
+""".splitlines( keepends=True )
+
+
+def test_key_block_stops_before_trailing_comment():
+    header = WRAPPER[1:-3]
+    start, end = find_yaml_key_block( header, "tasl" )
+    assert header[start:end] == [ "tasl:\n", "  topic: Loops\n", "  tags: []\n" ]
+
+
+def test_key_block_keeps_comments_between_values():
+    header = [ "tasl:\n", "  topic: Loops\n", "  # kept with the block\n", "  tags:\n", "    - a\n", "\n", "# after\n" ]
+    assert find_yaml_key_block( header, "tasl" ) == ( 0, 5 )
+
+
+def test_tag_change_keeps_trailing_comment():
+    lines, changed, tags = change_tag_lines( WRAPPER, add_tags=[ "week-3" ] )
+    assert changed and tags == [ "week-3" ]
+    assert "# trailing comment\n" in lines
+    assert "format: revealjs\n" in lines
+    header = yaml.safe_load( "".join( lines[1:lines.index( "---\n", 1 )] ) )
+    assert header["tasl"]["tags"] == [ "week-3" ]
+
+
+def test_tasl_update_keeps_trailing_comment():
+    lines = update_yaml_header_lines( WRAPPER, tasl=dict( topic="Loops", source="lect-01.qmd", tags=[ "lecture" ] ) )
+    assert "# trailing comment\n" in lines
+    header = yaml.safe_load( "".join( lines[1:lines.index( "---\n", 1 )] ) )
+    assert header["tasl"]["source"] == "lect-01.qmd"
+    assert header["format"] == "revealjs"